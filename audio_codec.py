@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Storage and transfer formats of recordings"""
+
+import io, os, struct, threading
+
+import numpy as np
+
+from startup import lazy_import
+
+sf = lazy_import('soundfile')
+
+# name: (soundfile format, subtype, sample rate or None to keep it, extension, content type)
+CODECS = {
+    'wav':       ('WAV',  'PCM_24', None,  '.wav',  'audio/wav'),
+    'flac':      ('FLAC', 'PCM_24', None,  '.flac', 'audio/flac'),
+    'flac16':    ('FLAC', 'PCM_16', None,  '.flac', 'audio/flac'),
+    'flac16k':   ('FLAC', 'PCM_16', 16000, '.flac', 'audio/flac'),
+    'opus16k':   ('OGG',  'OPUS',   16000, '.ogg',  'audio/ogg'),
+}
+
+CONTENT_TYPES = {extension: content_type for _, _, _, extension, content_type in CODECS.values()}
+
+
+def content_type(path):
+    """Content type of a recording file from its extension"""
+    return CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+class AudioCodec():
+    """One entry of CODECS: encodes float audio to a file or to bytes
+
+    "wav" is the original PCM_24 WAV, "flac" the same samples losslessly compressed (about half
+    the size). "flac16" drops to 16 bits, the resolution the microphone delivers. The 16k variants
+    are for the server model, which works on 16 kHz audio: they are resampled with the same
+    PolyphaseResampler as the on-device model path before encoding, "opus16k" is lossy.
+
+    Encoding runs on whichever thread calls it, recordings are encoded by the recording and
+    analysis worker pools, never on the capture thread."""
+
+    def __init__(self, name='flac'):
+        if name not in CODECS:
+            raise ValueError(f"Unknown codec: {name}, expected one of {', '.join(CODECS)}")
+        self.name = name
+        self.format, self.subtype, self.rate, self.extension, self.content_type = CODECS[name]
+        self._resamplers = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, audio, fs):
+        """(audio, rate) as they will be encoded"""
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.rate is None or self.rate == fs:
+            return audio, fs
+        from utils import PolyphaseResampler
+        with self._lock:
+            resampler = self._resamplers.get(fs)
+            if resampler is None:
+                resampler = self._resamplers[fs] = PolyphaseResampler(fs, self.rate)
+            return resampler.resample(audio), self.rate
+
+    def write(self, target, audio, fs):
+        """Encode audio into target (a path or a file object)"""
+        audio, rate = self.prepare(audio, fs)
+        sf.write(target, audio, rate, subtype=self.subtype, format=self.format)
+
+    def encode(self, audio, fs):
+        """Encoded file as bytes"""
+        buffer = io.BytesIO()
+        self.write(buffer, audio, fs)
+        return buffer.getvalue()
+
+    def stream(self, audio, fs, block_size=16384):
+        """EncodedStream of audio, encoded while it is read"""
+        return EncodedStream(self, audio, fs, block_size=block_size)
+
+
+class _StreamSink():
+    """Write-only file object for libsndfile that hands out new bytes instead of keeping them
+
+    libsndfile seeks back on close to rewrite header fields it only knows at the end (WAV sizes,
+    FLAC STREAMINFO). Those bytes were already handed out, so rewrites are dropped and counted;
+    EncodedStream fills in the fields that matter up front."""
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.size = 0
+        self.pos = 0
+        self.dropped = 0
+
+    def write(self, data):
+        data = bytes(data)
+        if self.pos == self.size:
+            self.pending += data
+            self.size += len(data)
+        else:
+            self.dropped += len(data)
+        self.pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.pos = offset if whence == io.SEEK_SET else (self.pos + offset if whence == io.SEEK_CUR else self.size + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        return b''
+
+    def take(self):
+        data, self.pending = self.pending, bytearray()
+        return data
+
+
+class EncodedStream():
+    """The file codec.encode(audio, fs) would produce, encoded block by block while it is iterated
+
+    Only one block of audio and its encoded bytes are held at a time, nothing is encoded before
+    the first chunk is asked for. Resampled codecs use a streaming PolyphaseResampler. The header
+    fields that libsndfile only writes when it closes the file are filled in from the known
+    number of samples as the header goes out: RIFF and data sizes of WAV, the total samples of the
+    FLAC STREAMINFO (its MD5 and frame sizes stay 0, "unknown").
+
+    *length: bytes in total when known up front (WAV), None otherwise (FLAC, Ogg)
+    *progress: fraction of the audio encoded so far"""
+
+    HEADER_BYTES = 4096
+
+    def __init__(self, codec, audio, fs, block_size=16384):
+        self.codec = codec
+        self.audio = np.asarray(audio, dtype=np.float32)
+        self.fs = fs
+        self.block_size = block_size
+        self.rate = codec.rate or fs
+        if self.rate == fs:
+            self.frames = len(self.audio)
+        else:
+            from utils import PolyphaseResampler
+            resampler = PolyphaseResampler(fs, self.rate)
+            self.frames = -(-len(self.audio) * resampler.up // resampler.down)
+        self.length = None
+        if codec.format == 'WAV':
+            buffer = io.BytesIO()
+            sf.write(buffer, np.zeros(0, dtype=np.float32), self.rate, subtype=codec.subtype, format=codec.format)
+            self._header_length = len(buffer.getvalue())
+            self._data_length = self.frames * {'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4, 'FLOAT': 4}[codec.subtype]
+            self.length = self._header_length + self._data_length + (self._data_length & 1)
+        self.progress = 0.0
+        self.bytes_out = 0
+        self.dropped = 0
+
+    def __iter__(self):
+        sink = _StreamSink()
+        resampler = None
+        if self.rate != self.fs:
+            from utils import PolyphaseResampler
+            resampler = PolyphaseResampler(self.fs, self.rate)
+        head = None
+        with sf.SoundFile(sink, 'w', samplerate=self.rate, channels=1, format=self.codec.format, subtype=self.codec.subtype) as f:
+            for start in range(0, len(self.audio), self.block_size):
+                block = self.audio[start:start + self.block_size]
+                f.write(resampler.process(block) if resampler else block)
+                self.progress = min(start + self.block_size, len(self.audio)) / len(self.audio)
+                if head is None:
+                    if sink.size < self.HEADER_BYTES:
+                        continue
+                    head = self._patch_header(sink.take())
+                    yield from self._out(head)
+                else:
+                    yield from self._out(sink.take())
+            if resampler:
+                f.write(resampler.flush())
+        self.progress = 1.0
+        self.dropped = sink.dropped
+        rest = sink.take()
+        yield from self._out(self._patch_header(rest) if head is None else rest)
+
+    def _out(self, data):
+        if data:
+            self.bytes_out += len(data)
+            yield bytes(data)
+
+    def _patch_header(self, data):
+        if self.codec.format == 'WAV' and data[:4] == b'RIFF':
+            data[4:8] = struct.pack('<I', self.length - 8)
+            tag = data.find(b'data', 12)
+            data[tag + 4:tag + 8] = struct.pack('<I', self._data_length)
+        elif self.codec.format == 'FLAC' and data[:4] == b'fLaC' and len(data) >= 26:
+            # STREAMINFO starts at byte 8, the 36 bit total sample count at bit 4 of byte 21
+            data[21] = (data[21] & 0xF0) | ((self.frames >> 32) & 0x0F)
+            data[22:26] = struct.pack('>I', self.frames & 0xFFFFFFFF)
+        return data
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Capture pipeline: one thread that only reads PCM periods, consumer stages that do the rest"""
+
+import time, logging, threading
+from collections import deque
+from threading import Thread
+
+
+class PeriodQueue():
+    """Bounded queue of periods between two pipeline stages
+
+    put() never blocks: when the queue is full the oldest period is dropped and counted, so a slow
+    consumer can never stall the producer. The deque append/popleft are atomic, the condition is
+    only used to wake up a waiting consumer."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = deque(maxlen=maxsize)
+        self._ready = threading.Condition(threading.Lock())
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        if len(self._items) == self.maxsize:
+            self.dropped += 1
+        self._items.append(item)
+        self.put_count += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        with self._ready:
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Oldest period, or None if nothing arrived within timeout"""
+        try:
+            return self._items.popleft()
+        except IndexError:
+            pass
+        with self._ready:
+            self._ready.wait_for(lambda: len(self._items) > 0, timeout=timeout)
+        try:
+            return self._items.popleft()
+        except IndexError:
+            return None
+
+    def clear(self):
+        self._items.clear()
+
+
+class Stage():
+    """Consumer thread that feeds every period of its queue to handler
+
+    The handler time of the last latency_window periods is kept in `latencies` (seconds)."""
+
+    def __init__(self, name, handler, maxsize=32, latency_window=4096):
+        self.name = name
+        self.handler = handler
+        self.queue = PeriodQueue(maxsize)
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.latencies = deque(maxlen=latency_window)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while self._running:
+            item = self.queue.get(timeout=0.2)
+            if item is None:
+                continue
+            start = time.perf_counter()
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"[ERROR] Pipeline stage {self.name}: {e}")
+            elapsed = time.perf_counter() - start
+            self.busy_time += elapsed
+            self.latencies.append(elapsed)
+            self.processed += 1
+
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'dropped': self.queue.dropped,
+            'depth': len(self.queue),
+            'max_depth': self.queue.max_depth,
+            'errors': self.errors,
+            'busy_time': round(self.busy_time, 3),
+        }
+
+
+class CapturePipeline():
+    """Producer/consumer audio pipeline
+
+    The capture thread calls read_period() in a loop and only pushes the raw (length, data) into
+    the capture queue, so its latency no longer depends on downstream work. A dispatch thread
+    converts each period once with convert(length, data) and hands the result to every stage added
+    with add_stage(), each running on its own thread behind its own bounded queue.
+
+    Inputs:
+    *read_period (callable): returns (length, data) like alsaaudio.PCM.read(), a negative length counts as an overrun
+    *convert (callable): turns (length, data) into the item passed to the stages, or None to skip the period
+    *maxsize (int): capacity of the capture queue in periods
+    *stats_interval (float): seconds between pipeline statistics log lines, 0 to disable
+    *latency_window (int): handler times kept per stage, None keeps all of them"""
+
+    def __init__(self, read_period, convert, maxsize=64, stats_interval=60.0, latency_window=4096):
+        self.read_period = read_period
+        self.convert = convert
+        self.stats_interval = stats_interval
+        self.latency_window = latency_window
+        self.stages = []
+        self.capture = Stage("dispatch", self._dispatch, maxsize=maxsize, latency_window=latency_window)
+        self.periods = 0
+        self.overruns = 0
+        self.read_errors = 0
+        self.stale = 0
+        self.generation = 0
+        self._running = False
+        self._capture_thread = None
+        self._last_stats = time.time()
+
+    def add_stage(self, name, handler, maxsize=32):
+        stage = Stage(name, handler, maxsize=maxsize, latency_window=self.latency_window)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        self._running = True
+        for stage in self.stages:
+            stage.start()
+        self.capture.start()
+        self._capture_thread = Thread(target=self._capture_loop, name="capture", daemon=True)
+        self._capture_thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._capture_thread:
+            self._capture_thread.join(1.0)
+        self.capture.stop()
+        for stage in self.stages:
+            stage.stop()
+
+    def _capture_loop(self):
+        while self._running:
+            try:
+                length, data = self.read_period()
+            except Exception as e:
+                self.read_errors += 1
+                logging.error(f"[ERROR] Capture read failed: {e}")
+                time.sleep(0.1)
+                continue
+            if length > 0:
+                self.periods += 1
+                self.capture.queue.put((self.generation, length, data))
+            elif length < 0:
+                self.overruns += 1
+
+    def flush(self):
+        """Discard every queued period, e.g. after capture was suspended and resumed
+
+        Periods read before the call that are still being converted are dropped by generation."""
+        self.generation += 1
+        for queue in [self.capture.queue] + [stage.queue for stage in self.stages]:
+            self.stale += len(queue)
+            queue.clear()
+
+    def _dispatch(self, period):
+        generation, length, data = period
+        if generation != self.generation:
+            self.stale += 1
+            return
+        item = self.convert(length, data)
+        if item is not None and generation == self.generation:
+            for stage in self.stages:
+                stage.queue.put(item)
+
+        if self.stats_interval and time.time() - self._last_stats > self.stats_interval:
+            self._last_stats = time.time()
+            logging.info(f"[INFO] Capture pipeline: {self.stats()}")
+
+    def stats(self):
+        stats = {'periods': self.periods, 'overruns': self.overruns, 'read_errors': self.read_errors, 'stale': self.stale,
+                 'capture': self.capture.stats()}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats()
+        return stats
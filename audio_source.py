@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Audio sources delivering interleaved S16_LE periods like alsaaudio.PCM.read()"""
+
+import os, time, struct, logging, threading
+
+import numpy as np
+
+
+def synthetic_cough_signal(rng, duration=4.0, fs=44100, n_coughs=None, noise=0.005):
+    """Background noise with a few decaying noise bursts, roughly shaped like coughs"""
+    n = int(duration * fs)
+    x = rng.normal(0, noise, n).astype(np.float32)
+    if n_coughs is None:
+        n_coughs = rng.integers(0, 5)
+    for _ in range(n_coughs):
+        length = int(rng.uniform(0.05, 0.6) * fs)
+        start = rng.integers(0, max(1, n - length))
+        env = np.exp(-np.linspace(0, rng.uniform(2, 8), length)).astype(np.float32)
+        burst = rng.normal(0, rng.uniform(0.05, 0.8), length).astype(np.float32) * env
+        x[start:start + length] += burst[:n - start]
+    return x
+
+
+class AudioSource():
+    """Base class: read() returns (frames, data) with data an int16 interleaved buffer
+
+    A length of 0 means no data right now, a negative length an overrun (as alsaaudio reports it).
+    Finite sources set `exhausted` once everything was delivered. The data of every read() stays
+    valid after the next one, the capture pipeline queues it before converting.
+
+    With realtime=True reads are paced to the sample rate, otherwise they return as fast as
+    possible (for throughput tests on recorded audio).
+
+    suspend()/resume() stop and restart delivery, after resume() reads continue with fresh audio
+    instead of whatever accumulated in between."""
+
+    def __init__(self, rate, channels, period_size, realtime=False):
+        self.rate = rate
+        self.channels = channels
+        self.period_size = period_size
+        self.realtime = realtime
+        self.exhausted = False
+        self.frames_read = 0
+        self._start = None
+        self._start_frames = 0
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        # Restart the pacing clock, a paced source would otherwise catch up on the suspended time
+        self._start = None
+
+    def _pace(self):
+        if not self.realtime:
+            return
+        if self._start is None:
+            self._start = time.perf_counter()
+            self._start_frames = self.frames_read
+        delay = self._start + (self.frames_read - self._start_frames) / self.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AlsaSource(AudioSource):
+    """ALSA capture, blocking reads of one period (already real-time)
+
+    suspend() closes the PCM and resume() opens it again: the device stops capturing in between
+    (no overruns piling up) and the first period after resume() is fresh audio."""
+
+    def __init__(self, device, rate=44100, channels=2, period_size=1024):
+        super(AlsaSource, self).__init__(rate, channels, period_size, realtime=False)
+        self.device = device
+        self.pcm = None
+        self._open()
+
+    def _open(self):
+        import alsaaudio as alsa
+        self.pcm = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL,
+                            channels=self.channels, rate=self.rate, format=alsa.PCM_FORMAT_S16_LE,
+                            periodsize=self.period_size, device=self.device)
+
+    def read(self):
+        length, data = self.pcm.read()
+        if length > 0:
+            self.frames_read += length
+        return length, data
+
+    def close(self):
+        if self.pcm is not None:
+            self.pcm.close()
+            self.pcm = None
+
+    def suspend(self):
+        self.close()
+
+    def resume(self):
+        if self.pcm is None:
+            self._open()
+
+
+def wav_pcm16_layout(path):
+    """(data offset, frames, channels, rate) of a plain PCM 16-bit WAV file, None for anything else"""
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = header[:4], struct.unpack('<I', header[4:])[0]
+            if chunk_id == b'fmt ':
+                body = f.read(size)
+                audio_format, channels, rate = struct.unpack('<HHI', body[:8])
+                bits = struct.unpack('<H', body[14:16])[0]
+                fmt = (audio_format, channels, rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None or fmt[0] != 1 or fmt[3] != 16:
+                    return None
+                return f.tell(), size // (2 * fmt[1]), fmt[1], fmt[2]
+            else:
+                f.seek(size, os.SEEK_CUR)
+            if size % 2:
+                f.seek(1, os.SEEK_CUR)
+
+
+class FileSource(AudioSource):
+    """Audio file played back in periods
+
+    PCM 16-bit WAV files are memory-mapped and every period is a view into the mapping, so reads
+    neither copy nor decode. Other formats (FLAC, 24-bit WAV, ...) are decoded by soundfile into a
+    new int16 array per period. If channels differs from the file, the first channel is repeated
+    (or the extra channels dropped) to match, which costs one copy per period."""
+
+    def __init__(self, path, period_size=1024, channels=None, realtime=False, loop=False):
+        self.path = path
+        self.loop = loop
+        self._mmap = None
+        self._file = None
+        layout = wav_pcm16_layout(path)
+        if layout is not None:
+            offset, frames, file_channels, rate = layout
+            self._mmap = np.memmap(path, dtype=np.int16, mode='r', offset=offset, shape=(frames, file_channels))
+        else:
+            import soundfile as sf
+            self._file = sf.SoundFile(path)
+            file_channels, rate = self._file.channels, self._file.samplerate
+        self.file_channels = file_channels
+        super(FileSource, self).__init__(rate, channels or file_channels, period_size, realtime)
+        self._pos = 0
+
+    def read(self):
+        if self.exhausted:
+            return 0, None
+        self._pace()
+        if self._mmap is not None:
+            block = self._mmap[self._pos:self._pos + self.period_size]
+        else:
+            block = self._file.read(self.period_size, dtype='int16', always_2d=True)
+        if len(block) == 0:
+            if self.loop and self._pos > 0:
+                self._rewind()
+                return self.read()
+            self.exhausted = True
+            return 0, None
+
+        self._pos += len(block)
+        self.frames_read += len(block)
+        if self.channels != self.file_channels:
+            if self.channels > self.file_channels:
+                block = np.repeat(block[:, :1], self.channels, axis=1)
+            else:
+                block = np.ascontiguousarray(block[:, :self.channels])
+        return len(block), block
+
+    def _rewind(self):
+        self._pos = 0
+        if self._file is not None:
+            self._file.seek(0)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._mmap = None
+
+
+class SyntheticSource(AudioSource):
+    """Noise with cough-like bursts, generated block by block
+
+    *duration (float): seconds to deliver, None for an endless source
+    *coughs_per_block (int): upper bound of bursts in every block_duration seconds"""
+
+    def __init__(self, rate=44100, channels=2, period_size=1024, realtime=False, duration=None,
+                 seed=0, block_duration=4.0, coughs_per_block=2, noise=0.005):
+        super(SyntheticSource, self).__init__(rate, channels, period_size, realtime)
+        self.rng = np.random.default_rng(seed)
+        self.total_frames = None if duration is None else int(duration * rate)
+        self.block_duration = block_duration
+        self.coughs_per_block = coughs_per_block
+        self.noise = noise
+        self._block = np.zeros((0, channels), dtype=np.int16)
+        self._pos = 0
+
+    def _next_block(self):
+        x = synthetic_cough_signal(self.rng, duration=self.block_duration, fs=self.rate,
+                                   n_coughs=self.rng.integers(0, self.coughs_per_block + 1), noise=self.noise)
+        pcm = (np.clip(x, -1.0, 1.0) * 32767).astype(np.int16)
+        self._block = np.repeat(pcm[:, None], self.channels, axis=1)
+        self._pos = 0
+
+    def read(self):
+        remaining = self.period_size
+        if self.total_frames is not None:
+            remaining = min(remaining, self.total_frames - self.frames_read)
+            if remaining <= 0:
+                self.exhausted = True
+                return 0, None
+        self._pace()
+        if self._pos + remaining > len(self._block):
+            # Periods never straddle blocks, carry the tail over into the next one
+            tail = self._block[self._pos:]
+            self._next_block()
+            self._block = np.concatenate([tail, self._block])
+        period = self._block[self._pos:self._pos + remaining]
+        self._pos += remaining
+        self.frames_read += remaining
+        return remaining, period
+
+
+class CaptureLifecycle():
+    """Runs a source only while something needs its audio
+
+    set_active() may be called from any thread (e.g. on a page change). The capture thread calls
+    read() in place of source.read(): while inactive it suspends the source once and then blocks
+    on an event instead of sleep-polling, returning (0, None) every `timeout` seconds so the
+    caller can check for shutdown. On the next read() after reactivation the source is resumed.
+
+    on_transition(active) is called on the capture thread right after the source was suspended
+    or resumed, e.g. to throw away periods that are still queued downstream."""
+
+    def __init__(self, source, active=True, on_transition=None, timeout=0.5):
+        self.source = source
+        self.on_transition = on_transition
+        self.timeout = timeout
+        self._active = threading.Event()
+        if active:
+            self._active.set()
+        self.suspended = False
+        self.suspends = 0
+
+    @property
+    def active(self):
+        return self._active.is_set()
+
+    def set_active(self, active):
+        if active:
+            self._active.set()
+        else:
+            self._active.clear()
+
+    def read(self):
+        if not self._active.is_set():
+            if not self.suspended:
+                self._transition(False)
+            self._active.wait(self.timeout)
+            return 0, None
+        if self.suspended:
+            self._transition(True)
+        return self.source.read()
+
+    def _transition(self, active):
+        if active:
+            self.source.resume()
+        else:
+            self.source.suspend()
+            self.suspends += 1
+        self.suspended = not active
+        logging.info(f"[INFO] Audio capture {'resumed' if active else 'suspended'}")
+        if self.on_transition:
+            self.on_transition(active)
+
+
+def create_source(spec, device=None, rate=44100, channels=2, period_size=1024):
+    """AudioSource from a config string: "alsa", "file:<path>" or "synthetic"
+
+    File and synthetic sources used in place of the microphone are paced in real time, files loop."""
+    spec = spec or 'alsa'
+    if spec == 'alsa':
+        return AlsaSource(device, rate=rate, channels=channels, period_size=period_size)
+    if spec.startswith('file:'):
+        source = FileSource(spec[5:], period_size=period_size, channels=channels, realtime=True, loop=True)
+        if source.rate != rate:
+            logging.warning(f"[WARNING] {source.path} is {source.rate} Hz, expected {rate} Hz")
+        return source
+    if spec == 'synthetic':
+        return SyntheticSource(rate=rate, channels=channels, period_size=period_size, realtime=True)
+    raise ValueError(f"Unknown audio source: {spec}")
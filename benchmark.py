@@ -0,0 +1,995 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Off-device checks and micro-benchmarks for the cough pipeline.
+
+Usage:
+    python benchmark.py segment [--seed S]
+    python benchmark.py stream [--duration SECONDS] [--seed S]
+    python benchmark.py decimate [--periods N]
+    python benchmark.py convert [--periods N]
+    python benchmark.py replay [FILE ...] [--synthetic SECONDS] [--mode stream|window] [--realtime] [--out DIR]
+    python benchmark.py render [--frames N] [--renderer canvas|matplotlib]   (needs a display)
+    python benchmark.py classify [--duration SECONDS] [--model MODEL.onnx] [--threads N] [--batch N ...]
+    python benchmark.py melcache [--duration SECONDS] [--chunk SECONDS]
+    python benchmark.py resample [--duration SECONDS]
+    python benchmark.py intervals [--seed S]
+    python benchmark.py queue [--items N]
+    python benchmark.py codec [FILE ...] [--duration SECONDS] [--link-kbps KBPS]
+    python benchmark.py predict-upload [--duration SECONDS] [--codec NAME ...]
+    python benchmark.py upload [--items N] [--size-kb KB] [--workers N] [--batch N] [--latency SECONDS] [--fail-rate P]
+"""
+
+import argparse, time, os, json, shutil, tempfile, resource, tracemalloc
+from collections import deque
+
+import numpy as np
+
+from utils import segment_cough, pcm_to_mono, PcmConverter, StreamingSegmenter, RingBuffer, WaveformDecimator, PolyphaseResampler
+from audio_pipeline import CapturePipeline
+from workers import AnalysisExecutor
+from recording_index import RecordingIndex
+from upload_queue import UploadQueue
+from uploader import Uploader, MultipartBody
+from audio_codec import AudioCodec, CODECS
+from config_cache import autocough_params
+from audio_source import synthetic_cough_signal, FileSource, SyntheticSource
+from tests.test_segment_cough import segment_cough_loop
+from tests.test_detection_intervals import detection_segments_reference
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+PERIOD_SIZE = 1024
+WINDOW_DURATION = 4
+STEP_DURATION = 3.7
+AUDIO_POINT_START = round(0.3 * SAMPLE_RATE)
+ADAPTIVE_METHODS = ['percentile', 'statistics', 'combination', 'default']
+
+
+def time_call(fn, *args, repeat=5, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_segment(args):
+    """Per-sample reference loop against the vectorized segment_cough, equivalence is checked by tests/test_segment_cough.py"""
+    rng = np.random.default_rng(args.seed)
+    x = synthetic_cough_signal(rng, duration=3.7, n_coughs=3)
+    for method in ADAPTIVE_METHODS:
+        ref = time_call(segment_cough_loop, x, SAMPLE_RATE, adaptive_method=method, repeat=3)
+        new = time_call(segment_cough, x, SAMPLE_RATE, adaptive_method=method)
+        print(f"{method:>12}: loop {ref * 1e3:8.2f} ms | vectorized {new * 1e3:6.2f} ms | x{ref / new:.1f}")
+
+
+def bench_stream(args):
+    """Windowed re-scan (4 s every 3.7 s) against the streaming segmenter on the same audio"""
+    rng = np.random.default_rng(args.seed)
+    n_windows = max(1, int(args.duration / WINDOW_DURATION))
+    x = np.concatenate([synthetic_cough_signal(rng, duration=WINDOW_DURATION, n_coughs=2) for _ in range(n_windows)])
+    window = int(WINDOW_DURATION * SAMPLE_RATE)
+    step = int(STEP_DURATION * SAMPLE_RATE)
+
+    for method in ADAPTIVE_METHODS:
+        start = time.perf_counter()
+        windowed = 0
+        for s in range(0, len(x) - window + 1, step):
+            windowed += len(segment_cough(x[s:s + window], SAMPLE_RATE, adaptive_method=method)[0])
+        t_windowed = time.perf_counter() - start
+
+        segmenter = StreamingSegmenter(SAMPLE_RATE, adaptive_method=method, stats_duration=WINDOW_DURATION,
+                                       threshold_interval=STEP_DURATION)
+        start = time.perf_counter()
+        streamed = 0
+        for s in range(0, len(x), PERIOD_SIZE):
+            streamed += len(segmenter.process(x[s:s + PERIOD_SIZE]))
+        t_stream = time.perf_counter() - start
+
+        print(f"{method:>12}: windowed {t_windowed * 1e3:8.1f} ms ({windowed} coughs) | "
+              f"streaming {t_stream * 1e3:8.1f} ms ({streamed} coughs) for {len(x) / SAMPLE_RATE:.0f} s of audio")
+
+
+def bench_decimate(args):
+    """Per-sample display downsampling loop against WaveformDecimator, per 1024-frame period"""
+    rng = np.random.default_rng(0)
+    periods = [rng.normal(0, 0.1, PERIOD_SIZE).astype(np.float32) for _ in range(args.periods)]
+    ratio, length = int(2.0 * SAMPLE_RATE) // 200, 200
+
+    Y_buffer = deque([0.0] * length, maxlen=length)
+    accumulator, counter = 0.0, 0
+    start = time.perf_counter()
+    for mono in periods:
+        for sample in mono:
+            accumulator += sample
+            counter += 1
+            if counter >= ratio:
+                Y_buffer.append(accumulator / counter)
+                accumulator, counter = 0.0, 0
+    t_loop = time.perf_counter() - start
+
+    results = {}
+    for mode in ('mean', 'envelope'):
+        decimator = WaveformDecimator(ratio, length, mode=mode)
+        start = time.perf_counter()
+        for mono in periods:
+            decimator.process(mono)
+        results[mode] = time.perf_counter() - start
+
+    n = len(periods)
+    print(f"loop {t_loop / n * 1e6:8.1f} us/period | mean {results['mean'] / n * 1e6:6.1f} us/period | "
+          f"envelope {results['envelope'] / n * 1e6:6.1f} us/period")
+
+
+def bench_convert(args):
+    """pcm_to_mono plus np.all(mono == 0) against PcmConverter: time and heap allocations per period"""
+    rng = np.random.default_rng(0)
+    periods = [rng.integers(-3000, 3000, (PERIOD_SIZE, CHANNELS)).astype(np.int16).tobytes() for _ in range(64)]
+    converter = PcmConverter(CHANNELS, PERIOD_SIZE, pool_size=4)
+    single = PcmConverter(CHANNELS, PERIOD_SIZE, channel=0, pool_size=4)
+
+    def reference(data):
+        mono = pcm_to_mono(data, CHANNELS)
+        return np.all(mono == 0)
+
+    for name, fn in [("frombuffer/mean/astype", reference),
+                     ("PcmConverter", converter.convert),
+                     ("PcmConverter channel=0", single.convert)]:
+        for data in periods:
+            fn(data)
+        start = time.perf_counter()
+        for i in range(args.periods):
+            fn(periods[i % len(periods)])
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        fn(periods[0])
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i in range(args.periods):
+            fn(periods[i % len(periods)])
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>24}: {elapsed / args.periods * 1e6:6.1f} us/period | "
+              f"peak {peak - baseline:7d} B above baseline | growth {current - baseline:6d} B after {args.periods} periods")
+
+
+def bench_render(args):
+    """Frame time of the analyzer waveform/status display, Tk canvas against matplotlib
+
+    Every frame gets new waveform points (as while listening) and every tenth frame a new status
+    colour, the same view sizes as the analyzer page."""
+    import tkinter as tk
+    from waveform_view import create_waveform_view
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"render needs a display: {e}")
+        return
+    root.geometry("480x320")
+    rng = np.random.default_rng(0)
+    length = 200
+    decimator = WaveformDecimator(int(2.0 * SAMPLE_RATE) // length, length)
+    periods = [rng.normal(0, 0.05, PERIOD_SIZE).astype(np.float32) for _ in range(64)]
+    colors = ['blue', 'yellow', 'green', 'red']
+
+    for renderer in args.renderer:
+        frame = tk.Frame(root)
+        frame.pack(fill=tk.BOTH, expand=True)
+        view = create_waveform_view(renderer, frame, decimator.values, length, report_interval=0)
+        root.update()
+        for i in range(args.frames):
+            for mono in periods[i % 8 * 8:(i % 8 + 1) * 8]:
+                decimator.process(mono)
+            if i % 10 == 0:
+                view.set_status(colors[i // 10 % len(colors)])
+            view.draw()
+        s = view.timer.stats()
+        print(f"{renderer:>10}: mean {s['mean_ms']:7.2f} | p50 {s['p50_ms']:7.2f} | p95 {s['p95_ms']:7.2f} | "
+              f"max {s['max_ms']:7.2f} ms per frame ({s['frames']} frames)")
+        frame.destroy()
+    root.destroy()
+
+
+def pre_process_audio_mel_reference(audio, sr=16000):
+    """Original per-window model input: librosa mel spectrogram, dB, min-max, scipy zoom to 64x64"""
+    import librosa
+    from scipy.ndimage import zoom
+    S = librosa.feature.melspectrogram(
+        y=audio, sr=sr, n_fft=1024, hop_length=512,
+        fmin=50, fmax=2000, n_mels=64, power=2.0
+    )
+    S_db = librosa.power_to_db(S, ref=np.max)
+    S_db = (S_db - S_db.min()) / (S_db.max() - S_db.min() + 1e-8)
+    resized = zoom(S_db, (64/S_db.shape[0], 64/S_db.shape[1]), order=1)
+    return resized.astype(np.float32)  # [64,64]
+
+
+def bench_classify(args):
+    """Model input features and inference, original librosa path against CoughClassifier, in windows/s"""
+    import librosa
+    from cough_classifier import MelFrontend, CoughClassifier, SR_MODEL, window_samples, hop_samples
+
+    rng = np.random.default_rng(0)
+    audio = synthetic_cough_signal(rng, duration=args.duration, fs=SAMPLE_RATE, n_coughs=int(args.duration // 2))
+    audio_model = librosa.resample(audio, orig_sr=SAMPLE_RATE, target_sr=SR_MODEL)
+    starts = np.arange(0, len(audio_model) - window_samples, hop_samples, dtype=int)
+    n = len(starts)
+
+    start = time.perf_counter()
+    reference = np.stack([pre_process_audio_mel_reference(audio_model[s:s+window_samples]) for s in starts], axis=0)
+    t_reference = time.perf_counter() - start
+    frontend = MelFrontend()
+    frontend.transform(audio_model, starts[:1])
+    start = time.perf_counter()
+    features = frontend.transform(audio_model, starts)
+    t_frontend = time.perf_counter() - start
+    print(f"features: max abs difference {np.abs(reference - features).max():.2e} over {n} windows")
+    print(f"  librosa+zoom {n / t_reference:10.1f} windows/s | MelFrontend {n / t_frontend:10.1f} windows/s")
+
+    if not args.model:
+        print("inference: skipped, pass --model MODEL.onnx")
+        return
+    import onnxruntime as ort
+    session = ort.InferenceSession(args.model, providers=["CPUExecutionProvider"])
+    name = session.get_inputs()[0].name
+    start = time.perf_counter()
+    batch_input = np.stack([pre_process_audio_mel_reference(audio_model[s:s+window_samples]) for s in starts], axis=0)
+    raw_reference = session.run(None, {name: batch_input})[0]
+    t_reference = time.perf_counter() - start
+    print(f"inference: original (default session, one run) {n / t_reference:10.1f} windows/s")
+
+    session = CoughClassifier.create_session(args.model, args.threads)
+    for batch_size in args.batch:
+        classifier = CoughClassifier(session, batch_size=batch_size)
+        classifier.predict(audio_model[:window_samples * 2])
+        start = time.perf_counter()
+        _, probs = classifier.predict(audio_model)
+        elapsed = time.perf_counter() - start
+        expected = raw_reference[:, 1] if raw_reference.shape[1] > 1 else raw_reference[:, 0]
+        print(f"  CoughClassifier batch {classifier.batch_size:4d}, threads {args.threads or 'default'}: "
+              f"{n / elapsed:10.1f} windows/s | max prob difference {np.abs(probs - expected).max():.2e}")
+
+
+def bench_intervals(args):
+    """Window detections to segments: sample mask reference against detection_intervals, timing only"""
+    from cough_classifier import SR_MODEL, window_samples, hop_samples, detection_intervals
+
+    def intervals(audio_orig, sr_orig, audio_len, starts, detected, min_cough_len, padding):
+        seg_starts, seg_ends = detection_intervals(starts[detected], window_samples, audio_len,
+                                                   min_len=int(min_cough_len * SR_MODEL), padding=int(padding * SR_MODEL))
+        scale = sr_orig / SR_MODEL
+        orig_starts, orig_ends = (seg_starts * scale).astype(np.int64), (seg_ends * scale).astype(np.int64)
+        return [audio_orig[s:e] for s, e in zip(orig_starts, orig_ends)], (seg_starts, seg_ends)
+
+    rng = np.random.default_rng(args.seed)
+    for duration in (4.0, 60.0, 600.0):
+        audio_orig = rng.standard_normal(int(duration * SAMPLE_RATE)).astype(np.float32)
+        audio_len = -(-len(audio_orig) * SR_MODEL // SAMPLE_RATE)
+        starts = np.arange(0, audio_len - window_samples, hop_samples, dtype=int)
+        detected = rng.random(len(starts)) < 0.3
+        t_reference = time_call(detection_segments_reference, audio_orig, SAMPLE_RATE, audio_len, starts, detected, 0.2, 0.05)
+        t_intervals = time_call(intervals, audio_orig, SAMPLE_RATE, audio_len, starts, detected, 0.2, 0.05)
+        tracemalloc.start()
+        detection_segments_reference(audio_orig, SAMPLE_RATE, audio_len, starts, detected, 0.2, 0.05)
+        peak_reference = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        tracemalloc.start()
+        intervals(audio_orig, SAMPLE_RATE, audio_len, starts, detected, 0.2, 0.05)
+        peak_intervals = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{duration:6.0f} s, {int(detected.sum()):5d} detections: reference {t_reference * 1e3:8.2f} ms, "
+              f"{peak_reference / 1e6:8.2f} MB peak | intervals {t_intervals * 1e3:6.3f} ms, {peak_intervals / 1e3:7.1f} kB peak")
+
+
+def bench_melcache(args):
+    """Feature extraction per second of streamed audio: 4 s windows every 3.7 s against one persistent MelCache"""
+    from cough_classifier import MelFrontend, MelCache, SR_MODEL, hop_samples
+
+    rng = np.random.default_rng(0)
+    audio = synthetic_cough_signal(rng, duration=args.duration, fs=SR_MODEL, n_coughs=int(args.duration // 2))
+    chunk = int(args.chunk * SR_MODEL)
+    frontend = MelFrontend()
+    out = np.empty((256, 64, 64), dtype=np.float32)
+    frontend.transform(audio, np.arange(8) * hop_samples)
+
+    # The app before streaming: every step the latest 4 s classified on their own grid
+    window, step = int(WINDOW_DURATION * SR_MODEL), int(STEP_DURATION * SR_MODEL)
+    windows = 0
+    start = time.perf_counter()
+    for end in range(window, len(audio) + 1, step):
+        starts = end - window + np.arange(0, window - frontend.window, hop_samples, dtype=int)
+        for i in range(0, len(starts), len(out)):
+            batch = starts[i:i + len(out)]
+            frontend.transform(audio, batch, out=out[:len(batch)])
+        windows += len(starts)
+    elapsed = time.perf_counter() - start
+    print(f"4 s windows hop {hop_samples:5d}: {windows:6d} windows, {windows * frontend.n_frames:7d} frames, "
+          f"{elapsed / args.duration * 1e3:7.2f} ms CPU per s of audio")
+
+    for window_hop in (hop_samples, 512, 1024):
+        cache = MelCache(frontend, window_hop)
+        windows = 0
+        start = time.perf_counter()
+        for i in range(0, len(audio), chunk):
+            cache.push(audio[i:i + chunk])
+            while cache.ready():
+                popped = cache.pop(out)
+                windows += len(popped)
+        elapsed = time.perf_counter() - start
+
+        check = MelCache(frontend, window_hop)
+        check.push(audio)
+        popped = check.pop(out)
+        error = np.abs(frontend.transform(audio, popped) - out[:len(popped)]).max()
+        grid = "" if window_hop == hop_samples else " (opt-in grid)"
+        print(f"MelCache    hop {window_hop:5d}: {windows:6d} windows, {cache.frames_computed + cache.edge_frames_computed:7d} frames, "
+              f"{elapsed / args.duration * 1e3:7.2f} ms CPU per s of audio | max difference to MelFrontend {error:.1e}{grid}")
+
+
+def bench_resample(args):
+    """44.1 kHz to 16 kHz: librosa.resample against PolyphaseResampler, throughput and spectral accuracy
+
+    Accuracy: SNR of in-band tones against the ideal 16 kHz tone (away from the edges), and the
+    level of what a tone above the new Nyquist frequency aliases to."""
+    import librosa
+    from scipy.signal import resample_poly
+
+    rng = np.random.default_rng(0)
+    audio = synthetic_cough_signal(rng, duration=args.duration, fs=SAMPLE_RATE, n_coughs=int(args.duration // 2))
+    resampler = PolyphaseResampler(SAMPLE_RATE, 16000)
+
+    def streamed(x):
+        out = [resampler.process(x[i:i + PERIOD_SIZE]) for i in range(0, len(x), PERIOD_SIZE)]
+        out.append(resampler.flush())
+        return np.concatenate(out)
+
+    methods = [("librosa soxr_hq", lambda x: librosa.resample(x, orig_sr=SAMPLE_RATE, target_sr=16000)),
+               ("scipy resample_poly", lambda x: resample_poly(x, 160, 441).astype(np.float32)),
+               ("PolyphaseResampler", resampler.resample),
+               ("  per 1024 period", streamed)]
+
+    t = np.arange(int(2 * SAMPLE_RATE)) / SAMPLE_RATE
+    t_out = np.arange(32000) / 16000
+    edge = 2000
+    for name, fn in methods:
+        fn(audio[:SAMPLE_RATE])
+        start = time.perf_counter()
+        y = fn(audio)
+        elapsed = time.perf_counter() - start
+
+        snr = []
+        for f in (100.0, 1000.0, 4000.0, 7000.0):
+            out = fn(np.sin(2 * np.pi * f * t).astype(np.float32))[:len(t_out)]
+            ideal = np.sin(2 * np.pi * f * t_out[:len(out)])
+            err = out[edge:-edge] - ideal[edge:-edge]
+            snr.append(10 * np.log10(np.sum(ideal[edge:-edge] ** 2) / max(np.sum(err ** 2), 1e-30)))
+        alias = fn(np.sin(2 * np.pi * 10000.0 * t).astype(np.float32))[edge:-edge]
+        alias_db = 20 * np.log10(max(np.sqrt(np.mean(alias ** 2)) * np.sqrt(2), 1e-12))
+        print(f"{name:>20}: {args.duration / elapsed:8.1f}x realtime, {y.dtype} | SNR at 0.1/1/4/7 kHz "
+              f"{' / '.join(f'{v:5.1f}' for v in snr)} dB | 10 kHz alias {alias_db:6.1f} dB")
+
+
+class LastSendJsonReference():
+    """Original last_send.json read-modify-write of try_RT_rp.py, kept as the reference for UploadQueue"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'w') as outfile:
+            json.dump({"last_send_automatic": None, "last_send_soliced": None}, outfile)
+
+    def read_lastsend_json(self):
+        with open(self.path) as data_file:
+            return json.load(data_file)
+
+    def modify_lastsend_json(self, last_send_json):
+        with open(self.path, 'w') as outfile:
+            json.dump(last_send_json, outfile)
+
+    def append_to_lastsend_json(self, key, filename):
+        last_send_json = self.read_lastsend_json()
+        if key not in last_send_json or not isinstance(last_send_json[key], list):
+            last_send_json[key] = []
+        if filename not in last_send_json[key]:
+            last_send_json[key].append(filename)
+        self.modify_lastsend_json(last_send_json)
+
+    def remove_from_lastsend_json(self, key, filename):
+        last_send_json = self.read_lastsend_json()
+        if key in last_send_json and filename in last_send_json[key]:
+            last_send_json[key].remove(filename)
+        self.modify_lastsend_json(last_send_json)
+
+
+def bench_queue(args):
+    """Enqueue and ack cost with a growing backlog, last_send.json against UploadQueue, and crash recovery"""
+    import multiprocessing
+    names = [f"{1000000 + i % 97}/01-01-2025_1200_{i + 1}.wav" for i in range(args.items)]
+    tmp = tempfile.mkdtemp(prefix="queue_bench_")
+    try:
+        reference = LastSendJsonReference(os.path.join(tmp, "last_send.json"))
+        queue = UploadQueue(os.path.join(tmp, "upload_queue.db"))
+        for label, enqueue, ack in [("last_send.json", lambda n: reference.append_to_lastsend_json("last_send_soliced", n),
+                                     lambda n: reference.remove_from_lastsend_json("last_send_soliced", n)),
+                                    ("UploadQueue", lambda n: queue.enqueue("soliced", n), lambda n: queue.ack("soliced", n))]:
+            report = []
+            for phase, fn in (("enqueue", enqueue), ("ack", ack)):
+                times = []
+                for name in names:
+                    start = time.perf_counter()
+                    fn(name)
+                    times.append(time.perf_counter() - start)
+                times = np.asarray(times) * 1e3
+                report.append(f"{phase} first 100 {times[:100].mean():6.3f} ms, last 100 {times[-100:].mean():6.3f} ms, total {times.sum() / 1e3:6.2f} s")
+            print(f"{label:>15}: " + " | ".join(report))
+        queue.close()
+
+        # A writer killed without closing the database: everything acknowledged by enqueue()/ack() is there
+        path = os.path.join(tmp, "crash.db")
+        process = multiprocessing.Process(target=_queue_crash_writer, args=(path, names[:200]))
+        process.start()
+        process.join()
+        recovered = UploadQueue(path)
+        assert recovered.pending("soliced") == names[100:200], len(recovered)
+        print(f"[INFO] Queue after a killed writer: {len(recovered)} pending, as committed")
+        recovered.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def _queue_crash_writer(path, names):
+    queue = UploadQueue(path)
+    for name in names:
+        queue.enqueue("soliced", name)
+    for name in names[:100]:
+        queue.ack("soliced", name)
+    os._exit(1)
+
+
+def start_upload_server(latency=0.05, fail_rate=0.0, seed=0, batch=True):
+    """Local stand-in for the upload endpoint: keep-alive HTTP/1.1, answers {"status": "success"}
+    after `latency` seconds, or 503 with probability fail_rate. Returns (server, url, stats).
+
+    POSTs to <url>/batch (404 unless batch) are parsed as a manifest plus files, every item
+    is rejected with probability fail_rate and the reply lists the result per item."""
+    import threading
+    from email.parser import BytesParser
+    from email import policy
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    rng = np.random.default_rng(seed)
+    stats = {'connections': 0, 'requests': 0, 'chunked': 0, 'failed': 0, 'bytes': 0, 'items': 0}
+    lock = threading.Lock()
+
+    def batch_reply(content_type, body):
+        message = BytesParser(policy=policy.default).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        parts = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+        results = []
+        for item in json.loads(parts['manifest'].get_content())['items']:
+            data = parts.get(item['field'])
+            ok = data is not None and len(data.get_content()) > 0 and rng.random() >= fail_rate
+            results.append({'id': item['id'], 'status': 'success' if ok else 'error'})
+        with lock:
+            stats['items'] += len(results)
+            stats['failed'] += sum(r['status'] != 'success' for r in results)
+        return 200, {'status': 'success', 'results': results}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats['connections'] += 1
+
+        def do_POST(self):
+            if self.headers.get('Transfer-Encoding') == 'chunked':
+                pieces = []
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    pieces.append(self.rfile.read(size))
+                    self.rfile.readline()
+                    if size == 0:
+                        break
+                data = b''.join(pieces)
+            else:
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            with lock:
+                stats['requests'] += 1
+                stats['chunked'] += self.headers.get('Transfer-Encoding') == 'chunked'
+                stats['bytes'] += len(data)
+            if self.path.endswith('/batch'):
+                status, reply = batch_reply(self.headers['Content-Type'], data) if batch else (404, {'status': 'not found'})
+            else:
+                with lock:
+                    fail = rng.random() < fail_rate
+                    stats['failed'] += fail
+                    stats['items'] += 1
+                status, reply = (503, {'status': 'error'}) if fail else (200, {'status': 'success'})
+            body = json.dumps(reply).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/device/sendData_TBPrimer/0", stats
+
+
+def bench_upload(args):
+    """Backlog upload against a local server: original one-by-one posts against Uploader"""
+    import requests
+    tmp = tempfile.mkdtemp(prefix="upload_bench_")
+    try:
+        os.makedirs(os.path.join(tmp, "soliced", "1234"))
+        payload = os.urandom(args.size_kb * 1000)
+        names = []
+        for i in range(args.items):
+            names.append(f"1234/01-01-2025_1200_{i + 1}.wav")
+            with open(os.path.join(tmp, "soliced", names[-1]), 'wb') as f:
+                f.write(payload)
+
+        server, url, stats = start_upload_server(latency=args.latency, fail_rate=args.fail_rate)
+        n_ref = min(args.reference_items, args.items)
+        start = time.perf_counter()
+        for name in names[:n_ref]:
+            with open(os.path.join(tmp, "soliced", name), 'rb') as f:
+                requests.post(url, files={'file_batuk': f}, data={'cough_type': 'solic', 'nik': '1234'}, timeout=30)
+            time.sleep(args.reference_sleep)
+        elapsed = time.perf_counter() - start
+        print(f"original: {n_ref} files in {elapsed:.1f} s ({n_ref / elapsed:.2f} files/s), {stats['connections']} connections"
+              f" -> {args.items} files would take {elapsed / n_ref * args.items / 60:.1f} min")
+        server.shutdown()
+
+        modes = [("per file", dict(), True), (f"batches of {args.batch}", dict(batch_size=args.batch), True),
+                 ("batch endpoint missing", dict(batch_size=args.batch), False)]
+        for label, options, batch in modes:
+            server, url, stats = start_upload_server(latency=args.latency, fail_rate=args.fail_rate, batch=batch)
+            queue = UploadQueue(os.path.join(tmp, f"upload_queue_{len(label)}.db"))
+            for name in names:
+                queue.enqueue("soliced", name)
+            batch_url = url + "/batch" if 'batch_size' in options else None
+            uploader = Uploader(url, queue, root=tmp, workers=args.workers, rate=args.rate, burst=args.workers, backoff=0.05,
+                                max_backoff=1.0, batch_url=batch_url, **options)
+            start = time.perf_counter()
+            passes = 0
+            while queue.pending("soliced"):
+                passes += 1
+                sent, failed = uploader.drain("soliced")
+                if not sent + failed:
+                    time.sleep(0.05) # everything left is backing off
+            elapsed = time.perf_counter() - start
+            print(f"Uploader {label}, {args.workers} workers, {args.rate:g}/s: {args.items} files in {elapsed:.1f} s "
+                  f"({args.items / elapsed:.1f} files/s, {uploader.bytes_sent / 1e6 / elapsed:.1f} MB/s), {stats['requests']} requests, "
+                  f"{stats['failed']} of {stats['items']} items rejected and retried, {stats['connections']} connections, {passes} passes")
+            uploader.close()
+            queue.close()
+            server.shutdown()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_codec(args):
+    """Recording formats: size, encode CPU, round-trip error and prediction page upload time over a slow link"""
+    import io, requests, soundfile as sf
+    if args.files:
+        recordings = []
+        for path in args.files:
+            audio, fs = sf.read(path, dtype='float32', always_2d=True)
+            recordings.append((os.path.basename(path), audio.mean(axis=1), fs))
+    else:
+        # Quantised to 16 bits and scaled like PcmConverter delivers the microphone
+        rng = np.random.default_rng(0)
+        audio = np.round(synthetic_cough_signal(rng, duration=args.duration, fs=SAMPLE_RATE, n_coughs=int(args.duration // 3)) * 32768) / 32768
+        recordings = [("synthetic", np.clip(audio, -1, 1).astype(np.float32), SAMPLE_RATE)]
+
+    server, url, _ = start_upload_server(latency=0.0)
+    link = args.link_kbps * 1000 / 8
+
+    def throttled_multipart(data, filename, content_type, boundary="benchmarkboundary"):
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+               f"Content-Type: {content_type}\r\n\r\n").encode()
+        for i in range(0, len(data), 16384):
+            chunk = data[i:i + 16384]
+            time.sleep(len(chunk) / link)
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    session = requests.Session()
+    for label, audio, fs in recordings:
+        seconds = len(audio) / fs
+        print(f"{label}: {seconds:.1f} s at {fs} Hz, upload link {args.link_kbps:g} kbit/s")
+        wav_size = None
+        for name in CODECS:
+            codec = AudioCodec(name)
+            codec.encode(audio[:fs], fs)
+            cpu = time.process_time()
+            start = time.perf_counter()
+            data = codec.encode(audio, fs)
+            encode_cpu = time.process_time() - cpu
+            encode_wall = time.perf_counter() - start
+            wav_size = wav_size or len(data)
+
+            decoded, rate = sf.read(io.BytesIO(data), dtype='float32')
+            reference, _ = codec.prepare(audio, fs)
+            n = min(len(decoded), len(reference))
+            error = decoded[:n] - np.clip(reference[:n], -1, 1)
+            snr = 10 * np.log10(np.sum(reference[:n] ** 2) / max(np.sum(error ** 2), 1e-30))
+
+            start = time.perf_counter()
+            body = throttled_multipart(codec.encode(audio, fs), f"audio{codec.extension}", codec.content_type)
+            response = session.post(url, data=body, headers={"Content-Type": "multipart/form-data; boundary=benchmarkboundary"}, timeout=600)
+            end_to_end = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            print(f"  {name:>8}: {len(data) / 1e3:8.1f} kB ({len(data) / seconds / 1e3:6.1f} kB/s, {100 * (1 - len(data) / wav_size):5.1f}% saved) | "
+                  f"encode {encode_cpu / seconds * 1e3:5.1f} ms CPU per audio s ({encode_wall * 1e3:6.1f} ms wall) | "
+                  f"round-trip SNR {snr:5.1f} dB | prediction upload {end_to_end:6.2f} s")
+    session.close()
+    server.shutdown()
+
+
+def multipart_stream_reference(buffer, boundary, progress_callback):
+    """Original page-3 upload body of try_RT_rp.py: the whole file encoded into buffer first"""
+    import math
+    buffer.seek(0)
+    total_bytes = len(buffer.getvalue())
+    sent = 0
+    start = time.time()
+    header = (f"--{boundary}\r\n"
+              f'Content-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
+              f"Content-Type: audio/wav\r\n\r\n").encode()
+    yield header
+    sent += len(header)
+    while True:
+        chunk = buffer.read(65536)
+        if not chunk:
+            break
+        sent += len(chunk)
+        elapsed = time.time() - start
+        speed = sent / elapsed if elapsed > 0 else 0
+        eta_sec = (total_bytes - sent) / speed if speed > 0 else math.inf
+        progress_callback(speed, (sent / total_bytes) * 100, eta_sec)
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def _serve_uploads_to_file(port, path):
+    """Child process of bench_predict_upload: keeps every request body in path (chunked or not)"""
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            chunked = self.headers.get('Transfer-Encoding') == 'chunked'
+            with open(path, 'wb') as f:
+                if chunked:
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0], 16)
+                        f.write(self.rfile.read(size))
+                        self.rfile.readline()
+                        if size == 0:
+                            break
+                else:
+                    remaining = int(self.headers.get('Content-Length', 0))
+                    while remaining:
+                        data = self.rfile.read(min(remaining, 65536))
+                        f.write(data)
+                        remaining -= len(data)
+            body = json.dumps({'status': 'success', 'chunked': chunked}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    port.put(server.server_address[1])
+    server.serve_forever()
+
+
+def bench_predict_upload(args):
+    """Prediction page upload of a long recording: encode-then-send against EncodedStream, peak memory and time
+
+    The server runs in a child process so only the sending side is traced."""
+    import io, uuid, requests, multiprocessing, soundfile as sf
+    from email.parser import BytesParser
+    from email import policy
+
+    rng = np.random.default_rng(0)
+    audio = np.round(synthetic_cough_signal(rng, duration=args.duration, fs=SAMPLE_RATE, n_coughs=int(args.duration // 3)) * 32768) / 32768
+    audio = np.clip(audio, -1, 1).astype(np.float32)
+
+    tmp = tempfile.mkdtemp(prefix="predict_upload_")
+    body_path = os.path.join(tmp, "body")
+    port = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve_uploads_to_file, args=(port, body_path), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port.get()}/submit_predition"
+    session = requests.Session()
+    progress_calls = []
+    on_progress = lambda speed, pct, eta: progress_calls.append(pct)
+    print(f"{args.duration:.0f} s recording at {SAMPLE_RATE} Hz, recording itself {audio.nbytes / 1e6:.1f} MB")
+    try:
+        for name in args.codec:
+            codec = AudioCodec(name)
+            expected = codec.encode(audio, SAMPLE_RATE)
+            for label in ("encode then send", "EncodedStream"):
+                progress_calls.clear()
+                tracemalloc.start()
+                start = time.perf_counter()
+                if label == "encode then send":
+                    buffer = io.BytesIO()
+                    codec.write(buffer, audio, SAMPLE_RATE)
+                    boundary = uuid.uuid4().hex
+                    data = multipart_stream_reference(buffer, boundary, on_progress)
+                    content_type = f"multipart/form-data; boundary={boundary}"
+                else:
+                    encoded = codec.stream(audio, SAMPLE_RATE)
+                    body = MultipartBody([], [("file", f"audio{codec.extension}", encoded, codec.content_type)],
+                                         progress=lambda sent: on_progress(0, sent, 0))
+                    data, content_type = body.request_data(), body.content_type
+                response = session.post(url, data=data, headers={"Content-Type": content_type}, timeout=120)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                data = buffer = None
+                assert response.status_code == 200, response.status_code
+
+                with open(body_path, 'rb') as f:
+                    message = BytesParser(policy=policy.default).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + f.read())
+                sent_file = next(message.iter_parts()).get_payload(decode=True)
+                if sent_file == expected:
+                    check = "identical to codec.encode()"
+                else:
+                    same = np.array_equal(sf.read(io.BytesIO(sent_file), dtype='float32')[0], sf.read(io.BytesIO(expected), dtype='float32')[0])
+                    check = "same samples as codec.encode()" if same else "DIFFERENT from codec.encode()"
+                print(f"  {name:>6} {label:>16}: {len(sent_file) / 1e6:6.2f} MB, {'chunked' if response.json()['chunked'] else 'Content-Length'}, "
+                      f"peak traced memory {peak / 1e6:6.2f} MB, {elapsed:5.2f} s, {len(progress_calls)} progress updates, {check}")
+    finally:
+        session.close()
+        server.terminate()
+        shutil.rmtree(tmp)
+
+
+def format_latency(samples):
+    if len(samples) == 0:
+        return "no samples"
+    ms = np.asarray(samples) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return f"p50 {p50:8.3f} | p95 {p95:8.3f} | p99 {p99:8.3f} | max {ms.max():8.3f} ms ({len(ms)})"
+
+
+def bench_replay(args):
+    """Feed recorded or synthetic audio through CapturePipeline, the segmenter and the save path
+
+    FileSource/SyntheticSource periods take the place of the ALSA source, the stages and jobs
+    mirror the analyzer page: waveform decimation, streaming (or windowed) segmentation on the
+    processing stage, windows analysed on a coalescing AnalysisExecutor and saves through
+    RecordingIndex on one that never drops."""
+    if args.inputs:
+        sources = [FileSource(path, PERIOD_SIZE, channels=CHANNELS, realtime=args.realtime) for path in args.inputs]
+    else:
+        sources = [SyntheticSource(SAMPLE_RATE, CHANNELS, PERIOD_SIZE, realtime=args.realtime,
+                                   duration=args.synthetic, seed=args.seed)]
+    fs = sources[0].rate
+    for source in sources:
+        if source.rate != fs:
+            raise ValueError(f"{source.path}: {source.rate} Hz, the first input is {fs} Hz")
+    cough_config = {}
+    if os.path.exists(args.config):
+        with open(args.config) as f:
+            cough_config = json.load(f)
+    params = autocough_params(cough_config)
+
+    out_dir = args.out or tempfile.mkdtemp(prefix="cough_replay_")
+    index = RecordingIndex(out_dir)
+    analysis = AnalysisExecutor("analysis", workers=1, maxsize=16, policy='coalesce')
+    recording = AnalysisExecutor("recording", workers=1, maxsize=None)
+    end_to_end, job_latency = [], []
+    detected = [0]
+
+    def save_coughs(segments, queued_at):
+        detected[0] += len(segments)
+        for segment in segments:
+            index.save("automatic", segment.astype(np.float32), fs)
+        job_latency.append(time.perf_counter() - queued_at)
+
+    def analyse_window(data, queued_at):
+        segments, _ = segment_cough(data[AUDIO_POINT_START:], fs, **params)
+        save_coughs(segments, queued_at)
+
+    accumulator = RingBuffer(int(2.0 * fs))
+    decimator = WaveformDecimator(int(2.0 * fs) // 200, 200)
+
+    def visualize(item):
+        _, period = item
+        if period.silent:
+            return
+        accumulator.write(period.samples)
+        decimator.process(period.samples)
+
+    segmenter = StreamingSegmenter(fs, stats_duration=WINDOW_DURATION, threshold_interval=STEP_DURATION,
+                                   max_cough_len=WINDOW_DURATION, **params)
+    window = RingBuffer(int(WINDOW_DURATION * fs))
+    step = int(STEP_DURATION * fs)
+    since_step = [0]
+
+    def process(item):
+        read_at, period = item
+        if period.silent:
+            return
+        mono = period.samples
+        if args.mode == 'stream':
+            segments = [segment for _, segment in segmenter.process(mono)]
+            if segments:
+                recording.submit(save_coughs, segments, time.perf_counter())
+        else:
+            window.write(mono)
+            since_step[0] += len(mono)
+            if window.full and since_step[0] >= step:
+                since_step[0] -= step
+                analysis.submit(analyse_window, window.read_latest(), time.perf_counter(), key='auto_window')
+        end_to_end.append(time.perf_counter() - read_at)
+
+    pending = list(sources)
+
+    def read_period():
+        while pending and pending[0].exhausted:
+            pending.pop(0)
+        if not pending:
+            time.sleep(0.01)
+            return 0, None
+        if not args.realtime:
+            # As fast as the slowest consumer: never more periods in flight than the smallest queue holds
+            limit = min(stage.queue.maxsize for stage in pipeline.stages) - 1
+            while (pipeline.periods - min(stage.processed for stage in pipeline.stages) >= limit
+                   or analysis.depth() >= analysis.maxsize - 1 or recording.depth() >= analysis.maxsize - 1):
+                time.sleep(0.0002)
+        length, data = pending[0].read()
+        if length <= 0:
+            return length, None
+        return length, (time.perf_counter(), data)
+
+    def drained():
+        if pending or pipeline.capture.processed + pipeline.capture.queue.dropped < pipeline.periods:
+            return False
+        return all(stage.processed + stage.queue.dropped >= stage.queue.put_count for stage in pipeline.stages)
+
+    pipeline = CapturePipeline(read_period, lambda length, payload: (payload[0], converter.convert(payload[1])),
+                               stats_interval=0, latency_window=None)
+    pipeline.add_stage("visualization", visualize, maxsize=8)
+    pipeline.add_stage("processing", process, maxsize=128)
+    converter = PcmConverter(CHANNELS, PERIOD_SIZE, pool_size=128 + len(pipeline.stages) + 2)
+
+    start = time.perf_counter()
+    pipeline.start()
+    while not drained():
+        time.sleep(0.005)
+    t_pipeline = time.perf_counter() - start
+    pipeline.stop()
+    analysis.shutdown(wait=True)
+    recording.shutdown(wait=True)
+    t_total = time.perf_counter() - start
+
+    frames = sum(source.frames_read for source in sources)
+    audio_seconds = frames / fs
+    for source in sources:
+        source.close()
+    stats = pipeline.stats()
+    print(f"input      : {audio_seconds:.1f} s at {fs} Hz, {pipeline.periods} periods, mode {args.mode}, "
+          f"{'real-time' if args.realtime else 'as fast as possible'}")
+    print(f"throughput : {frames / t_pipeline:,.0f} samples/s (x{audio_seconds / t_pipeline:.1f} real time), "
+          f"{t_total:.2f} s including saves")
+    for stage in [pipeline.capture] + pipeline.stages:
+        print(f"{stage.name:>13}: {format_latency(stage.latencies)}")
+    print(f"{'end-to-end':>13}: {format_latency(end_to_end)}")
+    print(f"{'analysis job':>13}: {format_latency(job_latency)}")
+    dropped = sum(stats[name]['dropped'] for name in ['capture'] + [stage.name for stage in pipeline.stages])
+    analysis_stats = analysis.stats()
+    print(f"coughs     : {detected[0]} detected, {index.sequence} saved to {out_dir}")
+    print(f"drops      : {dropped} periods, {analysis_stats['dropped']} analysis jobs dropped, {analysis_stats['coalesced']} coalesced")
+    print(f"peak RSS   : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    if not args.out and not args.keep:
+        shutil.rmtree(out_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("segment", help="segment_cough timing against the per-sample reference")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_segment)
+
+    p = sub.add_parser("stream", help="windowed segment_cough against StreamingSegmenter")
+    p.add_argument("--duration", type=float, default=60.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("decimate", help="waveform display decimation cost per period")
+    p.add_argument("--periods", type=int, default=2000)
+    p.set_defaults(func=bench_decimate)
+
+    p = sub.add_parser("convert", help="int16 period to mono float32 conversion cost and allocations")
+    p.add_argument("--periods", type=int, default=5000)
+    p.set_defaults(func=bench_convert)
+
+    p = sub.add_parser("replay", help="replay audio files or synthetic coughs through the capture pipeline and save path")
+    p.add_argument("inputs", nargs="*", help="WAV/FLAC files, played back to back (default: synthetic audio)")
+    p.add_argument("--synthetic", type=float, default=60.0, help="seconds of synthetic audio when no file is given")
+    p.add_argument("--mode", choices=["stream", "window"], default="stream",
+                   help="StreamingSegmenter per period, or segment_cough on 4 s windows every 3.7 s")
+    p.add_argument("--realtime", action="store_true", help="pace periods at the sample rate instead of as fast as possible")
+    p.add_argument("--config", default="autocough_config.json")
+    p.add_argument("--out", help="save detected coughs here (default: a temporary directory)")
+    p.add_argument("--keep", action="store_true", help="keep the temporary output directory")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("render", help="analyzer waveform frame time, Tk canvas against matplotlib (needs a display)")
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--renderer", nargs="+", choices=["canvas", "matplotlib"], default=["canvas", "matplotlib"])
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("classify", help="cough model features and inference, librosa path against CoughClassifier")
+    p.add_argument("--duration", type=float, default=20.0, help="seconds of synthetic audio")
+    p.add_argument("--model", help="ONNX model (GLOBAL_CONFIG.ONNX_PATH), features only without it")
+    p.add_argument("--threads", type=int, help="intra-op threads of the CoughClassifier session")
+    p.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32, 128])
+    p.set_defaults(func=bench_classify)
+
+    p = sub.add_parser("melcache", help="persistent MelCache stream against 4 s windows of MelFrontend feature extraction")
+    p.add_argument("--duration", type=float, default=60.0, help="seconds of synthetic 16 kHz audio")
+    p.add_argument("--chunk", type=float, default=STEP_DURATION, help="seconds pushed per call, the app pushes one step")
+    p.set_defaults(func=bench_melcache)
+
+    p = sub.add_parser("resample", help="44.1 kHz to 16 kHz resampling, librosa against PolyphaseResampler")
+    p.add_argument("--duration", type=float, default=60.0, help="seconds of synthetic 44.1 kHz audio")
+    p.set_defaults(func=bench_resample)
+
+    p = sub.add_parser("intervals", help="window detections to cough segments, sample mask reference against detection_intervals")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_intervals)
+
+    p = sub.add_parser("queue", help="upload queue enqueue/ack cost and crash recovery, last_send.json against UploadQueue")
+    p.add_argument("--items", type=int, default=3000, help="recordings in the backlog")
+    p.set_defaults(func=bench_queue)
+
+    p = sub.add_parser("codec", help="recording formats: size, encode CPU and prediction upload time")
+    p.add_argument("files", nargs="*", help="recordings to encode, synthetic coughs if none")
+    p.add_argument("--duration", type=float, default=30.0, help="seconds of synthetic audio")
+    p.add_argument("--link-kbps", type=float, default=2000.0, help="upload bandwidth of the simulated link")
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser("predict-upload", help="prediction page upload of a long recording, encode-then-send against EncodedStream")
+    p.add_argument("--duration", type=float, default=300.0, help="seconds of synthetic audio")
+    p.add_argument("--codec", nargs="+", default=["wav", "flac"], choices=list(CODECS))
+    p.set_defaults(func=bench_predict_upload)
+
+    p = sub.add_parser("upload", help="backlog upload against a local HTTP server, original loop against Uploader")
+    p.add_argument("--items", type=int, default=500, help="recordings in the backlog")
+    p.add_argument("--size-kb", type=int, default=350, help="size of every recording")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--batch", type=int, default=32, help="files per request in batch mode")
+    p.add_argument("--rate", type=float, default=50.0, help="uploads started per second at most")
+    p.add_argument("--latency", type=float, default=0.05, help="server processing time per upload")
+    p.add_argument("--fail-rate", type=float, default=0.05, help="fraction of uploads the server rejects")
+    p.add_argument("--reference-items", type=int, default=5, help="files sent the original way")
+    p.add_argument("--reference-sleep", type=float, default=2.0, help="pause after every file in the original loop")
+    p.set_defaults(func=bench_upload)
+
+    args = parser.parse_args()
+    args.func(args)
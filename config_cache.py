@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Shared cache for the JSON files the device re-reads at runtime (autocough_config.json, current_patient.json)"""
+
+import os, json, time, logging, threading
+from types import MappingProxyType
+from threading import Thread
+
+
+class ConfigCache():
+    """Loads watched JSON files once and reloads them only when they change
+
+    A single watcher thread stats every file each poll_interval seconds and reloads it when its
+    mtime or size changed. Readers get an immutable snapshot (a read-only mapping) from get(), so
+    the analysis and UI threads never touch the filesystem. If a file disappears or fails to parse
+    the last good snapshot is kept and the error is available from error()."""
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def watch(self, name, path, parse=None, on_change=None):
+        """Register path under name and load it now
+
+        *parse (callable): turns the loaded JSON into the dict that gets snapshotted
+        *on_change (callable): called as on_change(name, snapshot, error) after every (re)load attempt that changed something"""
+        entry = {'path': path, 'parse': parse, 'stamp': None, 'snapshot': None, 'error': None,
+                 'callbacks': [on_change] if on_change else []}
+        with self._lock:
+            self._entries[name] = entry
+        self._reload(name, entry)
+
+    def subscribe(self, name, on_change):
+        self._entries[name]['callbacks'].append(on_change)
+
+    def get(self, name, default=None):
+        snapshot = self._entries[name]['snapshot']
+        return default if snapshot is None else snapshot
+
+    def error(self, name):
+        return self._entries[name]['error']
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._watch_loop, name="config-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _stamp(self, path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reload(self, name, entry):
+        try:
+            stamp = self._stamp(entry['path'])
+        except OSError as e:
+            self._set(name, entry, entry['snapshot'], None, e)
+            return
+        if stamp == entry['stamp']:
+            return
+        try:
+            with open(entry['path']) as f:
+                data = json.load(f)
+            if entry['parse']:
+                data = entry['parse'](data)
+            self._set(name, entry, MappingProxyType(dict(data)), stamp, None)
+        except Exception as e:
+            logging.error(f"[ERROR] Could not load {entry['path']}: {e}")
+            self._set(name, entry, entry['snapshot'], stamp, e)
+
+    def _set(self, name, entry, snapshot, stamp, error):
+        changed = snapshot is not entry['snapshot'] or repr(error) != repr(entry['error'])
+        entry['snapshot'], entry['stamp'], entry['error'] = snapshot, stamp, error
+        if changed:
+            for callback in entry['callbacks']:
+                try:
+                    callback(name, snapshot, error)
+                except Exception as e:
+                    logging.error(f"[ERROR] Config change callback for {name}: {e}")
+
+    def _watch_loop(self):
+        while self._running:
+            with self._lock:
+                entries = list(self._entries.items())
+            for name, entry in entries:
+                self._reload(name, entry)
+            time.sleep(self.poll_interval)
+
+
+def autocough_params(cough_config):
+    """segment_cough/StreamingSegmenter keyword arguments from autocough_config.json, with defaults"""
+    return {
+        'cough_padding': cough_config.get('cough_padding', 0.2),
+        'min_cough_len': cough_config.get('min_cough_len', 0.2),
+        'th_l_multiplier': cough_config.get('th_l_multiplier', 0.02),
+        'th_h_multiplier': cough_config.get('th_h_multiplier', 1),
+        'adaptive_method': cough_config.get('adaptive_method', 'default'),
+    }
+
+
+def patient_nik(patient):
+    """Patient identifier from a current_patient.json snapshot, "unknown" when missing"""
+    if not patient:
+        return "unknown"
+    return patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ONNX cough classifier on 0.5 s windows of 16 kHz audio"""
+
+import logging
+
+import numpy as np
+
+from utils import PolyphaseResampler
+
+SR_MODEL = 16000
+window_samples = int(0.5 * SR_MODEL)      # 0.5s window
+hop_samples    = int(0.05 * SR_MODEL)     # 50ms hop
+
+
+def _hz_to_mel(f):
+    """Slaney mel scale (librosa default): linear below 1 kHz, logarithmic above"""
+    f = np.asarray(f, dtype=np.float64)
+    f_sp, min_log_hz = 200.0 / 3, 1000.0
+    min_log_mel, logstep = min_log_hz / f_sp, np.log(6.4) / 27.0
+    return np.where(f >= min_log_hz, min_log_mel + np.log(np.maximum(f, min_log_hz) / min_log_hz) / logstep, f / f_sp)
+
+
+def _mel_to_hz(m):
+    m = np.asarray(m, dtype=np.float64)
+    f_sp, min_log_hz = 200.0 / 3, 1000.0
+    min_log_mel, logstep = min_log_hz / f_sp, np.log(6.4) / 27.0
+    return np.where(m >= min_log_mel, min_log_hz * np.exp(logstep * (m - min_log_mel)), f_sp * m)
+
+
+def mel_filterbank(sr, n_fft, n_mels, fmin, fmax):
+    """(n_mels, n_fft // 2 + 1) Slaney-normalised triangular filters, same as librosa.filters.mel"""
+    fftfreqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    mel_f = _mel_to_hz(np.linspace(_hz_to_mel(fmin), _hz_to_mel(fmax), n_mels + 2))
+    fdiff = np.diff(mel_f)
+    ramps = np.subtract.outer(mel_f, fftfreqs)
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    weights *= (2.0 / (mel_f[2:n_mels + 2] - mel_f[:n_mels]))[:, None]
+    return weights.astype(np.float32)
+
+
+def linear_resize_matrix(n_in, n_out):
+    """(n_in, n_out) matrix M with x @ M equal to scipy.ndimage.zoom(x, n_out / n_in, order=1) along that axis"""
+    m = np.zeros((n_in, n_out), dtype=np.float32)
+    if n_in == 1 or n_out == 1:
+        m[0, :] = 1.0
+        return m
+    pos = np.arange(n_out) * (n_in - 1) / (n_out - 1)
+    left = np.minimum(np.floor(pos).astype(int), n_in - 2)
+    frac = pos - left
+    m[left, np.arange(n_out)] = 1.0 - frac
+    m[left + 1, np.arange(n_out)] += frac
+    return m
+
+
+def detection_intervals(starts, window, length, min_len=0, padding=0):
+    """[start, end) sample intervals covered by the detected windows, same units as starts
+
+    Windows starting at the (ascending) starts are clipped to length and merged where they
+    overlap or touch, runs shorter than min_len dropped and the rest padded on both sides
+    (within 0..length). Padded intervals may overlap, they are not merged again. Works on the
+    window starts only, so the cost grows with the detections rather than the samples."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.minimum(starts + window, length)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # Ends ascend with the starts, so a run breaks where a window starts after the previous end
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = starts[1:] > ends[:-1]
+    run_starts = starts[new_run]
+    run_ends = ends[np.append(new_run[1:], True)]
+    long_enough = run_ends - run_starts >= min_len
+    run_starts, run_ends = run_starts[long_enough], run_ends[long_enough]
+    return np.maximum(run_starts - padding, 0), np.minimum(run_ends + padding, length)
+
+
+def intervals_to_mask(starts, ends, length):
+    """Boolean mask of length samples that is True inside the intervals"""
+    mask = np.zeros(length, dtype=bool)
+    for s, e in zip(starts, ends):
+        mask[s:e] = True
+    return mask
+
+
+class MelFrontend():
+    """Batched 64x64 log-mel images of fixed-length windows, the model input
+
+    Computes what the original per-window librosa.feature.melspectrogram (centered, zero padded,
+    periodic Hann), power_to_db(ref=max, top_db=80), min-max normalisation and
+    scipy.ndimage.zoom(order=1) chain did, for a whole batch of windows at once. The Hann window,
+    mel filterbank (restricted to the FFT bins below fmax) and the time-axis interpolation matrix
+    are computed once, the padded and windowed frame buffers are kept between calls."""
+
+    def __init__(self, sr=SR_MODEL, window=window_samples, n_fft=1024, hop_length=512, n_mels=64,
+                 fmin=50, fmax=2000, size=(64, 64), top_db=80.0):
+        self.sr = sr
+        self.window = window
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.size = size
+        self.top_db = top_db
+        self.n_frames = 1 + window // hop_length
+
+        self.hann = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        mel_basis = mel_filterbank(sr, n_fft, n_mels, fmin, fmax)
+        self.n_bins = int(np.flatnonzero(mel_basis.any(axis=0))[-1]) + 1
+        self.mel_basis_t = np.ascontiguousarray(mel_basis[:, :self.n_bins].T)
+        if size[0] != n_mels:
+            raise ValueError(f"Mel axis is not resized, size[0] must be n_mels ({n_mels})")
+        self.resize_t = linear_resize_matrix(self.n_frames, size[1])
+        self._padded = np.zeros((0, window + n_fft), dtype=np.float32)
+        self._frames = np.zeros((0, self.n_frames, n_fft), dtype=np.float32)
+
+    def _buffers(self, n):
+        if len(self._padded) < n:
+            self._padded = np.zeros((n, self.window + self.n_fft), dtype=np.float32)
+            self._frames = np.zeros((n, self.n_frames, self.n_fft), dtype=np.float32)
+        return self._padded[:n], self._frames[:n]
+
+    def transform(self, audio, starts, out=None):
+        """Features of the windows audio[s:s + window] for s in starts, into out (len(starts), 64, 64)"""
+        n = len(starts)
+        if out is None:
+            out = np.empty((n,) + tuple(self.size), dtype=np.float32)
+        if n == 0:
+            return out
+        pad = self.n_fft // 2
+        padded, windowed = self._buffers(n)
+        windows = np.lib.stride_tricks.sliding_window_view(audio, self.window)[starts]
+        padded[:, pad:pad + self.window] = windows
+
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.n_fft, axis=1)[:, ::self.hop_length][:, :self.n_frames]
+        return self.images(self.log_mel(frames, windowed), out=out)
+
+    def log_mel(self, frames, windowed=None):
+        """10 * log10(mel power) of frames (..., n_fft), not yet referenced to a maximum"""
+        windowed = np.multiply(frames, self.hann, out=windowed)
+        spectrum = np.fft.rfft(windowed, axis=-1)[..., :self.n_bins]
+        power = spectrum.real ** 2
+        power += spectrum.imag ** 2
+        mel = power @ self.mel_basis_t
+        np.maximum(mel, 1e-10, out=mel)
+        db = np.log10(mel, out=mel)
+        db *= 10.0
+        return db
+
+    def images(self, db, out):
+        """Per-window power_to_db(ref=np.max, top_db), min-max to [0, 1] and resize of db (n, frames, mels)
+
+        db is modified in place."""
+        db -= db.max(axis=(1, 2), keepdims=True)
+        np.maximum(db, -self.top_db, out=db)
+        low = db.min(axis=(1, 2), keepdims=True)
+        db -= low
+        db /= (-low + 1e-8)
+        np.matmul(db.transpose(0, 2, 1), self.resize_t, out=out)
+        return out
+
+
+class MelCache():
+    """Streaming log-mel frames of 16 kHz audio, sliced into per-window model inputs
+
+    MelFrontend pads every window with zeros and frames it from its own start, so with the 50 ms
+    window hop (800 samples, not a multiple of the 512 STFT hop) no frame is shared between two
+    windows: windows on the same STFT phase are 0.8 s apart, longer than a window. Such windows
+    are transformed by the frontend as soon as their audio is complete, at the same cost per
+    window as MelFrontend.transform; only the stream is kept continuous. When windows
+    start on multiples of a window_hop that is itself a multiple of the STFT hop, all interior
+    frames of a window lie on one common frame grid: each of them is transformed once when its
+    audio arrives and kept in a rolling log-mel matrix. Per window only the two zero-padded edge
+    frames are computed, then the window is referenced, normalised and resized exactly like
+    MelFrontend.transform at the same start.
+
+        cache.push(audio_chunk)
+        while cache.ready():
+            starts = cache.pop(model_input)    # fills model_input[:len(starts)]"""
+
+    def __init__(self, frontend=None, window_hop=hop_samples):
+        self.frontend = frontend or MelFrontend()
+        fe = self.frontend
+        self.shared_frames = window_hop % fe.hop_length == 0
+        if self.shared_frames and (fe.n_frames < 3 or (fe.n_frames - 2) * fe.hop_length + fe.n_fft // 2 > fe.window):
+            raise ValueError("Window too short for interior frames")
+        self.window_hop = window_hop
+        self.reset()
+
+    def reset(self):
+        fe = self.frontend
+        self.samples = 0                              # samples pushed so far
+        self.next_start = 0                           # start of the next window to pop
+        self._audio = np.zeros(0, dtype=np.float32)   # samples from self._audio_base on
+        self._audio_base = 0
+        self._db = np.zeros((0, fe.n_mels), dtype=np.float32)  # log-mel of grid frames from self._frame_base on
+        self._frame_base = 0
+        self.frames_computed = 0
+        self.edge_frames_computed = 0
+
+    def push(self, x):
+        """Append audio and transform every grid frame that is complete now"""
+        fe = self.frontend
+        x = np.asarray(x, dtype=np.float32)
+        keep = self.next_start - self._audio_base
+        self._audio = np.concatenate([self._audio[keep:], x])
+        self._audio_base += keep
+        self.samples += len(x)
+        if not self.shared_frames:
+            return
+
+        first_kept = self.next_start // fe.hop_length
+        drop = max(0, first_kept - self._frame_base)
+        done = self._frame_base + len(self._db)
+        total = max(0, (self.samples - fe.n_fft) // fe.hop_length + 1)
+        new = np.zeros((0, fe.n_mels), dtype=np.float32)
+        if total > done:
+            offset = done * fe.hop_length - self._audio_base
+            span = self._audio[offset:offset + (total - done - 1) * fe.hop_length + fe.n_fft]
+            frames = np.lib.stride_tricks.sliding_window_view(span, fe.n_fft)[::fe.hop_length]
+            new = fe.log_mel(frames)
+            self.frames_computed += len(new)
+        self._db = np.concatenate([self._db[drop:], new])
+        self._frame_base += drop
+
+    def ready(self):
+        """Number of complete windows that pop() can return"""
+        available = self.samples - self.frontend.window - self.next_start
+        return 0 if available < 0 else available // self.window_hop + 1
+
+    def pop(self, out):
+        """Model inputs of the next min(ready(), len(out)) windows into out, returns their starts"""
+        fe = self.frontend
+        n = min(self.ready(), len(out))
+        starts = self.next_start + self.window_hop * np.arange(n, dtype=int)
+        if n == 0:
+            return starts
+        if not self.shared_frames:
+            fe.transform(self._audio, starts - self._audio_base, out=out[:n])
+            self.frames_computed += n * fe.n_frames
+            self.next_start += n * self.window_hop
+            return starts
+        half = fe.n_fft // 2
+        last = fe.n_frames - 1
+        db = np.empty((n, fe.n_frames, fe.n_mels), dtype=np.float32)
+
+        # Frames 1 .. n_frames-2 of a window starting at s are grid frames s / hop + 0 .. n_frames-3
+        grid = starts // fe.hop_length - self._frame_base
+        index = grid[:, None] + np.arange(last - 1)[None, :]
+        db[:, 1:last] = self._db[index]
+
+        # Frame 0 is zero-padded on the left, the last frame runs past the window end
+        edges = np.zeros((n, 2, fe.n_fft), dtype=np.float32)
+        local = starts - self._audio_base
+        audio = np.lib.stride_tricks.sliding_window_view(self._audio, fe.window)[local]
+        edges[:, 0, half:] = audio[:, :half]
+        tail = last * fe.hop_length - half
+        edges[:, 1, :fe.window - tail] = audio[:, tail:]
+        edge_db = fe.log_mel(edges)
+        db[:, 0] = edge_db[:, 0]
+        db[:, last] = edge_db[:, 1]
+        self.edge_frames_computed += 2 * n
+
+        fe.images(db, out=out[:n])
+        self.next_start += n * self.window_hop
+        return starts
+
+
+class CoughClassifier():
+    """Cough detection with the ONNX model on 0.5 s windows every 50 ms
+
+    *session (ort.InferenceSession): an existing session, or model_path to create one with create_session
+    *threads (int): intra-op threads of a session created here, None leaves the onnxruntime default
+    *batch_size (int): windows per session.run call; a model with a fixed batch dimension dictates it
+    *threshold (float): cough probability above which a window counts as cough
+    *window_hop (int): samples between window starts, the original 50 ms (800) by default. Opt-in:
+     a multiple of the STFT hop (512 or 1024) lets windows share STFT frames, each computed once,
+     but moves the detection grid off the 50 ms the model was evaluated on.
+
+    The model input tensor is allocated once for batch_size windows and refilled for every batch.
+    predict() classifies a whole recording, predict_stream()/detect_stream() a continuous stream
+    through one persistent MelCache, so windows across chunk boundaries are classified too;
+    reset_stream() starts a new stream. At the default hop a streamed window costs as much as in
+    predict(), only the opt-in grid computes less."""
+
+    def __init__(self, session=None, model_path=None, threads=None, batch_size=32, threshold=0.5, frontend=None,
+                 window_hop=hop_samples):
+        if session is None:
+            session = self.create_session(model_path, threads)
+        self.session = session
+        self.frontend = frontend or MelFrontend()
+        self.threshold = threshold
+        self.window_hop = window_hop
+        self._resamplers = {}
+        self.cache = MelCache(self.frontend, window_hop)
+        self._whole = MelCache(self.frontend, window_hop) if self.cache.shared_frames else None
+        self._open = None   # [start, end) of the detected run the stream may still extend
+
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        fixed = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.batch_size = fixed or batch_size
+        self.fixed_batch = fixed is not None
+        self._input = np.zeros((self.batch_size,) + tuple(self.frontend.size), dtype=np.float32)
+
+    @staticmethod
+    def create_session(model_path, threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        logging.info(f"[INFO] ONNX session {model_path}: intra-op threads {threads or 'default'}")
+        return session
+
+    def window_starts(self, n_samples):
+        return np.arange(0, n_samples - self.frontend.window, self.window_hop, dtype=int)
+
+    def _run(self, n):
+        batch_input = self._input if self.fixed_batch else self._input[:n]
+        raw = self.session.run(None, {self.input_name: batch_input})[0][:n]
+        return raw[:, 1] if raw.shape[1] > 1 else raw[:, 0]
+
+    def predict(self, audio_model):
+        """(window starts, cough probabilities) for 16 kHz audio"""
+        audio_model = np.asarray(audio_model, dtype=np.float32)
+        if self._whole is not None:
+            self._whole.reset()
+            self._whole.push(audio_model)
+            return self._predict_cached(self._whole)
+
+        starts = self.window_starts(len(audio_model))
+        probs = np.empty(len(starts), dtype=np.float32)
+        for i in range(0, len(starts), self.batch_size):
+            batch = starts[i:i + self.batch_size]
+            n = len(batch)
+            self.frontend.transform(audio_model, batch, out=self._input[:n])
+            probs[i:i + n] = self._run(n)
+        return starts, probs
+
+    def predict_stream(self, audio_model):
+        """(window starts, probabilities) of the windows completed by this chunk of a continuous 16 kHz stream
+
+        Starts count samples since the first chunk after reset_stream()."""
+        self.cache.push(audio_model)
+        return self._predict_cached(self.cache)
+
+    def detect_stream(self, audio_model):
+        """[start, end) model-sample intervals of the coughs that ended with this chunk of the stream
+
+        Detected windows are merged like detection_intervals (without min_len and padding); a run
+        is reported once the next window to classify starts after its end, so it can not grow anymore."""
+        starts, probs = self.predict_stream(audio_model)
+        window = self.frontend.window
+        closed = []
+        for s in starts[probs > self.threshold].tolist():
+            if self._open is not None and s <= self._open[1]:
+                self._open[1] = s + window
+                continue
+            if self._open is not None:
+                closed.append(tuple(self._open))
+            self._open = [s, s + window]
+        if self._open is not None and self.cache.next_start > self._open[1]:
+            closed.append(tuple(self._open))
+            self._open = None
+        return closed
+
+    def reset_stream(self):
+        """Forget the stream fed to predict_stream/detect_stream, the next chunk starts at sample 0"""
+        self.cache.reset()
+        self._open = None
+
+    def _predict_cached(self, cache):
+        all_starts, all_probs = [], []
+        while cache.ready():
+            starts = cache.pop(self._input)
+            all_starts.append(starts)
+            all_probs.append(self._run(len(starts)))
+        if not all_starts:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+        return np.concatenate(all_starts), np.concatenate(all_probs)
+
+    def resampler(self, sr_orig):
+        """PolyphaseResampler from sr_orig to SR_MODEL, the filter is designed once per rate"""
+        resampler = self._resamplers.get(sr_orig)
+        if resampler is None:
+            resampler = self._resamplers[sr_orig] = PolyphaseResampler(sr_orig, SR_MODEL)
+        return resampler
+
+    def detect_intervals(self, audio_orig, sr_orig, min_cough_len=0.0, padding=0.0, audio_model=None):
+        """Cough intervals as ((start, end) in audio_orig samples, (start, end) in model samples)
+
+        audio_model is audio_orig already at SR_MODEL (e.g. resampled while streaming), otherwise
+        audio_orig is resampled here."""
+        if audio_model is None:
+            audio_model = self.resampler(sr_orig).resample(audio_orig)
+
+        starts, probs = self.predict(audio_model)
+        seg_starts, seg_ends = detection_intervals(starts[probs > self.threshold], self.frontend.window, len(audio_model),
+                                                   min_len=int(min_cough_len * SR_MODEL), padding=int(padding * SR_MODEL))
+
+        # Map back to original indices, truncated like int(s * scale)
+        scale = sr_orig / SR_MODEL
+        orig = ((seg_starts * scale).astype(np.int64), (seg_ends * scale).astype(np.int64))
+        return orig, (seg_starts, seg_ends)
+
+    def detect(self, audio_orig, sr_orig, min_cough_len=0.0, padding=0.0, audio_model=None):
+        """Cough segments of audio_orig and the cough mask in model samples, like process_audio_with_original"""
+        if audio_model is None:
+            audio_model = self.resampler(sr_orig).resample(audio_orig)
+        (orig_starts, orig_ends), (seg_starts, seg_ends) = self.detect_intervals(
+            audio_orig, sr_orig, min_cough_len=min_cough_len, padding=padding, audio_model=audio_model)
+        segments_orig = [audio_orig[s:e] for s, e in zip(orig_starts, orig_ends)]
+        return segments_orig, intervals_to_mask(seg_starts, seg_ends, len(audio_model))
+
+
+_classifiers = {}
+
+
+def process_audio_with_original(audio_orig, sr_orig, session=None, min_cough_samples=0.0, padding=0.0):
+    """Cough segments of audio_orig (any rate) found by the model in session
+
+    Keeps one CoughClassifier (and its buffers) per session. min_cough_samples and padding are in seconds."""
+    classifier = _classifiers.get(id(session))
+    if classifier is None or classifier.session is not session:
+        classifier = _classifiers[id(session)] = CoughClassifier(session)
+    return classifier.detect(audio_orig, sr_orig, min_cough_len=min_cough_samples, padding=padding)
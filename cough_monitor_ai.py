@@ -4,16 +4,15 @@
 import time, os, logging, json, glob, re, socket, requests
 from datetime import datetime
 from threading import Thread, Lock
-from collections import deque
 from types import SimpleNamespace
 
 import tkinter as tk
 from tkinter import font
 
 import numpy as np
-import alsaaudio as alsa
-import soundfile as sf
-import onnxruntime as ort
+
+from startup import configure_matplotlib_cache
+configure_matplotlib_cache(os.path.dirname(os.path.abspath(__file__)))
 
 # Import matplotlib libraries
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
@@ -22,7 +21,11 @@ import matplotlib.patches as patches
 from matplotlib.figure import Figure
 from matplotlib import style
 
-from utils import process_audio_with_original
+from utils import RingBuffer, PolyphaseResampler
+from cough_classifier import CoughClassifier, SR_MODEL, hop_samples
+from recording_index import RecordingIndex
+from workers import AnalysisExecutor
+from audio_source import create_source
 
 os.makedirs("Recorded_Data/automatic", exist_ok=True)
 os.makedirs("Recorded_Data/soliced", exist_ok=True)
@@ -64,12 +67,17 @@ class CoughTk():
     STEP_DURATION = WINDOW_DURATION - OVERLAP_DURATION
 
     DEVICE_SOUND =  GLOBAL_CONFIG.DEVICE_SOUND # 'dmic_sv' "plughw:2,0"
+    AUDIO_SOURCE = getattr(GLOBAL_CONFIG, 'AUDIO_SOURCE', 'alsa') # "alsa", "file:<path>" or "synthetic"
     REC_IND_FILE =  "/sys/class/gpio/gpio5/value" # "gpio12" "/sys/class/gpio/gpio12/value"
     RECORD_LENGTH = int(GLOBAL_CONFIG.RECORD_LENGTH * SAMPLE_RATE)
 
     SERVER_DOMAIN = GLOBAL_CONFIG.SERVER_DOMAIN
     DEVICE_ID = GLOBAL_CONFIG.DEVICE_ID
-    ONNX_SESSION = ort.InferenceSession(GLOBAL_CONFIG.ONNX_PATH, providers=["CPUExecutionProvider"])
+    ONNX_THREADS = getattr(GLOBAL_CONFIG, 'ONNX_THREADS', None) # onnxruntime intra-op threads, None for its default
+    ONNX_BATCH = getattr(GLOBAL_CONFIG, 'ONNX_BATCH', 32) # windows per session.run
+    ONNX_WINDOW_HOP = getattr(GLOBAL_CONFIG, 'ONNX_WINDOW_HOP', hop_samples) # samples at 16 kHz between model windows, 800 (50 ms) as evaluated; opt-in 512/1024 share STFT frames but move the detection grid
+    CLASSIFIER = CoughClassifier(model_path=GLOBAL_CONFIG.ONNX_PATH, threads=ONNX_THREADS, batch_size=ONNX_BATCH,
+                                 window_hop=ONNX_WINDOW_HOP)
 
     def __init__(self):
         super(CoughTk, self).__init__()
@@ -120,6 +128,7 @@ class CoughTk():
         self.lb_cougha.config(font=wndfont)
         self.lb_cougha.pack(side=tk.BOTTOM)
 
+        self.recording_index = RecordingIndex("Recorded_Data")
         thd_coughCount = Thread(target=self.getCoughCount).start()
 
         # Recording Status
@@ -181,7 +190,6 @@ class CoughTk():
             self.infofrm.config(bg='black')
 
         # === Shared buffer ===
-        self.audio_buffer = deque()
         self.buffer_lock = Lock()
         self.next_time = time.time()
         self.RECORD_FLAG = False
@@ -189,13 +197,21 @@ class CoughTk():
 
         self.buffer_size = int(self.STEP_DURATION * self.SAMPLE_RATE)
         self.window_size = int(self.WINDOW_DURATION * self.SAMPLE_RATE)
+        # Two windows of history: a cough is cut out of it once the classifier saw it end
+        self.audio_buffer = RingBuffer(max(2 * self.window_size, self.RECORD_LENGTH))
+        # The same audio at the model rate, resampled period by period and classified as one stream
+        self.resampler = PolyphaseResampler(self.SAMPLE_RATE, SR_MODEL)
+        self.model_chunks = []
+        self.stream_generation = 0      # bumped whenever the stream restarts
+        self.classified_generation = -1 # stream the classifier was last fed, only touched by classify_pool
+        # One worker keeps the stream chunks in order, none is dropped
+        self.classify_pool = AnalysisExecutor("classify", workers=1, maxsize=None)
 
         # # start graph animation
         self.ani = animation.FuncAnimation(self.fig2, self.graphupdate, interval=67, blit=False)
 
-        self.pcm = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL,
-                       channels=self.CHANNELS, rate=self.SAMPLE_RATE, format=alsa.PCM_FORMAT_S16_LE,
-                       periodsize=self.PERIOD_SIZE, device=self.DEVICE_SOUND)
+        self.audio_source = create_source(self.AUDIO_SOURCE, device=self.DEVICE_SOUND, rate=self.SAMPLE_RATE,
+                                          channels=self.CHANNELS, period_size=self.PERIOD_SIZE)
         
         Thread(target=self.record_audio_loop).start()
         Thread(target=self.sendcoughdataprocess).start()
@@ -240,8 +256,8 @@ class CoughTk():
 
     def sendstatusdeviceAPIprocess(self):
         while True:
-            autocoughcount = len(next(os.walk("Recorded_Data/automatic"))[2])
-            solicoughcount = len(next(os.walk("Recorded_Data/soliced"))[2])
+            autocoughcount = self.recording_index.count("automatic")
+            solicoughcount = self.recording_index.count("soliced")
 
             response = requests.post(f"{self.SERVER_DOMAIN}/api/device_status", 
                             data={'device_id': self.DEVICE_ID, 'autocoughcount': autocoughcount, 'solicoughcount': solicoughcount})
@@ -251,8 +267,8 @@ class CoughTk():
 
     def getCoughCount(self):
         while True:
-            autocoughcount = len(next(os.walk("Recorded_Data/automatic"))[2])
-            solicoughcount = len(next(os.walk("Recorded_Data/soliced"))[2])
+            autocoughcount = self.recording_index.count("automatic")
+            solicoughcount = self.recording_index.count("soliced")
 
             self.autocoughcount.set(f"Auto Coughs: {autocoughcount}")
             self.solicoughcount.set(f"Solic Coughs: {solicoughcount}")
@@ -277,7 +293,7 @@ class CoughTk():
 
     def record_audio_loop(self):
         while True:
-            length, data = self.pcm.read()
+            length, data = self.audio_source.read()
             if length > 0:            
                 audio_data = np.frombuffer(data, dtype=np.int16)
                 audio_data = audio_data.reshape(-1, self.CHANNELS)
@@ -286,9 +302,9 @@ class CoughTk():
 
                 if self.RECORD_FLAG:
                     with self.buffer_lock:
-                        self.audio_buffer.extend(mono)
+                        self.audio_buffer.write(mono)
                         if len(self.audio_buffer) >= self.RECORD_LENGTH:
-                            data_np = np.array(self.audio_buffer, dtype=np.float32)
+                            data_np = self.audio_buffer.read_latest(self.RECORD_LENGTH)
                             self.RECORD_FLAG = False
 
                             self.txtrecord.set("Recording: Automatic")
@@ -296,10 +312,10 @@ class CoughTk():
                             self.do_updatefigure(ignore_cooldown=True)
 
                             t = Thread(target=self.handle_record_soli,
-                                       args=(data_np.copy(),))
+                                       args=(data_np,))
                             t.start()
                             self.next_time = time.time()
-                            self.audio_buffer.clear()
+                            self.reset_stream()
                 else:
                     with open(self.REC_IND_FILE, "r") as stt:
                         RecStt = stt.read().strip()
@@ -307,7 +323,8 @@ class CoughTk():
                     if RecStt == '1':
                         with open(self.REC_IND_FILE, "w") as out:
                             out.write('')
-                        self.audio_buffer.clear()
+                        with self.buffer_lock:
+                            self.reset_stream()
                         self.RECORD_FLAG = True
 
                         self.txtrecord.set("Recording: Active")
@@ -315,29 +332,56 @@ class CoughTk():
                         self.do_updatefigure(ignore_cooldown=True)
                     else:
                         with self.buffer_lock:
-                            self.audio_buffer.extend(mono)
-                            while len(self.audio_buffer) > self.window_size:
-                                self.audio_buffer.popleft()
-                            data_np = np.array(self.audio_buffer, dtype=np.float32)
+                            self.audio_buffer.write(mono)
+                            self.model_chunks.append(self.resampler.process(mono))
 
                         current_gaptime = time.time() - self.next_time
-                        if len(self.audio_buffer) >= self.window_size and current_gaptime >= self.STEP_DURATION:
+                        if current_gaptime >= self.STEP_DURATION:
+                            with self.buffer_lock:
+                                model_np = np.concatenate(self.model_chunks)
+                                self.model_chunks = []
+                                generation = self.stream_generation
                             self.next_time += self.STEP_DURATION #= time.time()
 
                             self.patch_plot.set_facecolor('blue')
                             self.do_updatefigure()
 
-                            t = Thread(target=self.handle_record_auto,
-                                       args=(data_np.copy(),))
-                            t.start()
+                            self.classify_pool.submit(self.handle_record_auto, generation, model_np)
                             
 
                 time.sleep(0.01)
             else:
                 time.sleep(0.01)
 
-    def handle_record_auto(self, audio_np):
-        coughSegments, _ = process_audio_with_original(audio_np, self.SAMPLE_RATE, session=self.ONNX_SESSION, min_cough_samples=0.0, padding=0.0)
+    def reset_stream(self):
+        """Start a new audio stream, called with buffer_lock held; chunks of the old one are not classified anymore"""
+        self.audio_buffer.clear()
+        self.model_chunks = []
+        self.resampler.reset()
+        self.stream_generation += 1
+
+    def handle_record_auto(self, generation, model_np):
+        """Classify the next chunk of the 16 kHz stream and save the coughs that ended in it"""
+        if generation != self.stream_generation:
+            return
+        if generation != self.classified_generation:
+            self.CLASSIFIER.reset_stream()
+            self.classified_generation = generation
+        intervals = self.CLASSIFIER.detect_stream(model_np)
+
+        # Model samples to audio_buffer samples, truncated like int(s * scale)
+        scale = self.SAMPLE_RATE / SR_MODEL
+        coughSegments = []
+        with self.buffer_lock:
+            if generation != self.stream_generation:
+                return
+            total = self.audio_buffer.total_written
+            for s, e in intervals:
+                start, end = int(s * scale), min(int(e * scale), total)
+                if total - start > len(self.audio_buffer):
+                    logging.warning(f"[WARNING] Cough at {start / self.SAMPLE_RATE:.2f} s already left the audio buffer")
+                    continue
+                coughSegments.append(self.audio_buffer.read_latest(total - start)[:end - start])
         # print(f"[INFO] Processing chunk with shape: {audio_np.shape}")
 
         if len(coughSegments) > 0:
@@ -350,17 +394,10 @@ class CoughTk():
             self.do_updatefigure(ignore_cooldown=True)
 
             #self.last_cough_np = now_cough
-            onlyfiles = next(os.walk("Recorded_Data/automatic"))[2]
-            cough_count = len(onlyfiles) + 1
-            timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-            sf.write(f'Recorded_Data/automatic/{timestamp}_{cough_count}.wav', now_cough, self.SAMPLE_RATE, 'PCM_24')
+            self.recording_index.save("automatic", now_cough, self.SAMPLE_RATE)
 
     def handle_record_soli(self, audio_np):
-        onlyfiles = next(os.walk("Recorded_Data/soliced"))[2]
-        cough_count = len(onlyfiles) + 1
-        timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-        sf.write(
-            f'Recorded_Data/soliced/{timestamp}_{cough_count}.wav', audio_np, self.SAMPLE_RATE, 'PCM_24')
+        self.recording_index.save("soliced", audio_np, self.SAMPLE_RATE)
 
     def method_similarity_ratio(self, a, b):
         if a.shape != b.shape:
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Event-driven button input on sysfs GPIO value files"""
+
+import os, time, select, logging
+from threading import Thread
+
+
+class GpioButton():
+    """One button on a sysfs GPIO value file, pressed while the file reads pressed_value"""
+
+    def __init__(self, name, value_path, pressed_value='0', debounce=0.05):
+        self.name = name
+        self.value_path = value_path
+        self.pressed_value = pressed_value
+        self.released_value = '1' if pressed_value == '0' else '0'
+        self.debounce = debounce
+        self.fd = None
+        self.edge = False
+        self.state = self.released_value
+        self.last_press = 0.0
+        self.presses = 0
+        self.bounces = 0
+
+    def open(self):
+        """Open the value file and try to enable edge interrupts, False means it has to be polled
+
+        Edge events need the `edge` file next to a real sysfs value file. A plain file (e.g. the
+        checked-in gpio5..gpio8 fakes) or a pin that refuses edges falls back to polling the value
+        through the already open descriptor."""
+        self.fd = os.open(self.value_path, os.O_RDONLY | os.O_NONBLOCK)
+        edge_path = os.path.join(os.path.dirname(os.path.abspath(self.value_path)), 'edge')
+        self.edge = False
+        if os.path.exists(edge_path):
+            try:
+                with open(edge_path, 'w') as f:
+                    f.write('both')
+                self.edge = True
+            except OSError:
+                pass
+        self.state = self.read()
+        return self.edge
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def read(self):
+        return os.pread(self.fd, 8, 0).decode(errors='ignore').strip()
+
+    def acknowledge(self):
+        """Write the released value back, for value files that another process latches to pressed"""
+        try:
+            with open(self.value_path, 'w') as f:
+                f.write(self.released_value)
+            return True
+        except OSError:
+            return False
+
+
+class GpioInput():
+    """Waits for button edges and dispatches debounced presses to subscribers
+
+    A single thread blocks in poll() on POLLPRI for every button with edge interrupts, so idle
+    buttons cost no syscalls. Buttons without edge support are read once per poll_interval (100 ms,
+    the rate of the old navigation loop) via pread() on a descriptor that stays open. A press is the released->pressed transition, presses
+    closer than the button's debounce time to the previous one are counted as bounces and dropped.
+
+    Subscribers are called as callback(name) on the GPIO thread and should return quickly."""
+
+    def __init__(self, debounce=0.05, poll_interval=0.1, acknowledge=True):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.acknowledge = acknowledge
+        self.buttons = {}
+        self._subscribers = {}
+        self._running = False
+        self._thread = None
+        self._wake_r, self._wake_w = None, None
+
+    def add_button(self, name, value_path, pressed_value='0'):
+        self.buttons[name] = GpioButton(name, value_path, pressed_value, self.debounce)
+        self._subscribers.setdefault(name, [])
+
+    def subscribe(self, name, callback):
+        """callback(name) on every press of button name, name=None subscribes to all buttons"""
+        names = self.buttons.keys() if name is None else [name]
+        for n in names:
+            self._subscribers.setdefault(n, []).append(callback)
+
+    def start(self):
+        for button in self.buttons.values():
+            try:
+                button.open()
+                logging.info(f"[INFO] GPIO {button.name}: {button.value_path} ({'edge' if button.edge else 'polled'})")
+            except OSError as e:
+                logging.error(f"[ERROR] GPIO {button.name}: cannot open {button.value_path}: {e}")
+        self._wake_r, self._wake_w = os.pipe()
+        self._running = True
+        self._thread = Thread(target=self._run, name="gpio-input", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._wake_w is not None:
+            os.write(self._wake_w, b'x')
+        if self._thread:
+            self._thread.join(1.0)
+        for button in self.buttons.values():
+            button.close()
+        for fd in (self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._wake_r, self._wake_w = None, None
+
+    def stats(self):
+        return {name: {'presses': b.presses, 'bounces': b.bounces, 'edge': b.edge} for name, b in self.buttons.items()}
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._wake_r, select.POLLIN)
+        by_fd = {}
+        polled = []
+        for button in self.buttons.values():
+            if button.fd is None:
+                continue
+            if button.edge:
+                poller.register(button.fd, select.POLLPRI | select.POLLERR)
+                by_fd[button.fd] = button
+            else:
+                polled.append(button)
+        timeout = self.poll_interval * 1000 if polled else None
+
+        while self._running:
+            try:
+                events = poller.poll(timeout)
+            except InterruptedError:
+                continue
+            for fd, _ in events:
+                if fd in by_fd:
+                    self._update(by_fd[fd])
+            for button in polled:
+                self._update(button)
+
+    def _update(self, button):
+        try:
+            value = button.read()
+        except OSError as e:
+            logging.error(f"[ERROR] GPIO {button.name}: {e}")
+            return
+        previous, button.state = button.state, value
+        if value != button.pressed_value or previous == button.pressed_value:
+            return
+
+        now = time.monotonic()
+        if now - button.last_press < button.debounce:
+            button.bounces += 1
+            return
+        button.last_press = now
+        button.presses += 1
+        if self.acknowledge and not button.edge and button.acknowledge():
+            button.state = button.released_value
+        for callback in self._subscribers.get(button.name, []):
+            try:
+                callback(button.name)
+            except Exception as e:
+                logging.error(f"[ERROR] GPIO {button.name} subscriber: {e}")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent index of the recordings under Recorded_Data"""
+
+import os, re, json, logging, threading
+from contextlib import contextmanager
+from datetime import datetime
+
+NUMBER_PATTERN = re.compile(r'_(\d+)\.\w+$')
+
+
+class RecordingIndex():
+    """File counts and next file numbers per recording folder, without listing the folders
+
+    Every folder under root that recordings are saved into (e.g. "automatic", "soliced/<nik>") has
+    an entry {'count', 'last', 'mtime_ns'}, and `sequence` counts every save across all folders.
+    The index lives in index_file and is replaced atomically after each save.
+
+    A folder is only listed again when its mtime differs from the one recorded after our own last
+    write, i.e. at startup for a stale index or when something else added or removed files (one
+    stat() per check instead of a directory walk).
+
+    The lock is only held to reserve a file number and to commit the entry afterwards, never
+    while a recording is encoded and written, so saves run concurrently and check()/count() do
+    not wait for them. A folder with saves in progress is not rescanned.
+
+    With a codec (audio_codec.AudioCodec) recordings are saved in its format and extension
+    instead of PCM_24 WAV."""
+
+    VERSION = 1
+
+    def __init__(self, root='Recorded_Data', index_file='recording_index.json', codec=None):
+        self.root = root
+        self.codec = codec
+        self.path = os.path.join(root, index_file)
+        self.sequence = 0
+        self.entries = {}
+        self._reserved = {}  # folder: highest number handed out
+        self._writing = {}   # folder: saves in progress
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                raise ValueError(f"index version {data.get('version')}")
+            self.sequence = data['sequence']
+            self.entries = data['folders']
+        except FileNotFoundError:
+            self.sequence, self.entries = 0, {}
+        except Exception as e:
+            logging.warning(f"[WARNING] Recording index unreadable, rebuilding: {e}")
+            self.sequence, self.entries = 0, {}
+
+        with self._lock:
+            changed = [folder for folder in list(self.entries) if self.check(folder, save=False)]
+            if changed or not os.path.exists(self.path):
+                self.sequence = max(self.sequence, sum(e['count'] for e in self.entries.values()))
+                self._save()
+
+    def check(self, folder, save=True):
+        """Rescan folder if it changed behind our back, returns True if it was rescanned"""
+        with self._lock:
+            entry = self.entries.get(folder)
+            try:
+                mtime_ns = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            if entry is not None and (entry['mtime_ns'] == mtime_ns or self._writing.get(folder)):
+                return False
+            self.rescan(folder, mtime_ns)
+            if save:
+                self._save()
+            return True
+
+    def rescan(self, folder, mtime_ns=None):
+        count, last = 0, 0
+        try:
+            with os.scandir(os.path.join(self.root, folder)) as it:
+                for item in it:
+                    if item.is_file():
+                        count += 1
+                        match = NUMBER_PATTERN.search(item.name)
+                        if match:
+                            last = max(last, int(match.group(1)))
+        except FileNotFoundError:
+            pass
+        self.entries[folder] = {'count': count, 'last': max(last, count), 'mtime_ns': mtime_ns}
+        logging.info(f"[INFO] Recording index rescanned {folder}: {count} files")
+
+    def count(self, folder):
+        self.check(folder)
+        return self.entries[folder]['count']
+
+    @contextmanager
+    def saving(self, folder):
+        """Reserve the next file number in folder for one save
+
+            with index.saving("automatic") as number:
+                sf.write(f"Recorded_Data/automatic/{timestamp}_{number}.wav", ...)
+
+        The block runs without the lock, the entry is only updated if it finishes without an exception."""
+        with self._lock:
+            os.makedirs(os.path.join(self.root, folder), exist_ok=True)
+            self.check(folder, save=False)
+            number = max(self.entries[folder]['last'], self._reserved.get(folder, 0)) + 1
+            self._reserved[folder] = number
+            self._writing[folder] = self._writing.get(folder, 0) + 1
+        done = False
+        try:
+            yield number
+            done = True
+        finally:
+            with self._lock:
+                self._writing[folder] -= 1
+                if done:
+                    entry = self.entries[folder]
+                    entry['last'] = max(entry['last'], number)
+                    entry['count'] += 1
+                    entry['mtime_ns'] = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+                    self.sequence += 1
+                    self._save()
+                else:
+                    # Whatever the failed save left behind is counted by the next check
+                    self.entries[folder]['mtime_ns'] = None
+
+    def save(self, folder, audio, fs, subtype='PCM_24'):
+        """Write audio to folder as <timestamp>_<number>.wav (or the codec's extension), returns the file path"""
+        timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
+        extension = self.codec.extension if self.codec else '.wav'
+        with self.saving(folder) as number:
+            path = os.path.join(self.root, folder, f'{timestamp}_{number}{extension}')
+            if self.codec:
+                self.codec.write(path, audio, fs)
+            else:
+                import soundfile as sf
+                sf.write(path, audio, fs, subtype)
+        return path
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': self.VERSION, 'sequence': self.sequence, 'folders': self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
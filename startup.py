@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Startup helpers for the kiosk entry points: lazy imports, matplotlib cache, phase timing"""
+
+import os, sys, time, logging
+import importlib.util
+
+
+def lazy_import(name):
+    """Module object that is only executed on first attribute access
+
+    `requests = lazy_import('requests')` costs a spec lookup at startup; the real import happens
+    the first time e.g. requests.post is used, so features that are never touched never pay for it."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def configure_matplotlib_cache(app_dir):
+    """Point MPLCONFIGDIR at a persistent writable directory, must run before matplotlib is imported
+
+    When ~/.config/matplotlib is not writable matplotlib falls back to a new /tmp directory and
+    rebuilds its font cache on every boot. Tries ~/.cache/matplotlib, then <app_dir>/.cache/matplotlib."""
+    if os.environ.get('MPLCONFIGDIR'):
+        return os.environ['MPLCONFIGDIR']
+    for path in (os.path.join(os.path.expanduser('~'), '.cache', 'matplotlib'),
+                 os.path.join(app_dir, '.cache', 'matplotlib')):
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            continue
+        if os.access(path, os.W_OK):
+            os.environ['MPLCONFIGDIR'] = path
+            return path
+    logging.warning("[WARNING] No writable matplotlib cache directory, matplotlib will use a temporary one")
+    return None
+
+
+class StartupTimer():
+    """Wall time of consecutive startup phases, logged as one line by report()"""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self._last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = self._last - self.start
+        breakdown = ", ".join(f"{phase} {elapsed * 1e3:.0f} ms" for phase, elapsed in self.phases)
+        logging.info(f"[INFO] Startup {total * 1e3:.0f} ms: {breakdown}")
+        return total
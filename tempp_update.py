@@ -1,10 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import time, os, logging, json, glob, re, socket, requests
+import time, os, logging, json, socket
 from datetime import datetime
 from threading import Thread, Lock
-from collections import deque
 from types import SimpleNamespace
 
 import tkinter as tk
@@ -13,9 +12,9 @@ from tkinter import font
 import threading
 
 import numpy as np
-import alsaaudio as alsa
-import soundfile as sf
-import tempfile
+
+from startup import configure_matplotlib_cache
+configure_matplotlib_cache(os.path.dirname(os.path.abspath(__file__)))
 
 # Import matplotlib libraries
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
@@ -24,20 +23,20 @@ import matplotlib.patches as patches
 from matplotlib.figure import Figure
 from matplotlib import style
 
-from utils import segment_cough
+from utils import segment_cough, PcmConverter, RingBuffer, WaveformDecimator
+from workers import AnalysisExecutor
+from audio_source import create_source, CaptureLifecycle
+from config_cache import ConfigCache, autocough_params, patient_nik
+from gpio_input import GpioInput
+from recording_index import RecordingIndex
+from upload_queue import UploadQueue
+from uploader import Uploader
+from audio_codec import AudioCodec
 
 os.makedirs("Recorded_Data/automatic", exist_ok=True)
 os.makedirs("Recorded_Data/soliced", exist_ok=True)
 os.makedirs("logs/", exist_ok=True)
 
-json_path = 'Recorded_Data/last_send.json'
-if not os.path.exists(json_path):
-    with open(json_path, 'w') as outfile:
-        json.dump({
-            "last_send_automatic": None,
-            "last_send_soliced": None,
-        }, outfile)
-
 timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
 log_filename = f"log_{timestamp}.log"
 
@@ -68,15 +67,27 @@ class CoughTk():
     STEP_DURATION = WINDOW_DURATION - OVERLAP_DURATION
 
     DEVICE_SOUND =  GLOBAL_CONFIG.DEVICE_SOUND # 'dmic_sv' "plughw:2,0"
+    AUDIO_SOURCE = getattr(GLOBAL_CONFIG, 'AUDIO_SOURCE', 'alsa') # "alsa", "file:<path>" or "synthetic"
+    CAPTURE_CHANNEL = getattr(GLOBAL_CONFIG, 'CAPTURE_CHANNEL', None) # only use this channel instead of the mean of all
     BTN1_FILE =  GLOBAL_CONFIG.BTN1_FILE # "gpio12" "/sys/class/gpio/gpio5/value"
     BTN2_FILE =  GLOBAL_CONFIG.BTN2_FILE # "gpio12" "/sys/class/gpio/gpio5/value"
     BTN3_FILE =  GLOBAL_CONFIG.BTN3_FILE # "gpio12" "/sys/class/gpio/gpio6/value"
     BTN4_FILE =  GLOBAL_CONFIG.BTN4_FILE # "gpio12" "/sys/class/gpio/gpio6/value"
     RECORD_LENGTH = int(GLOBAL_CONFIG.RECORD_LENGTH * SAMPLE_RATE)
+    MAX_RECORD_DURATION = 300 # seconds, a manual recording stops by itself once the buffer is full
     AUDIO_POINT_START = round(0.3 * SAMPLE_RATE)
 
     SERVER_DOMAIN = GLOBAL_CONFIG.SERVER_DOMAIN
     DEVICE_ID = GLOBAL_CONFIG.DEVICE_ID
+    CAPTURE_PAGES = (2, 3) # pages that use the microphone
+    ANALYSIS_WORKERS = getattr(GLOBAL_CONFIG, 'ANALYSIS_WORKERS', 1)
+    ANALYSIS_PROCESSES = getattr(GLOBAL_CONFIG, 'ANALYSIS_PROCESSES', False)
+    RECORDING_CODEC = getattr(GLOBAL_CONFIG, 'RECORDING_CODEC', 'flac') # "wav", "flac", "flac16", "flac16k" or "opus16k", see audio_codec.py
+    UPLOAD_WORKERS = getattr(GLOBAL_CONFIG, 'UPLOAD_WORKERS', 4) # concurrent uploads of queued recordings
+    UPLOAD_RATE = getattr(GLOBAL_CONFIG, 'UPLOAD_RATE', 2.0) # uploads started per second at most
+    UPLOAD_BATCH_URL = getattr(GLOBAL_CONFIG, 'UPLOAD_BATCH_URL', None) # batch endpoint taking many recordings per request, None for one per file
+    UPLOAD_BATCH_SIZE = getattr(GLOBAL_CONFIG, 'UPLOAD_BATCH_SIZE', 32) # recordings per batch request
+    GPIO_POLL_INTERVAL = getattr(GLOBAL_CONFIG, 'GPIO_POLL_INTERVAL', 0.1) # seconds between reads of buttons without edge interrupts
 
     def __init__(self):
         super(CoughTk, self).__init__()
@@ -103,6 +114,7 @@ class CoughTk():
 
         self.start_background_processes()
         self.window.mainloop()
+        self.stop_background_processes()
 
     def init_variables(self):
         """Initialize shared variables for both pages"""
@@ -127,7 +139,7 @@ class CoughTk():
         self.battery_status.set("🔋100%")
         
         # Audio processing variables
-        self.audio_buffer = deque()
+        self.audio_buffer = RingBuffer(self.MAX_RECORD_DURATION * self.SAMPLE_RATE)
         self.buffer_lock = Lock()
         self.next_time = time.time()
         self.RECORD_FLAG = False
@@ -138,11 +150,41 @@ class CoughTk():
         self.buffer_size = int(self.STEP_DURATION * self.SAMPLE_RATE)
         self.window_size = int(self.WINDOW_DURATION * self.SAMPLE_RATE)
 
+        # Persistent workers instead of a new Thread per analysis step / recording. Analysis windows
+        # coalesce when the workers fall behind, recordings to save are never dropped
+        self.analysis_pool = AnalysisExecutor("analysis", workers=self.ANALYSIS_WORKERS, maxsize=16,
+                                              policy='coalesce', use_processes=self.ANALYSIS_PROCESSES)
+        self.recording_pool = AnalysisExecutor("recording", workers=1, maxsize=None)
+        self.window_buffer = RingBuffer(self.window_size)
+
+        # autocough_config.json and current_patient.json are reloaded by a watcher when they change
+        self.config_cache = ConfigCache(poll_interval=1.0)
+        self.config_cache.watch('autocough', 'autocough_config.json', parse=autocough_params)
+        self.config_cache.watch('patient', '/home/alarm/web_panel/data/current_patient.json')
+
+        # Buttons: presses arrive as events, recording requests are picked up by record_audio_loop
+        self.gpio = GpioInput(debounce=0.05, poll_interval=self.GPIO_POLL_INTERVAL)
+        for name, path in (('btn1', self.BTN1_FILE), ('btn2', self.BTN2_FILE), ('btn3', self.BTN3_FILE), ('btn4', self.BTN4_FILE)):
+            self.gpio.add_button(name, path)
+        self.gpio.subscribe(None, self.on_button_press)
+        self.record_requests = {'start': threading.Event(), 'stop': threading.Event()}
+
+        # File counts and next file numbers for the recording folders
+        self.recording_index = RecordingIndex("Recorded_Data", codec=AudioCodec(self.RECORDING_CODEC))
+        # Recordings waiting for upload, replaces the lists in last_send.json
+        self.upload_queue = UploadQueue("Recorded_Data/upload_queue.db", legacy_json="Recorded_Data/last_send.json")
+        self.uploader = Uploader(f"{self.SERVER_DOMAIN}/api/device/sendData_TBPrimer/{self.DEVICE_ID}", self.upload_queue,
+                                 fields=self.upload_fields, workers=self.UPLOAD_WORKERS, rate=self.UPLOAD_RATE, burst=self.UPLOAD_WORKERS,
+                                 batch_url=self.UPLOAD_BATCH_URL, batch_size=self.UPLOAD_BATCH_SIZE)
+
         # Initialize a
         # udio system
-        self.pcm = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL,
-                       channels=self.CHANNELS, rate=self.SAMPLE_RATE, format=alsa.PCM_FORMAT_S16_LE,
-                       periodsize=self.PERIOD_SIZE, device=self.DEVICE_SOUND)
+        self.audio_source = create_source(self.AUDIO_SOURCE, device=self.DEVICE_SOUND, rate=self.SAMPLE_RATE,
+                                          channels=self.CHANNELS, period_size=self.PERIOD_SIZE)
+        self.converter = PcmConverter(self.audio_source.channels, self.PERIOD_SIZE, channel=self.CAPTURE_CHANNEL)
+        # The microphone only runs while a page that uses it is visible
+        self.capture = CaptureLifecycle(self.audio_source, active=self.current_page in self.CAPTURE_PAGES,
+                                        on_transition=self.on_capture_transition)
 
     def create_status_bar(self, parent_frame):
         """Create a universal status bar for all pages"""
@@ -410,13 +452,7 @@ class CoughTk():
         self.waveform_samples = int(self.waveform_duration * self.SAMPLE_RATE)  # Total samples for 2 seconds
         self.downsample_ratio = self.waveform_samples // self.waveform_length  # ~88 samples per point
         self.X = np.arange(0, self.waveform_length, 1)
-        self.Y_buffer = deque(maxlen=self.waveform_length)
-        self.audio_accumulator = deque(maxlen=self.waveform_samples)  # Raw audio buffer for 2 seconds
-        # Initialize with zeros
-        for _ in range(self.waveform_length):
-            self.Y_buffer.append(0.0)
-        for _ in range(self.waveform_samples):
-            self.audio_accumulator.append(0.0)
+        self.waveform_decimator = WaveformDecimator(self.downsample_ratio, self.waveform_length)
         # Example Figure Plot
         self.fig2 = Figure(figsize=(5, 2.5), dpi=96,facecolor='black')
         self.ax2 = self.fig2.add_subplot(111)
@@ -426,14 +462,12 @@ class CoughTk():
         self.ax2.grid(True, which='both', ls='-', color='#333333')
         self.ax2.set_ylim(-0.2, 0.2)
         self.ax2.set_xlim(0, len(self.X) - 1)
-        self.line2, = self.ax2.plot(self.X, list(self.Y_buffer), color='cyan', linewidth=1)
+        self.line2, = self.ax2.plot(self.X, self.waveform_decimator.values(), color='cyan', linewidth=1)
         style.use('ggplot')
         self.canvas2 = FigureCanvasTkAgg(self.fig2, master=self.graphfrm2)
         self.canvas2.draw()
         self.canvas2.get_tk_widget().pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.graphfrm2.pack(side=tk.BOTTOM)
-        self.downsample_counter = 0
-        self.downsample_accumulator = 0.0
 
     def create_prediction_page(self):
         """Create the prediction page with cough TB classification"""
@@ -592,6 +626,7 @@ class CoughTk():
             self.prediction_frame.pack_forget()
             self.info_frame.pack(fill=tk.BOTH, expand=True)
             self.current_page = 4
+        self.capture.set_active(self.current_page in self.CAPTURE_PAGES)
 
     def configure_dark_theme(self):
         """Configure dark theme for all elements"""
@@ -663,10 +698,18 @@ class CoughTk():
         Thread(target=self.getinternetstatsprocess, daemon=True).start()
         Thread(target=self.getipprocess, daemon=True).start()
         Thread(target=self.getCoughCount, daemon=True).start()
-        Thread(target=self.button_navigation_loop, daemon=True).start()
+        self.config_cache.start()
+        self.gpio.start()
         Thread(target=self.record_audio_loop, daemon=True).start()
             
 
+    def stop_background_processes(self):
+        """Let queued analysis steps and recordings finish before exiting"""
+        self.gpio.stop()
+        self.uploader.close()
+        self.analysis_pool.shutdown(wait=True, timeout=10)
+        self.recording_pool.shutdown(wait=True, timeout=30)
+
     def getwlanip(self):
         # wlp3s0 wlan0
         ipv4 = os.popen(
@@ -682,58 +725,32 @@ class CoughTk():
             self.EdgeIP.set("📡" + ipstring)
             time.sleep(10)
 
-    def button_navigation_loop(self):
-        """Handle button navigation between pages"""
-        btn1_last_state = '1'
-        btn2_last_state = '1'
-        btn3_last_state = '1'
-        btn4_last_state = '1'
-        while True:
-            try:
-                with open(self.BTN1_FILE, "r") as f:
-                    btn1_current = f.read().strip()
-                with open(self.BTN2_FILE, "r") as f:
-                    btn2_current = f.read().strip()
-                with open(self.BTN3_FILE, "r") as f:
-                    btn3_current = f.read().strip()
-                with open(self.BTN4_FILE, "r") as f:
-                    btn4_current = f.read().strip()
-                
-                # Button 1 Navigation Logic
-                if btn1_current == '0' and btn1_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(2)
-                    with open(self.BTN1_FILE, "w") as f:
-                        f.write('1')
-                        
-                # Button 2 Navigation Logic
-                if btn2_current == '0' and btn2_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(3)
-                    with open(self.BTN2_FILE, "w") as f:
-                        f.write('1')
-                
-                # Button 3 Navigation Logic
-                if btn3_current == '0' and btn3_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(4)
-                    with open(self.BTN3_FILE, "w") as f:
-                        f.write('1')
-                
-                # Button 4 Navigation Logic
-                if btn4_current == '0' and btn4_last_state == '1':
-                    if self.current_page in [2, 3, 4]:
-                        self.show_page(1)
-                    with open(self.BTN4_FILE, "w") as f:
-                        f.write('1')
-
-                btn1_last_state = btn1_current
-                btn2_last_state = btn2_current
-                btn3_last_state = btn3_current
-                btn4_last_state = btn4_current
-            except Exception as e:
-                logging.error(f"[ERROR] Button navigation error: {e}")
-            time.sleep(0.1)
+    def on_button_press(self, name):
+        """Page navigation and recording control, called on the GPIO thread"""
+        page = self.current_page
+        if name == 'btn1':
+            if page == 1:
+                self.show_page(2)
+            elif page in [2, 3] and not self.RECORD_FLAG:
+                self.record_requests['start'].set()
+        elif name == 'btn2':
+            if page == 1:
+                self.show_page(3)
+            elif self.RECORD_FLAG:
+                self.record_requests['stop'].set()
+        elif name == 'btn3':
+            if page == 1:
+                self.show_page(4)
+        elif name == 'btn4':
+            if page in [2, 3, 4]:
+                self.show_page(1)
+
+    def take_record_request(self, kind):
+        request = self.record_requests[kind]
+        if request.is_set():
+            request.clear()
+            return True
+        return False
 
     def getinternetstatsprocess(self, host="8.8.8.8", port=53, timeout=3):
         while True:
@@ -749,8 +766,8 @@ class CoughTk():
     def sendcoughdataprocess(self):
         while True:
             if self.internet_status.get() == "Online" and GLOBAL_CONFIG.SEND_COUGH == True:
-                #self.send_one_data_server("last_send_automatic", "cough", "automatic")
-                self.send_one_data_server("last_send_soliced", "solic", "soliced")
+                #self.uploader.drain("automatic")
+                self.uploader.drain("soliced")
 
             time.sleep(5)
 
@@ -780,32 +797,20 @@ class CoughTk():
             self.txtrecord.set(f"Recording: {hours:02d}:{minutes:02d}:{seconds:02d}")
             time.sleep(1)
 
+    def current_patient_nik(self):
+        return str(patient_nik(self.config_cache.get("patient")))
+
     def getCoughCount(self):
         while True:
-            autocoughcount = len(next(os.walk("Recorded_Data/automatic"))[2])
-            solicoughcount = 0
-            try:
-                with open('/home/alarm/web_panel/data/current_patient.json') as pf:
-                    patient = json.load(pf)
-                    patient_nik = patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
-                    if not patient_nik:
-                        patient_nik = "unknown"
-                
-                patient_dir = os.path.join("Recorded_Data", "soliced", str(patient_nik))
-                if os.path.exists(patient_dir):
-                    solicoughcount = len(next(os.walk(patient_dir))[2])
-            except Exception as e:
-                logging.warning(f"[WARNING] Could not read current_patient.json or count files: {e}")
-                try:
-                    solicoughcount = len(next(os.walk("Recorded_Data/soliced"))[2])
-                except:
-                    solicoughcount = 0
+            # Index lookups, the folders are only listed again if they changed behind our back
+            autocoughcount = self.recording_index.count("automatic")
+            solicoughcount = self.recording_index.count(os.path.join("soliced", self.current_patient_nik()))
 
             self.solicoughcount.set(f"Longi: {autocoughcount} |-| Solic: {solicoughcount}")
             time.sleep(3)
 
     def graphupdate(self, _):
-        self.line2.set_ydata(list(self.Y_buffer))
+        self.line2.set_ydata(self.waveform_decimator.values())
         return (self.line2,)
     
     def do_updatefigure(self, ignore_cooldown=False):
@@ -819,125 +824,98 @@ class CoughTk():
                 self.fig.canvas.flush_events()
                 self.last_updateFigure = time.time()
 
+    def on_capture_transition(self, active):
+        """Capture was suspended or resumed, the analysis window must not mix audio from before"""
+        with self.buffer_lock:
+            self.window_buffer.clear()
+        self.next_time = time.time()
+
     def record_audio_loop(self):
         while True:
-            if self.current_page == 2 or self.current_page == 3:
-                length, data = self.pcm.read()
-                if length > 0:
-                    audio_data = np.frombuffer(data, dtype=np.int16)
-                    audio_data = audio_data.reshape(-1, self.CHANNELS)
-                    mono = np.mean(audio_data, axis=1).astype(np.float32) / 32768.0
+            length, data = self.capture.read()
+            if length > 0:
+                # Periods are consumed before the next read, two recycled buffers are enough
+                period = self.converter.convert(data)
+                mono = period.samples
+
+                if period.silent:
+                    self.patch_plot.set_facecolor('red')
+                    self.do_updatefigure(ignore_cooldown=True)
+                    time.sleep(0.01)
+                    continue
                     
-                    if np.all(mono == 0):
-                        self.patch_plot.set_facecolor('red')
-                        self.do_updatefigure(ignore_cooldown=True)
-                        time.sleep(0.01)
-                        continue
-                        
-                    if self.RECORD_FLAG:
-                        with self.buffer_lock:
-                            self.audio_buffer.extend(mono)
-                            if self.RECORD_LENGTH > 1000:
-                                should_stop = len(self.audio_buffer) >= self.RECORD_LENGTH
-                            else:
-                                with open(self.BTN2_FILE, "r") as stt:
-                                    RecSttop = stt.read().strip()
-                                should_stop = RecSttop == '0'
-                                if should_stop:
-                                    with open(self.BTN2_FILE, "w") as out:
-                                        out.write('1')
-                                        
-                            if self.recording_start_time and not self.recording_time_thread:
-                                self.start_recording_time_update()
-                                
-                            if should_stop:
-                                data_np = np.array(self.audio_buffer, dtype=np.float32)
-                                self.RECORD_FLAG = False
-                                self.recording_start_time = None
-
-                                logging.info(f"[DEBUG] Recording stopped. Buffer length: {len(self.audio_buffer)}, RECORD_LENGTH: {self.RECORD_LENGTH}")
-
-                                self.txtrecord.set("Recording: Automatic")
-                                self.patch_plot.set_facecolor('blue')
-                                self.do_updatefigure(ignore_cooldown=True)
+                if self.RECORD_FLAG:
+                    with self.buffer_lock:
+                        self.audio_buffer.write(mono)
+                        if self.RECORD_LENGTH > 1000:
+                            should_stop = len(self.audio_buffer) >= self.RECORD_LENGTH
+                        else:
+                            should_stop = self.take_record_request('stop')
 
-                                t = Thread(target=self.handle_record_soli, args=(data_np.copy(),))
-                                t.start()
-                                self.next_time = time.time()
-                                self.audio_buffer.clear()
-                    else:
-                        for sample in mono:
-                            self.audio_accumulator.append(sample)
-                            self.downsample_accumulator += sample
-                            self.downsample_counter += 1
-                            if self.downsample_counter >= self.downsample_ratio:
-                                avg_sample = self.downsample_accumulator / self.downsample_counter
-                                self.Y_buffer.append(avg_sample)
-                                self.downsample_counter = 0
-                                self.downsample_accumulator = 0.0
-
-                        with open(self.BTN1_FILE, "r") as stt:
-                            RecStt = stt.read().strip()
-
-                        if RecStt == '0':
-                            logging.info("Button press detected, starting manual recording")
-                            with open(self.BTN1_FILE, "w") as out:
-                                out.write('1')
-                            self.audio_buffer.clear()
-                            self.RECORD_FLAG = True
-                            self.recording_start_time = time.time()
+                        if self.audio_buffer.full and not should_stop:
+                            logging.warning(f"[WARNING] Recording reached {self.MAX_RECORD_DURATION}s, stopping")
+                            should_stop = True
+                                    
+                        if self.recording_start_time and not self.recording_time_thread:
                             self.start_recording_time_update()
+                            
+                        if should_stop:
+                            data_np = self.audio_buffer.read_latest()
+                            self.RECORD_FLAG = False
+                            self.recording_start_time = None
 
-                            logging.info(f"[DEBUG] Recording started. Buffer cleared. RECORD_FLAG: {self.RECORD_FLAG}")
+                            logging.info(f"[DEBUG] Recording stopped. Buffer length: {len(self.audio_buffer)}, RECORD_LENGTH: {self.RECORD_LENGTH}")
 
-                            self.txtrecord.set("Recording: 00:00:00")
-                            self.patch_plot.set_facecolor('yellow')
+                            self.txtrecord.set("Recording: Automatic")
+                            self.patch_plot.set_facecolor('blue')
                             self.do_updatefigure(ignore_cooldown=True)
-                        else:
-                            if self.current_page == 2:
+
+                            self.recording_pool.submit(self.handle_record_soli, data_np)
+                            self.next_time = time.time()
+                            self.audio_buffer.clear()
+                else:
+                    self.waveform_decimator.process(mono)
+
+                    if self.take_record_request('start'):
+                        logging.info("Button press detected, starting manual recording")
+                        self.record_requests['stop'].clear()
+                        self.audio_buffer.clear()
+                        self.RECORD_FLAG = True
+                        self.recording_start_time = time.time()
+                        self.start_recording_time_update()
+
+                        logging.info(f"[DEBUG] Recording started. Buffer cleared. RECORD_FLAG: {self.RECORD_FLAG}")
+
+                        self.txtrecord.set("Recording: 00:00:00")
+                        self.patch_plot.set_facecolor('yellow')
+                        self.do_updatefigure(ignore_cooldown=True)
+                    else:
+                        if self.current_page == 2:
+                            with self.buffer_lock:
+                                self.window_buffer.write(mono)
+
+                            current_gaptime = time.time() - self.next_time
+                            if self.window_buffer.full and current_gaptime >= self.STEP_DURATION:
                                 with self.buffer_lock:
-                                    self.audio_buffer.extend(mono)
-                                    while len(self.audio_buffer) > self.window_size:
-                                        self.audio_buffer.popleft()
-
-                                current_gaptime = time.time() - self.next_time
-                                if len(self.audio_buffer) >= self.window_size and current_gaptime >= self.STEP_DURATION:
-                                    with self.buffer_lock:
-                                        data_np = np.array(self.audio_buffer, dtype=np.float32)
-            
-                                    self.next_time += self.STEP_DURATION #= time.time()
+                                    data_np = self.window_buffer.read_latest()
+        
+                                self.next_time += self.STEP_DURATION #= time.time()
 
-                                    self.patch_plot.set_facecolor('blue')
-                                    self.do_updatefigure()
+                                self.patch_plot.set_facecolor('blue')
+                                self.do_updatefigure()
 
-                                    t = Thread(target=self.handle_record_auto,
-                                            args=(data_np.copy(),))
-                                    t.start()
-                                
+                                # Only the newest window is worth analysing if the workers fall behind
+                                self.analysis_pool.submit(self.handle_record_auto, data_np, key='auto_window')
+                            
 
-                    time.sleep(0.01)
-                else:
-                    time.sleep(0.01)
+                time.sleep(0.01)
 
     def handle_record_auto(self, audio_np):
         audio_np = audio_np[self.AUDIO_POINT_START:]
 
-        with open('autocough_config.json') as config_file:
-            cough_config = json.load(config_file)
-        
-        # Extract parameters with defaults
-        cough_padding = cough_config.get('cough_padding', 0.2)
-        min_cough_len = cough_config.get('min_cough_len', 0.2)
-        th_l_multiplier = cough_config.get('th_l_multiplier', 0.02)
-        th_h_multiplier = cough_config.get('th_h_multiplier', 1)
-        adaptive_method = cough_config.get('adaptive_method', 'default')
-    
-        coughSegments, cough_mask = segment_cough(audio_np, self.SAMPLE_RATE, 
-                                                cough_padding=cough_padding, 
-                                                min_cough_len=min_cough_len,
-                                                th_l_multiplier=th_l_multiplier, 
-                                                th_h_multiplier=th_h_multiplier, 
-                                                adaptive_method=adaptive_method)
+        # Snapshot of autocough_config.json kept up to date by the config cache
+        cough_config = self.config_cache.get('autocough', autocough_params({}))
+        coughSegments, cough_mask = self.analysis_pool.run_cpu(segment_cough, audio_np, self.SAMPLE_RATE, **cough_config)
 
         if len(coughSegments) > 0:
             logging.info(f"[INFO] Detected Cough: {len(coughSegments)}")
@@ -948,11 +926,7 @@ class CoughTk():
             self.patch_plot.set_facecolor('green')
             self.do_updatefigure(ignore_cooldown=True)
 
-            onlyfiles = next(os.walk("Recorded_Data/automatic"))[2]
-            cough_count = len(onlyfiles) + 1
-            now_cough = now_cough.astype(np.float32)
-            timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-            sf.write(f'Recorded_Data/automatic/{timestamp}_{cough_count}.wav', now_cough, self.SAMPLE_RATE, 'PCM_24')
+            self.recording_index.save("automatic", now_cough.astype(np.float32), self.SAMPLE_RATE)
                 #self.last_cough_np = now_cough
 
     def handle_record_soli(self, audio_np):
@@ -962,36 +936,16 @@ class CoughTk():
                 logging.warning("[WARNING] Empty audio data for solicited recording")
                 return
 
-            patient_nik = "unknown"
-            try:
-                with open('/home/alarm/web_panel/data/current_patient.json') as pf:
-                    patient = json.load(pf)
-                    patient_nik = patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
-                    if not patient_nik:
-                        patient_nik = "unknown"
-            except Exception as e:
-                logging.warning(f"[WARNING] Could not read current_patient.json: {e}")
-
-            # ensure patient-specific folder exists
-            patient_dir = os.path.join("Recorded_Data", "soliced", str(patient_nik))
-            os.makedirs(patient_dir, exist_ok=True)
-
-            onlyfiles = []
-            try:
-                onlyfiles = next(os.walk(patient_dir))[2]
-            except StopIteration:
-                onlyfiles = []
-            cough_count = len(onlyfiles) + 1
-            
+            patient_nik = self.current_patient_nik()
+
+            # the index creates the patient-specific folder
             audio_np = audio_np[self.AUDIO_POINT_START:]
-            timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-            filename = f'{timestamp}_{cough_count}.wav'
-            filepath = os.path.join(patient_dir, filename)
-            sf.write(filepath, audio_np, self.SAMPLE_RATE, 'PCM_24')
+            filepath = self.recording_index.save(os.path.join("soliced", str(patient_nik)), audio_np, self.SAMPLE_RATE)
+            filename = os.path.basename(filepath)
             
             logging.info(f"[INFO] Saved solicited recording: {filename}")
             rel_path = os.path.join(str(patient_nik), filename)
-            self.append_to_lastsend_json("last_send_soliced", rel_path)
+            self.upload_queue.enqueue("soliced", rel_path)
         except Exception as e:
             logging.error(f"[ERROR] Failed to save solicited recording: {e}")
 
@@ -1000,81 +954,11 @@ class CoughTk():
             return 0.0
         return np.mean(a == b)
 
-    def read_lastsend_json(self):
-        with open('Recorded_Data/last_send.json') as data_file:    
-            last_send_json = json.load(data_file)
-
-        return last_send_json
-
-    def modify_lastsend_json(self, last_send_json):
-        with open('Recorded_Data/last_send.json', 'w') as outfile:
-            json.dump(last_send_json, outfile)
-
-    def append_to_lastsend_json(self, key, filename):
-        last_send_json = self.read_lastsend_json()
-        if key not in last_send_json or not isinstance(last_send_json[key], list):
-            last_send_json[key] = []
-        if filename not in last_send_json[key]:
-            last_send_json[key].append(filename)
-        self.modify_lastsend_json(last_send_json)
-
-    def remove_from_lastsend_json(self, key, filename):
-        last_send_json = self.read_lastsend_json()
-        if key in last_send_json and filename in last_send_json[key]:
-            last_send_json[key].remove(filename)
-        self.modify_lastsend_json(last_send_json)
-
-    def send_one_data_server(self, current_key_send, file_prefix, folder_send):
-        last_send_json = self.read_lastsend_json()
-        files_to_send = last_send_json.get(current_key_send, [])
-        files_sorted = sorted(files_to_send, key=lambda x: int(re.search(r'_(\d+)\.wav$', x).group(1)) if re.search(r'_(\d+)\.wav$', x) else 0)
-
-        for nowfile_base in files_sorted:
-            nowfile = f'Recorded_Data/{folder_send}/{nowfile_base}'
-            if os.path.exists(nowfile):
-                logging.warning(f"[SENDING]: {nowfile}")
-
-                patient_nik = "unknown"
-                if '/' in nowfile_base:
-                    patient_nik = nowfile_base.split('/')[0]
-                elif folder_send == "soliced":
-                    path_parts = nowfile.split('/')
-                    if len(path_parts) >= 3:
-                        patient_nik = path_parts[-2]
-
-                try:
-                    with open(nowfile, 'rb') as f:
-                        response = requests.post(
-                            f"{self.SERVER_DOMAIN}/api/device/sendData_TBPrimer/{self.DEVICE_ID}", 
-                            files={'file_batuk': f}, 
-                            data={'nama': 'pasien', 'gender': 'unknown', 'umur': 0, 'cough_type': file_prefix, 'nik': patient_nik},
-                            timeout=30
-                        )
-                    logging.warning(f"[SENDING_STATUS]: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        try:
-                            response_json = response.json()
-                            if response_json.get('status') == 'success':
-                                self.remove_from_lastsend_json(current_key_send, nowfile_base)
-                                logging.warning(f"[SUCCESS] File sent successfully: {nowfile_base}")
-                            else:
-                                logging.warning(f"[WARNING] Server returned error: {response_json}")
-                        except json.JSONDecodeError:
-                            logging.warning(f"[WARNING] Invalid JSON response: {response.text}")
-                    else:
-                        logging.warning(f"[WARNING] Error Send File To Server: {response.status_code} - {response.text}")
-                        
-                except requests.exceptions.Timeout:
-                    logging.warning(f"[ERROR] Request timeout for file: {nowfile}")
-                except requests.exceptions.ConnectionError:
-                    logging.warning(f"[ERROR] Connection error for file: {nowfile}")
-                except requests.exceptions.RequestException as e:
-                    logging.warning(f"[ERROR] Request failed for file {nowfile}: {e}")
-                except Exception as e:
-                    logging.warning(f"[ERROR] Unexpected error sending file {nowfile}: {e}")
-
-                time.sleep(2)
+    def upload_fields(self, queue, name):
+        """Form fields sent with a queued recording, name is "<nik>/<file>" for solicited ones"""
+        patient_nik = name.split('/')[0] if '/' in name else "unknown"
+        cough_type = "solic" if queue == "soliced" else "cough"
+        return {'nama': 'pasien', 'gender': 'unknown', 'umur': 0, 'cough_type': cough_type, 'nik': patient_nik}
 
 if __name__ == "__main__":
     cough = CoughTk()
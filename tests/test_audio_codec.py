@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""EncodedStream against AudioCodec.encode: patched headers, precomputed length, decoded samples"""
+
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_codec import AudioCodec
+from uploader import MultipartBody
+from audio_source import synthetic_cough_signal
+
+FS = 44100
+
+
+@pytest.fixture(scope='module')
+def audio():
+    return synthetic_cough_signal(np.random.default_rng(0), duration=3.0, fs=FS, n_coughs=2)
+
+
+@pytest.mark.parametrize("duration", [0.01, 1.0, 3.0])
+@pytest.mark.parametrize("block_size", [1000, 16384])
+def test_wav_stream_equals_encode(audio, duration, block_size):
+    """Short recordings patch the header at the end, longer ones as soon as it went out"""
+    codec = AudioCodec('wav')
+    x = audio[:int(duration * FS)]
+    stream = codec.stream(x, FS, block_size=block_size)
+    data = b''.join(stream)
+    assert data == codec.encode(x, FS)
+    assert stream.length == len(data)
+    assert stream.bytes_out == len(data)
+    assert stream.progress == 1.0
+
+
+def test_odd_wav_data_is_padded(audio):
+    codec = AudioCodec('wav')
+    stream = codec.stream(audio[:FS // 10 + 1], FS)
+    data = b''.join(stream)
+    assert stream.length == len(data) == len(codec.encode(audio[:FS // 10 + 1], FS))
+
+
+def test_multipart_content_length(audio):
+    stream = AudioCodec('wav').stream(audio, FS, block_size=5000)
+    body = MultipartBody([('nama', 'pasien')], [('file_batuk', 'cough.wav', stream, 'audio/wav')])
+    data = body.request_data()
+    assert len(data) == len(b''.join(data))
+
+
+@pytest.mark.parametrize("name", ['flac', 'flac16', 'flac16k'])
+def test_flac_stream_decodes_to_the_same_samples(audio, name):
+    codec = AudioCodec(name)
+    stream = codec.stream(audio, FS, block_size=7000)
+    assert stream.length is None
+    streamed, rate = sf.read(io.BytesIO(b''.join(stream)), dtype='float32')
+    encoded, encoded_rate = sf.read(io.BytesIO(codec.encode(audio, FS)), dtype='float32')
+    assert rate == encoded_rate == stream.rate
+    # The patched STREAMINFO sample count
+    assert sf.info(io.BytesIO(b''.join(codec.stream(audio, FS)))).frames == stream.frames == len(encoded)
+    assert np.array_equal(streamed, encoded)
+
+
+def test_opus_stream_decodes(audio):
+    codec = AudioCodec('opus16k')
+    stream = codec.stream(audio, FS, block_size=7000)
+    streamed, rate = sf.read(io.BytesIO(b''.join(stream)), dtype='float32')
+    encoded, _ = sf.read(io.BytesIO(codec.encode(audio, FS)), dtype='float32')
+    assert rate == 16000
+    assert len(streamed) == len(encoded)
+    np.testing.assert_allclose(streamed, encoded, atol=1e-3)
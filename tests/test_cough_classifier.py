@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Streaming classification against whole-recording predict() and MelFrontend"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from cough_classifier import (CoughClassifier, MelCache, MelFrontend, SR_MODEL, hop_samples,
+                              detection_intervals)
+from audio_source import synthetic_cough_signal
+
+
+class MeanSession():
+    """Stands in for the ONNX session: the cough probability is the mean of the model input"""
+
+    def get_inputs(self):
+        return [SimpleNamespace(name='input', shape=['batch', 64, 64])]
+
+    def run(self, outputs, feeds):
+        mean = feeds['input'].mean(axis=(1, 2))
+        return [np.stack([1 - mean, mean], axis=1)]
+
+
+def stream(classifier, audio, chunk):
+    starts, probs = [], []
+    for i in range(0, len(audio), chunk):
+        s, p = classifier.predict_stream(audio[i:i + chunk])
+        starts.append(s)
+        probs.append(p)
+    return np.concatenate(starts), np.concatenate(probs)
+
+
+@pytest.fixture(scope='module')
+def audio():
+    return synthetic_cough_signal(np.random.default_rng(0), duration=6.0, fs=SR_MODEL, n_coughs=3)
+
+
+@pytest.mark.parametrize("window_hop", [hop_samples, 512, 1024])
+@pytest.mark.parametrize("chunk", [372, 5923])
+def test_melcache_matches_frontend(audio, window_hop, chunk):
+    frontend = MelFrontend()
+    cache = MelCache(frontend, window_hop)
+    out = np.empty((16, 64, 64), dtype=np.float32)
+    for i in range(0, len(audio), chunk):
+        cache.push(audio[i:i + chunk])
+        while cache.ready():
+            starts = cache.pop(out)
+            np.testing.assert_allclose(out[:len(starts)], frontend.transform(audio, starts), atol=1e-5)
+    assert cache.next_start > len(audio) - frontend.window - window_hop
+
+
+@pytest.mark.parametrize("window_hop", [hop_samples, 1024])
+def test_stream_matches_predict(audio, window_hop):
+    classifier = CoughClassifier(MeanSession(), batch_size=8, window_hop=window_hop)
+    starts, probs = classifier.predict(audio)
+    stream_starts, stream_probs = stream(classifier, audio, 1111)
+    n = min(len(starts), len(stream_starts))
+    assert n >= len(starts) - 1
+    assert np.array_equal(stream_starts[:n], starts[:n])
+    np.testing.assert_allclose(stream_probs[:n], probs[:n], atol=1e-5)
+
+    # The stream continues where it stopped until reset_stream()
+    assert classifier.predict_stream(audio[:1000])[0][0] > starts[-1]
+    classifier.reset_stream()
+    assert classifier.predict_stream(audio)[0][0] == 0
+
+
+def test_detect_stream_matches_detection_intervals(audio):
+    classifier = CoughClassifier(MeanSession(), window_hop=hop_samples)
+    starts, probs = classifier.predict(audio)
+    classifier.threshold = float(np.percentile(probs, 70))
+    seg_starts, seg_ends = detection_intervals(starts[probs > classifier.threshold], classifier.frontend.window,
+                                               len(audio) + classifier.frontend.window)
+
+    classifier.reset_stream()
+    intervals = []
+    for i in range(0, len(audio), 1470):
+        intervals += classifier.detect_stream(audio[i:i + 1470])
+    assert len(intervals) > 1
+    # Only a run still open at the end of the stream is not reported
+    assert intervals == list(zip(seg_starts.tolist(), seg_ends.tolist()))[:len(intervals)]
+    assert len(intervals) >= len(seg_starts) - 1
+
+
+def test_short_window_needs_interior_frames_only_when_shared():
+    frontend = MelFrontend(window=1100, n_fft=2048)
+    audio = np.random.default_rng(0).standard_normal(5000).astype(np.float32)
+    cache = MelCache(frontend, hop_samples)
+    cache.push(audio)
+    out = np.empty((8, 64, 64), dtype=np.float32)
+    starts = cache.pop(out)
+    np.testing.assert_allclose(out[:len(starts)], frontend.transform(audio, starts), atol=1e-5)
+    with pytest.raises(ValueError):
+        MelCache(frontend, 512)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""detection_intervals against the original sample mask stage of process_audio_with_original"""
+
+import numpy as np
+import pytest
+
+from cough_classifier import SR_MODEL, window_samples, hop_samples, detection_intervals, intervals_to_mask
+
+
+def detection_segments_reference(audio_orig, sr_orig, audio_len, starts, cough_mask_windows, min_cough_samples=0.0, padding=0.0):
+    """Original sample mask stage of process_audio_with_original, kept as the reference for detection_intervals"""
+    min_cough_samples = int(min_cough_samples * SR_MODEL)
+    padding = int(padding * SR_MODEL)
+
+    cough_mask_samples = np.zeros(audio_len, dtype=bool)
+    sel = np.nonzero(cough_mask_windows)[0]
+    if len(sel) > 0:
+        win_idx = np.arange(window_samples)
+        idx = starts[sel, None] + win_idx[None, :]
+        idx = idx.ravel()
+        idx = idx[idx < audio_len]
+        cough_mask_samples[idx] = True
+
+    mask = cough_mask_samples.astype(int)
+    diff = np.diff(mask, prepend=0, append=0)
+    seg_starts = np.flatnonzero(diff == 1)
+    seg_ends   = np.flatnonzero(diff == -1)
+
+    cough_mask_final = np.zeros_like(cough_mask_samples, dtype=bool)
+    segments_orig = []
+    scale = sr_orig / SR_MODEL
+    for s, e in zip(seg_starts, seg_ends):
+        if (e - s) >= min_cough_samples:
+            s_pad = max(0, s - padding)
+            e_pad = min(audio_len, e + padding)
+            cough_mask_final[s_pad:e_pad] = True
+            segments_orig.append(audio_orig[int(s_pad * scale):int(e_pad * scale)])
+    return segments_orig, cough_mask_final
+
+
+@pytest.mark.parametrize("run", range(100))
+def test_random_detections(run):
+    """Random rates, lengths, detection densities, min_len and padding, like CoughClassifier.detect_intervals"""
+    rng = np.random.default_rng(run)
+    sr_orig = int(rng.choice([44100, 48000, 22050, 16000, 8000]))
+    audio_orig = rng.standard_normal(int(rng.uniform(0.2, 8.0) * sr_orig)).astype(np.float32)
+    audio_len = -(-len(audio_orig) * SR_MODEL // sr_orig)
+    starts = np.arange(0, audio_len - window_samples, hop_samples, dtype=int)
+    detected = rng.random(len(starts)) < rng.choice([0.0, 0.05, 0.3, 0.9])
+    min_cough_len, padding = rng.choice([0.0, 0.2, 0.6, 1.0]), rng.choice([0.0, 0.05, 0.3])
+
+    ref_segments, ref_mask = detection_segments_reference(audio_orig, sr_orig, audio_len, starts, detected,
+                                                          min_cough_len, padding)
+    seg_starts, seg_ends = detection_intervals(starts[detected], window_samples, audio_len,
+                                               min_len=int(min_cough_len * SR_MODEL), padding=int(padding * SR_MODEL))
+    assert np.array_equal(ref_mask, intervals_to_mask(seg_starts, seg_ends, audio_len))
+
+    scale = sr_orig / SR_MODEL
+    segments = [audio_orig[s:e] for s, e in zip((seg_starts * scale).astype(np.int64), (seg_ends * scale).astype(np.int64))]
+    assert len(ref_segments) == len(segments)
+    for ref_seg, seg in zip(ref_segments, segments):
+        assert np.array_equal(ref_seg, seg)
+
+
+def test_no_detections():
+    seg_starts, seg_ends = detection_intervals(np.zeros(0, dtype=int), window_samples, SR_MODEL)
+    assert len(seg_starts) == 0 and len(seg_ends) == 0
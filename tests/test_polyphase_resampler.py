@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""PolyphaseResampler fed in uneven chunks against scipy.signal.resample_poly on the whole signal"""
+
+import numpy as np
+import pytest
+from scipy.signal import resample_poly
+
+from utils import PolyphaseResampler
+from audio_source import synthetic_cough_signal
+
+
+def stream(resampler, x, rng):
+    """Feed x in random chunk sizes (including empty ones and single samples), then flush"""
+    out = []
+    i = 0
+    while i < len(x):
+        n = int(rng.choice([0, 1, 7, 441, 1024, 3000]))
+        out.append(resampler.process(x[i:i + n]))
+        i += n
+    out.append(resampler.flush())
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize("orig_sr, target_sr", [(44100, 16000), (48000, 16000), (22050, 16000), (8000, 16000)])
+@pytest.mark.parametrize("seed", range(3))
+def test_stream_matches_resample_poly(orig_sr, target_sr, seed):
+    rng = np.random.default_rng(seed)
+    x = synthetic_cough_signal(rng, duration=rng.uniform(0.5, 2.0), fs=orig_sr)
+    resampler = PolyphaseResampler(orig_sr, target_sr)
+    expected = resample_poly(x.astype(np.float64), resampler.up, resampler.down)
+    out = stream(resampler, x, rng)
+    assert out.dtype == np.float32
+    assert len(out) == len(expected)
+    np.testing.assert_allclose(out, expected, atol=1e-5)
+
+
+def test_reset_restarts_the_stream():
+    rng = np.random.default_rng(0)
+    x = synthetic_cough_signal(rng, duration=1.0, fs=44100)
+    resampler = PolyphaseResampler(44100, 16000)
+    resampler.process(rng.standard_normal(5000).astype(np.float32))
+    resampler.reset()
+    np.testing.assert_allclose(stream(resampler, x, rng), resample_poly(x.astype(np.float64), 160, 441), atol=1e-5)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""segment_cough against the original per-sample hysteresis comparator"""
+
+import numpy as np
+import pytest
+
+from utils import segment_cough
+from audio_source import synthetic_cough_signal
+
+ADAPTIVE_METHODS = ['percentile', 'statistics', 'combination', 'default']
+
+
+def segment_cough_loop(x, fs, cough_padding=0.2, min_cough_len=0.2, adaptive_method='percentile', th_l_multiplier = 0.1, th_h_multiplier = 2):
+    """Original per-sample hysteresis comparator, kept as the reference for segment_cough"""
+    cough_mask = np.array([False]*len(x))
+
+    if adaptive_method == 'percentile':
+        signal_power = x**2
+        seg_th_l = np.percentile(signal_power, 75)
+        seg_th_h = np.percentile(signal_power, 99.9)
+    elif adaptive_method == 'statistics':
+        signal_power = x**2
+        mean_power = np.mean(signal_power)
+        std_power = np.std(signal_power)
+        seg_th_l = mean_power + 1.0 * std_power
+        seg_th_h = mean_power + 3.0 * std_power
+    elif adaptive_method == 'combination':
+        signal_power = x**2
+        rms = np.sqrt(np.mean(np.square(x)))
+        seg_th_l = np.percentile(signal_power, 75)
+        seg_th_h =  th_h_multiplier * rms
+    elif adaptive_method == 'default':
+        rms = np.sqrt(np.mean(np.square(x)))
+        seg_th_l = th_l_multiplier * rms
+        seg_th_h =  th_h_multiplier * rms
+
+    coughSegments = []
+    padding = round(fs*cough_padding)
+    min_cough_samples = round(fs*min_cough_len)
+    cough_start = 0
+    cough_end = 0
+    cough_in_progress = False
+    tolerance = round(0.01*fs)
+    below_th_counter = 0
+
+    for i, sample in enumerate(x**2):
+        if cough_in_progress:
+            if sample<seg_th_l:
+                below_th_counter += 1
+                if below_th_counter > tolerance:
+                    cough_end = i+padding if (i+padding < len(x)) else len(x)-1
+                    cough_in_progress = False
+                    if (cough_end+1-cough_start-2*padding>min_cough_samples):
+                        coughSegments.append(x[cough_start:cough_end+1])
+                        cough_mask[cough_start:cough_end+1] = True
+            elif i == (len(x)-1):
+                cough_end=i
+                cough_in_progress = False
+                if (cough_end+1-cough_start-2*padding>min_cough_samples):
+                    coughSegments.append(x[cough_start:cough_end+1])
+            else:
+                below_th_counter = 0
+        else:
+            if sample>seg_th_h:
+                cough_start = i-padding if (i-padding >=0) else 0
+                cough_in_progress = True
+
+    return coughSegments, cough_mask
+
+
+def assert_same_segmentation(x, fs, **params):
+    ref_segments, ref_mask = segment_cough_loop(x, fs, **params)
+    segments, mask = segment_cough(x, fs, **params)
+    assert np.array_equal(ref_mask, mask)
+    assert len(ref_segments) == len(segments)
+    for ref_seg, seg in zip(ref_segments, segments):
+        assert ref_seg.dtype == seg.dtype
+        assert np.array_equal(ref_seg, seg)
+
+
+@pytest.mark.parametrize("run", range(60))
+def test_random_signals(run):
+    """Random lengths, rates, dtypes and parameters, every adaptive method"""
+    rng = np.random.default_rng(run)
+    fs = 44100 if run % 4 else int(rng.choice([100, 800, 8000, 16000]))
+    x = synthetic_cough_signal(rng, duration=rng.uniform(0.01, 4.0), fs=fs)
+    if run % 5 == 0:
+        x = x.astype(np.float64)
+    if run % 7 == 0:
+        # Force a cough that is still in progress at the last sample
+        x[-int(0.05 * fs) - 1:] += 0.5
+    params = dict(cough_padding=rng.choice([0.0, 0.05, 0.2]),
+                  min_cough_len=rng.choice([0.0, 0.1, 0.2]),
+                  th_l_multiplier=rng.choice([0.02, 0.1, 1.5]),
+                  th_h_multiplier=rng.choice([0.5, 1, 2]))
+    for method in ADAPTIVE_METHODS:
+        assert_same_segmentation(x, fs, adaptive_method=method, **params)
+
+
+@pytest.mark.parametrize("method", ADAPTIVE_METHODS)
+def test_cough_until_last_sample(method):
+    """A cough that never drops below the low threshold is closed by the last sample"""
+    rng = np.random.default_rng(1)
+    x = synthetic_cough_signal(rng, duration=1.0, fs=8000, n_coughs=0)
+    x[4000:] += 0.5
+    assert_same_segmentation(x, 8000, adaptive_method=method, cough_padding=0.0, min_cough_len=0.0)
+
+
+@pytest.mark.parametrize("method", ADAPTIVE_METHODS)
+def test_silence(method):
+    assert_same_segmentation(np.zeros(4000, dtype=np.float32), 8000, adaptive_method=method)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""StreamingSegmenter against a per-sample comparator fed the same thresholds"""
+
+import numpy as np
+import pytest
+
+from utils import StreamingSegmenter, cough_thresholds
+from audio_source import synthetic_cough_signal
+
+FS = 44100
+ADAPTIVE_METHODS = ['percentile', 'statistics', 'combination', 'default']
+
+
+def gapped_cough_signal(rng, duration):
+    """Coughs separated by near silence, so the low threshold is crossed for longer than the tolerance"""
+    x = synthetic_cough_signal(rng, duration=duration, fs=FS, n_coughs=0)
+    for second in range(int(duration)):
+        start = second * FS + int(rng.uniform(0, 0.3) * FS)
+        length = int(rng.uniform(0.1, 0.4) * FS)
+        x[start:start + length] += rng.normal(0, rng.uniform(0.1, 0.5), length).astype(np.float32) * np.exp(-np.linspace(0, 4, length, dtype=np.float32))
+        x[start + length:(second + 1) * FS] *= 0.01
+    return x
+
+
+def stream_coughs_loop(power, start, seg_th_l, seg_th_h, padding, min_cough_samples, tolerance):
+    """(cough_start, cough_end) of the original comparator run from sample start on, without end-of-signal handling"""
+    coughs = []
+    cough_in_progress = False
+    cough_start = 0
+    below_th_counter = 0
+    for i in range(start, len(power)):
+        sample = power[i]
+        if cough_in_progress:
+            if sample<seg_th_l:
+                below_th_counter += 1
+                if below_th_counter > tolerance:
+                    cough_end = i+padding
+                    cough_in_progress = False
+                    if (cough_end+1-cough_start-2*padding>min_cough_samples):
+                        coughs.append((cough_start, cough_end))
+            else:
+                below_th_counter = 0
+        elif sample>seg_th_h:
+            cough_start = i-padding if (i-padding >=0) else 0
+            cough_in_progress = True
+    return coughs
+
+
+def feed(segmenter, x, period):
+    """Feed x in periods, returns the coughs and the first sample that was scanned"""
+    coughs = []
+    scan_start = None
+    for s in range(0, len(x), period):
+        for cough_start, segment in segmenter.process(x[s:s + period]):
+            coughs.append((cough_start, cough_start + len(segment) - 1))
+            assert np.array_equal(segment, x[cough_start:cough_start + len(segment)])
+        if scan_start is None and segmenter.ready:
+            scan_start = segmenter.samples_scanned
+    return coughs, scan_start
+
+
+@pytest.mark.parametrize("method", ADAPTIVE_METHODS)
+@pytest.mark.parametrize("period", [1024, 441, 5000])
+def test_matches_per_sample_comparator(method, period):
+    rng = np.random.default_rng(period)
+    x = gapped_cough_signal(rng, 12.0)
+    # Thresholds fixed after the first update, so the reference can use the same ones
+    segmenter = StreamingSegmenter(FS, adaptive_method=method, threshold_interval=1e9, max_cough_len=20.0,
+                                   min_cough_len=0.0)
+    coughs, scan_start = feed(segmenter, x, period)
+
+    seg_th_l, seg_th_h = segmenter._thresholds
+    expected = stream_coughs_loop(x**2, scan_start, seg_th_l, seg_th_h, segmenter.padding,
+                                  segmenter.min_cough_samples, segmenter.tolerance)
+    expected = [(start, end) for start, end in expected if end < segmenter.samples_seen]
+    assert len(expected) > 0
+    assert coughs == expected
+
+
+@pytest.mark.parametrize("method", ADAPTIVE_METHODS)
+def test_thresholds_match_segment_cough(method):
+    """Exact thresholds of the trailing window, updated every threshold_interval"""
+    rng = np.random.default_rng(0)
+    x = synthetic_cough_signal(rng, duration=10.0, fs=FS, n_coughs=6)
+    segmenter = StreamingSegmenter(FS, adaptive_method=method, stats_duration=4.0, threshold_interval=1.0)
+    updated = []
+    for s in range(0, len(x), 1024):
+        segmenter.process(x[s:s + 1024])
+        if segmenter._thresholds is not None and (not updated or updated[-1] != segmenter._thresholds_at):
+            at = segmenter._thresholds_at
+            assert segmenter._thresholds == cough_thresholds(x[at - segmenter.stats_samples:at], method)
+            updated.append(at)
+    assert len(updated) == 6
+    assert np.all(np.diff(updated) >= segmenter.threshold_samples)
+
+
+def test_long_cough_is_closed():
+    x = np.full(8 * FS, 0.01, dtype=np.float32)
+    x[5 * FS:] = 0.5
+    segmenter = StreamingSegmenter(FS, adaptive_method='default', max_cough_len=1.0)
+    coughs, _ = feed(segmenter, x, 1024)
+    assert len(coughs) >= 2
+    for start, end in coughs:
+        assert end - start + 1 <= segmenter.max_cough_samples + 2 * segmenter.padding + segmenter.scan_samples
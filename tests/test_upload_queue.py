@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""UploadQueue: enqueue/pending/ack, recovery after a reopen or a killed writer, last_send.json import"""
+
+import os, json
+import multiprocessing
+
+from upload_queue import UploadQueue
+
+NAMES = [f"{1000000 + i % 7}/01-01-2025_1200_{i + 1}.wav" for i in range(30)]
+
+
+def _crash_writer(path, names):
+    queue = UploadQueue(path)
+    for name in names:
+        queue.enqueue("soliced", name)
+    for name in names[:10]:
+        queue.ack("soliced", name)
+    os._exit(1)
+
+
+def test_enqueue_claim_ack(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.db"))
+    for name in reversed(NAMES):
+        assert queue.enqueue("soliced", name)
+    assert not queue.enqueue("soliced", NAMES[0])
+    assert queue.enqueue("automatic", NAMES[0])
+    assert len(queue) == len(NAMES) + 1
+
+    # pending() is a snapshot ordered by recording number, items stay queued until acked
+    claimed = queue.pending("soliced")
+    assert claimed == NAMES
+    for name in claimed[:10]:
+        assert queue.ack("soliced", name)
+    assert not queue.ack("soliced", NAMES[0])
+    assert not queue.ack("missing", NAMES[0])
+    assert queue.pending("soliced") == NAMES[10:]
+    assert queue.pending("automatic") == NAMES[:1]
+    assert queue.pending("missing") == []
+    queue.close()
+
+
+def test_unacked_items_come_back_after_reopen(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = UploadQueue(path)
+    for name in NAMES:
+        queue.enqueue("soliced", name)
+    claimed = queue.pending("soliced")
+    for name in claimed[:5]:
+        queue.ack("soliced", name)
+    queue.close()
+
+    reopened = UploadQueue(path)
+    assert reopened.pending("soliced") == NAMES[5:]
+    reopened.close()
+
+
+def test_killed_writer_keeps_committed_changes(tmp_path):
+    path = str(tmp_path / "crash.db")
+    process = multiprocessing.get_context('fork').Process(target=_crash_writer, args=(path, NAMES))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+    recovered = UploadQueue(path)
+    assert recovered.pending("soliced") == NAMES[10:]
+    recovered.close()
+
+
+def test_legacy_json_imported_once(tmp_path):
+    legacy = tmp_path / "last_send.json"
+    legacy.write_text(json.dumps({'last_send_soliced': NAMES[:3], 'last_send_automatic': NAMES[3:5],
+                                  'last_send_other': NAMES[5:6]}))
+    path = str(tmp_path / "queue.db")
+    queue = UploadQueue(path, legacy_json=str(legacy))
+    assert queue.pending("soliced") == NAMES[:3]
+    assert queue.pending("automatic") == NAMES[3:5]
+    assert len(queue) == 5
+    assert not legacy.exists()
+    assert (tmp_path / "last_send.json.migrated").exists()
+    queue.ack("soliced", NAMES[0])
+    queue.close()
+
+    # The renamed file is not imported again, acked items stay gone
+    queue = UploadQueue(path, legacy_json=str(legacy))
+    assert queue.pending("soliced") == NAMES[1:3]
+    assert len(queue) == 4
+    queue.close()
+
+
+def test_unreadable_legacy_json_is_left_alone(tmp_path):
+    legacy = tmp_path / "last_send.json"
+    legacy.write_text("{not json")
+    queue = UploadQueue(str(tmp_path / "queue.db"), legacy_json=str(legacy))
+    assert len(queue) == 0
+    assert legacy.exists()
+    queue.close()
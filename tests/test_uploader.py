@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Uploader against a local http.server stub: ack on success, backoff, rate limit, batch fallback"""
+
+import os, json, time, random, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from upload_queue import UploadQueue
+from uploader import Uploader, TokenBucket
+
+NAMES = [f"3201/01-01-2025_1200_{i + 1}.wav" for i in range(6)]
+
+
+class StubServer():
+    """Keep-alive HTTP/1.1 endpoint: POSTs to the file url answer `status`, POSTs to .../batch
+    answer batch_status, 200 with every manifest item a success"""
+
+    def __init__(self):
+        self.status = 200
+        self.batch_status = 200
+        self.requests = []      # (path, Content-Length)
+        self.connections = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                data = self.rfile.read(length)
+                with stub.lock:
+                    stub.requests.append((self.path, length))
+                if self.path.endswith('/batch'):
+                    status = stub.batch_status
+                    manifest = data.split(b'name="manifest"\r\n\r\n', 1)[1].split(b'\r\n--', 1)[0]
+                    reply = {'status': 'success', 'results': [{'id': item['id'], 'status': 'success'}
+                                                              for item in json.loads(manifest)['items']]}
+                else:
+                    status = stub.status
+                    reply = {'status': 'success' if status == 200 else 'error'}
+                body = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/device/sendData_TBPrimer/0"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    stub = StubServer()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    root = tmp_path / "Recorded_Data"
+    for name in NAMES:
+        path = root / "soliced" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(2000))
+    queue = UploadQueue(str(root / "upload_queue.db"))
+    for name in NAMES:
+        queue.enqueue("soliced", name)
+    yield queue
+    queue.close()
+
+
+def uploader(server, queue, **kwargs):
+    kwargs = dict(dict(workers=2, rate=1000.0, burst=10, timeout=5), **kwargs)
+    return Uploader(server.url, queue, root=os.path.dirname(queue.path), fields=lambda q, n: {'nama': 'pasien'}, **kwargs)
+
+
+def test_success_acks_over_shared_session(server, queue):
+    up = uploader(server, queue)
+    assert up.drain("soliced") == (len(NAMES), 0)
+    assert queue.pending("soliced") == []
+    assert up.sent == len(NAMES) and up.failed == 0
+    assert len(server.requests) == len(NAMES)
+    # Keep-alive connections of the one session are reused, at most one per worker
+    assert server.connections <= up.workers
+    assert up.drain("soliced") == (0, 0)
+    up.close()
+
+
+def test_non_200_backs_off(server, queue):
+    server.status = 503
+    random.seed(0)
+    up = uploader(server, queue, backoff=100.0)
+    assert up.drain("soliced") == (0, len(NAMES))
+    assert queue.pending("soliced") == NAMES
+    assert up.failed == len(NAMES)
+    # Every file waits out its backoff, nothing is due right away
+    assert up.due("soliced") == []
+    assert up.drain("soliced") == (0, 0)
+    assert len(server.requests) == len(NAMES)
+    up.close()
+
+
+def test_retry_after_backoff(server, queue):
+    server.status = 503
+    up = uploader(server, queue, backoff=0.01, max_backoff=0.05)
+    assert up.drain("soliced") == (0, len(NAMES))
+    server.status = 200
+    time.sleep(0.06)
+    assert up.drain("soliced") == (len(NAMES), 0)
+    assert queue.pending("soliced") == []
+    up.close()
+
+
+def test_rate_limit(server, queue):
+    up = uploader(server, queue, rate=20.0, burst=1)
+    start = time.perf_counter()
+    up.drain("soliced")
+    assert time.perf_counter() - start >= (len(NAMES) - 1) / 20.0 * 0.9
+    up.close()
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=10.0, burst=3)
+    start = time.perf_counter()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.perf_counter() - start < 0.05
+    bucket.acquire()
+    assert time.perf_counter() - start >= 0.08
+
+
+def test_batch_request(server, queue):
+    up = uploader(server, queue, batch_url=server.url + "/batch", batch_size=4)
+    assert up.drain("soliced") == (len(NAMES), 0)
+    assert queue.pending("soliced") == []
+    assert [path.endswith('/batch') for path, _ in server.requests] == [True, True]
+    up.close()
+
+
+def test_batch_404_falls_back_to_one_request_per_file(server, queue):
+    server.batch_status = 404
+    up = uploader(server, queue, batch_url=server.url + "/batch", batch_size=len(NAMES))
+    assert up.drain("soliced") == (len(NAMES), 0)
+    assert queue.pending("soliced") == []
+    assert up.batch_url is None
+    assert [path.endswith('/batch') for path, _ in server.requests] == [True] + [False] * len(NAMES)
+    up.close()
+
+
+@pytest.mark.parametrize("batch_status", [None, 200, 404])
+def test_gone_files_are_skipped_not_failed(server, queue, batch_status):
+    root = os.path.dirname(queue.path)
+    for name in NAMES[:2]:
+        os.remove(os.path.join(root, "soliced", name))
+    batch_url = None
+    if batch_status is not None:
+        server.batch_status = batch_status
+        batch_url = server.url + "/batch"
+    up = uploader(server, queue, batch_url=batch_url, batch_size=len(NAMES))
+    assert up.drain("soliced") == (len(NAMES) - 2, 0)
+    assert queue.pending("soliced") == []
+    assert up.skipped == 2 and up.failed == 0
+    up.close()
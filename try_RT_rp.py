@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import time, os, logging, json, glob, re, socket, requests, uuid, math
+import time, os, logging, json, socket, math
+STARTUP_START = time.perf_counter()
 from datetime import datetime
 from threading import Thread, Lock
-from collections import deque
 from types import SimpleNamespace
 
 import tkinter as tk
@@ -13,37 +13,31 @@ from tkinter import font
 import threading
 
 import numpy as np
-import alsaaudio as alsa
-import soundfile as sf
-import tempfile
 
-import asyncio
-import json
-import requests
-import websockets
-import io
-
-# Import matplotlib libraries
-from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
-import matplotlib.animation as animation
-import matplotlib.patches as patches
-from matplotlib.figure import Figure
-from matplotlib import style
-
-from utils import segment_cough
+from startup import StartupTimer, configure_matplotlib_cache, lazy_import
+
+# Only needed by some pages and features, loaded on first use (matplotlib only by the "matplotlib" waveform renderer)
+asyncio = lazy_import('asyncio')
+requests = lazy_import('requests')
+websockets = lazy_import('websockets')
+
+from utils import PcmConverter, StreamingSegmenter, RingBuffer, WaveformDecimator
+from audio_pipeline import CapturePipeline
+from audio_source import create_source, CaptureLifecycle
+from workers import AnalysisExecutor
+from config_cache import ConfigCache, autocough_params, patient_nik
+from gpio_input import GpioInput
+from recording_index import RecordingIndex
+from upload_queue import UploadQueue
+from uploader import Uploader, MultipartBody
+from audio_codec import AudioCodec
+from waveform_view import create_waveform_view
+from ui_bus import UiBus
 
 os.makedirs("Recorded_Data/automatic", exist_ok=True)
 os.makedirs("Recorded_Data/soliced", exist_ok=True)
 os.makedirs("logs/", exist_ok=True)
 
-json_path = 'Recorded_Data/last_send.json'
-if not os.path.exists(json_path):
-    with open(json_path, 'w') as outfile:
-        json.dump({
-            "last_send_automatic": None,
-            "last_send_soliced": None,
-        }, outfile)
-
 timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
 log_filename = f"log_{timestamp}.log"
 
@@ -59,6 +53,10 @@ config_path = os.path.join(script_dir, 'config.json')
 with open(config_path) as data_file:    
     GLOBAL_CONFIG = json.load(data_file, object_hook=lambda d: SimpleNamespace(**d))
 
+configure_matplotlib_cache(script_dir)
+STARTUP = StartupTimer(STARTUP_START)
+STARTUP.mark("imports")
+
 class CoughTk():
     """CoughAnalyzer Program with GUI
     """
@@ -73,11 +71,14 @@ class CoughTk():
     STEP_DURATION = WINDOW_DURATION - OVERLAP_DURATION
 
     DEVICE_SOUND =  GLOBAL_CONFIG.DEVICE_SOUND # 'dmic_sv' "plughw:2,0"
+    AUDIO_SOURCE = getattr(GLOBAL_CONFIG, 'AUDIO_SOURCE', 'alsa') # "alsa", "file:<path>" or "synthetic"
+    CAPTURE_CHANNEL = getattr(GLOBAL_CONFIG, 'CAPTURE_CHANNEL', None) # only use this channel instead of the mean of all
     BTN1_FILE =  GLOBAL_CONFIG.BTN1_FILE # "gpio12" "/sys/class/gpio/gpio5/value"
     BTN2_FILE =  GLOBAL_CONFIG.BTN2_FILE # "gpio12" "/sys/class/gpio/gpio5/value"
     BTN3_FILE =  GLOBAL_CONFIG.BTN3_FILE # "gpio12" "/sys/class/gpio/gpio6/value"
     BTN4_FILE =  GLOBAL_CONFIG.BTN4_FILE # "gpio12" "/sys/class/gpio/gpio6/value"
     RECORD_LENGTH = int(GLOBAL_CONFIG.RECORD_LENGTH * SAMPLE_RATE)
+    MAX_RECORD_DURATION = 300 # seconds, a manual recording stops by itself once the buffer is full
     AUDIO_POINT_START = round(0.3 * SAMPLE_RATE)
 
     DEVICE_WLAN = GLOBAL_CONFIG.DEVICE_WLAN
@@ -85,7 +86,19 @@ class CoughTk():
     SERVER_DOMAIN = GLOBAL_CONFIG.SERVER_DOMAIN
     SERVERWS_DOMAIN = GLOBAL_CONFIG.SERVERWS_DOMAIN
     DEVICE_ID = GLOBAL_CONFIG.DEVICE_ID
+    RECORDING_CODEC = getattr(GLOBAL_CONFIG, 'RECORDING_CODEC', 'flac') # "wav", "flac", "flac16", "flac16k" or "opus16k", see audio_codec.py
+    PREDICTION_CODEC = getattr(GLOBAL_CONFIG, 'PREDICTION_CODEC', 'flac') # format of the recording sent for prediction
+    UPLOAD_WORKERS = getattr(GLOBAL_CONFIG, 'UPLOAD_WORKERS', 4) # concurrent uploads of queued recordings
+    UPLOAD_RATE = getattr(GLOBAL_CONFIG, 'UPLOAD_RATE', 2.0) # uploads started per second at most
+    UPLOAD_BATCH_URL = getattr(GLOBAL_CONFIG, 'UPLOAD_BATCH_URL', None) # batch endpoint taking many recordings per request, None for one per file
+    UPLOAD_BATCH_SIZE = getattr(GLOBAL_CONFIG, 'UPLOAD_BATCH_SIZE', 32) # recordings per batch request
+    GPIO_POLL_INTERVAL = getattr(GLOBAL_CONFIG, 'GPIO_POLL_INTERVAL', 0.1) # seconds between reads of buttons without edge interrupts
     SEND_COUGH = GLOBAL_CONFIG.SEND_COUGH
+    WAVEFORM_RENDERER = getattr(GLOBAL_CONFIG, 'WAVEFORM_RENDERER', 'canvas') # "matplotlib" for the old figures
+    WAVEFORM_INTERVAL = getattr(GLOBAL_CONFIG, 'WAVEFORM_INTERVAL', 200) # ms between waveform frames
+    CAPTURE_PAGES = (2, 3) # pages that use the microphone
+    UI_INTERVAL = getattr(GLOBAL_CONFIG, 'UI_INTERVAL', 50) # ms between UI bus drains
+    FAST_START = getattr(GLOBAL_CONFIG, 'FAST_START', True) # paint the home page before building the other pages
     
     def __init__(self):
         super(CoughTk, self).__init__()
@@ -95,15 +108,26 @@ class CoughTk():
         self.window.geometry("480x320")
         self.window.title("TBCare - CoughAnalyzer")
         self.current_page = 1
+        STARTUP.mark("tk init")
 
         self.main_frame = tk.Frame(self.window)
         self.main_frame.pack(fill=tk.BOTH, expand=True)
         self.init_variables()
 
         self.create_home_page()
+        STARTUP.mark("home page")
+        if self.FAST_START:
+            self.home_frame.pack(fill=tk.BOTH, expand=True)
+            if self.DarkTheme:
+                self.configure_dark_theme()
+            self.window.update()
+            STARTUP.mark("first frame")
+
         self.create_analyzer_page()
+        STARTUP.mark("analyzer page")
         self.create_prediction_page()
         self.create_info_page()
+        STARTUP.mark("other pages")
 
         self.show_page(self.current_page)
 
@@ -111,7 +135,10 @@ class CoughTk():
             self.configure_dark_theme()
 
         self.start_background_processes()
+        STARTUP.mark("background processes")
+        STARTUP.report()
         self.window.mainloop()
+        self.stop_background_processes()
 
     def init_variables(self):
         """Initialize shared variables for both pages"""
@@ -122,6 +149,9 @@ class CoughTk():
         self.small_font = font.Font(self.window, family="Liberation Mono", size=9)
         
         # Status variablessxxxsx
+        # Widget updates from worker threads go through the bus, applied on the Tk thread once per frame
+        self.ui = UiBus(self.window, interval=self.UI_INTERVAL)
+        self.internet_online = False
         self.internet_status = tk.StringVar()
         self.internet_status.set("Offline")
         self.EdgeIP = tk.StringVar()
@@ -139,7 +169,7 @@ class CoughTk():
         self.battery_status.set("🔋100%")
         
         # Audio processing variables
-        self.audio_buffer = deque()
+        self.audio_buffer = RingBuffer(self.MAX_RECORD_DURATION * self.SAMPLE_RATE)
         self.buffer_lock = Lock()
         self.next_time = time.time()
         self.RECORD_FLAG = False
@@ -150,6 +180,36 @@ class CoughTk():
         self.buffer_size = int(self.STEP_DURATION * self.SAMPLE_RATE)
         self.window_size = int(self.WINDOW_DURATION * self.SAMPLE_RATE)
 
+        # Persistent worker instead of a new Thread per recording. Automatic coughs are segmented on the
+        # processing thread, so the only jobs are recordings to save, and those are never dropped
+        self.recording_pool = AnalysisExecutor("recording", workers=1, maxsize=None)
+        # Only the processing thread touches the segmenter, other threads ask for a fresh one
+        self.segmenter = None
+        self.segmenter_reset = threading.Event()
+
+        # autocough_config.json and current_patient.json are reloaded by a watcher when they change
+        self.config_cache = ConfigCache(poll_interval=1.0)
+        self.config_cache.watch('autocough', 'autocough_config.json', parse=autocough_params,
+                                on_change=self.on_autocough_config_change)
+        self.config_cache.watch('patient', self.WEBPANEL_ROOT + '/data/current_patient.json',
+                                on_change=self.on_patient_change)
+
+        # Buttons: presses arrive as events, recording requests are picked up by process_period
+        self.gpio = GpioInput(debounce=0.05, poll_interval=self.GPIO_POLL_INTERVAL)
+        for name, path in (('btn1', self.BTN1_FILE), ('btn2', self.BTN2_FILE), ('btn3', self.BTN3_FILE), ('btn4', self.BTN4_FILE)):
+            self.gpio.add_button(name, path)
+        self.gpio.subscribe(None, self.on_button_press)
+        self.record_requests = {'start': threading.Event(), 'stop': threading.Event(), 'cancel': threading.Event()}
+
+        # File counts and next file numbers for the recording folders
+        self.recording_index = RecordingIndex("Recorded_Data", codec=AudioCodec(self.RECORDING_CODEC))
+        self.prediction_codec = AudioCodec(self.PREDICTION_CODEC)
+        # Recordings waiting for upload, replaces the lists in last_send.json
+        self.upload_queue = UploadQueue("Recorded_Data/upload_queue.db", legacy_json="Recorded_Data/last_send.json")
+        self.uploader = Uploader(f"{self.SERVER_DOMAIN}/api/device/sendData_TBPrimer/{self.DEVICE_ID}", self.upload_queue,
+                                 fields=self.upload_fields, workers=self.UPLOAD_WORKERS, rate=self.UPLOAD_RATE, burst=self.UPLOAD_WORKERS,
+                                 batch_url=self.UPLOAD_BATCH_URL, batch_size=self.UPLOAD_BATCH_SIZE)
+
         self.send_lock = Lock()
         self.is_sending = False
 
@@ -159,9 +219,13 @@ class CoughTk():
 
         # Initialize a
         # udio system
-        self.pcm = alsa.PCM(alsa.PCM_CAPTURE, alsa.PCM_NORMAL,
-                       channels=self.CHANNELS, rate=self.SAMPLE_RATE, format=alsa.PCM_FORMAT_S16_LE,
-                       periodsize=self.PERIOD_SIZE, device=self.DEVICE_SOUND)
+        STARTUP.mark("init variables")
+        self.audio_source = create_source(self.AUDIO_SOURCE, device=self.DEVICE_SOUND, rate=self.SAMPLE_RATE,
+                                          channels=self.CHANNELS, period_size=self.PERIOD_SIZE)
+        STARTUP.mark("audio source open")
+        # The microphone only runs while a page that uses it is visible
+        self.capture = CaptureLifecycle(self.audio_source, active=self.current_page in self.CAPTURE_PAGES,
+                                        on_transition=self.on_capture_transition)
 
     def create_status_bar(self, parent_frame):
         """Create a universal status bar for all pages"""
@@ -337,53 +401,18 @@ class CoughTk():
         # Pack Info Frame
         self.infofrm.pack(side=tk.TOP)
 
-        # Graph Frame
-        self.graphfrm = tk.Frame(self.analyzer_frame)
-        # Example Figure Plot
-        self.fig = Figure(figsize=(5, 1), dpi=96, facecolor='black')
-        self.ax = self.fig.add_subplot(111)
-        self.ax.set_facecolor('black')
-        self.ax.set_ylim(-1, 1)
-        self.ax.set_xlim(-1, 1)
-        self.patch_plot = self.ax.add_patch(patches.Rectangle((-1.0, 0.0), 2.0, 1.0, linewidth=1, edgecolor='black', facecolor='blue'))
-        style.use('ggplot')
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graphfrm)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(side=tk.LEFT)
-        self.last_updateFigure = time.time()
-        self.graphfrm.pack(side=tk.BOTTOM)
-
         # Graph Data
-        self.graphfrm2 = tk.Frame(self.analyzer_frame)
+        self.graphfrm = tk.Frame(self.analyzer_frame)
         self.waveform_duration = 2.0  # 2 seconds
         self.waveform_length = 200   # Display points (downsampled)
         self.waveform_samples = int(self.waveform_duration * self.SAMPLE_RATE)  # Total samples for 2 seconds
         self.downsample_ratio = self.waveform_samples // self.waveform_length  # ~88 samples per point
         self.X = np.arange(0, self.waveform_length, 1)
-        self.Y_buffer = deque(maxlen=self.waveform_length)
-        self.audio_accumulator = deque(maxlen=self.waveform_samples)  # Raw audio buffer for 2 seconds
-        # Initialize with zeros
-        for _ in range(self.waveform_length):
-            self.Y_buffer.append(0.0)
-        for _ in range(self.waveform_samples):
-            self.audio_accumulator.append(0.0)
-        # Example Figure Plot
-        self.fig2 = Figure(figsize=(5, 2.5), dpi=96,facecolor='black')
-        self.ax2 = self.fig2.add_subplot(111)
-        self.ax2.set_facecolor('black')
-        self.ax2.get_xaxis().set_visible(False)
-        self.ax2.get_yaxis().set_visible(False)
-        self.ax2.grid(True, which='both', ls='-', color='#333333')
-        self.ax2.set_ylim(-0.2, 0.2)
-        self.ax2.set_xlim(0, len(self.X) - 1)
-        self.line2, = self.ax2.plot(self.X, list(self.Y_buffer), color='cyan', linewidth=1)
-        style.use('ggplot')
-        self.canvas2 = FigureCanvasTkAgg(self.fig2, master=self.graphfrm2)
-        self.canvas2.draw()
-        self.canvas2.get_tk_widget().pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.graphfrm2.pack(side=tk.BOTTOM)
-        self.downsample_counter = 0
-        self.downsample_accumulator = 0.0
+        self.waveform_decimator = WaveformDecimator(self.downsample_ratio, self.waveform_length)
+        # Status bar (blue: listening, yellow: recording, green: cough saved, red: silent input) and waveform
+        self.waveform_view = create_waveform_view(self.WAVEFORM_RENDERER, self.graphfrm, self.waveform_decimator.values,
+                                                  self.waveform_length, ylim=0.2, status='blue')
+        self.graphfrm.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
 
     def create_prediction_page(self):
         """Create the prediction page with cough TB classification"""
@@ -472,7 +501,7 @@ class CoughTk():
 
     def manual_prediction(self):
         """Manually trigger prediction on the last recorded cough"""
-        self.prediction_status.set("🔄 Analyzing cough sample...")
+        self.ui.set(self.prediction_status, "🔄 Analyzing cough sample...")
         time.sleep(2)
         # Simulate prediction (replace with actual ML model)
         import random
@@ -480,23 +509,24 @@ class CoughTk():
         non_tb_prob = 100 - tb_prob
         
         # Update percentages
-        self.tb_percentage.set(f"{tb_prob:.1f}%")
-        self.non_tb_percentage.set(f"{non_tb_prob:.1f}%")
+        self.ui.set(self.tb_percentage, f"{tb_prob:.1f}%")
+        self.ui.set(self.non_tb_percentage, f"{non_tb_prob:.1f}%")
         
         # Update progress bars
-        self.tb_progress['value'] = tb_prob
-        self.non_tb_progress['value'] = non_tb_prob
+        self.ui.config(self.tb_progress, value=tb_prob)
+        self.ui.config(self.non_tb_progress, value=non_tb_prob)
         
         # Update status
         if tb_prob > 50:
-            self.prediction_status.set("⚠️ High TB probability detected!")
+            self.ui.set(self.prediction_status, "⚠️ High TB probability detected!")
         else:
-            self.prediction_status.set("✅ Low TB probability - likely healthy cough")
+            self.ui.set(self.prediction_status, "✅ Low TB probability - likely healthy cough")
 
     def show_page(self, page_num):
         """Switch between pages"""
         if page_num == 1:
             self.analyzer_frame.pack_forget()
+            self.waveform_view.stop()
             self.prediction_frame.pack_forget()
             self.info_frame.pack_forget()
             self.home_frame.pack(fill=tk.BOTH, expand=True)
@@ -506,13 +536,15 @@ class CoughTk():
             self.prediction_frame.pack_forget()
             self.info_frame.pack_forget()
             self.analyzer_frame.pack(fill=tk.BOTH, expand=True)
+            # Fresh segmenter for every visit, the stream had a gap
+            self.segmenter_reset.set()
             self.current_page = 2
-            # Start animation only when on analyzer page
-            if not hasattr(self, 'ani'):
-                self.ani = animation.FuncAnimation(self.fig2, self.graphupdate, interval=200, blit=False)
+            # Waveform frames only while the analyzer page is visible
+            self.waveform_view.start(self.WAVEFORM_INTERVAL)
         elif page_num == 3:
             self.home_frame.pack_forget()
             self.analyzer_frame.pack_forget()
+            self.waveform_view.stop()
             self.info_frame.pack_forget()
             self.prediction_frame.pack(fill=tk.BOTH, expand=True)
             self.current_page = 3
@@ -520,9 +552,11 @@ class CoughTk():
         elif page_num == 4:
             self.home_frame.pack_forget()
             self.analyzer_frame.pack_forget()
+            self.waveform_view.stop()
             self.prediction_frame.pack_forget()
             self.info_frame.pack(fill=tk.BOTH, expand=True)
             self.current_page = 4
+        self.capture.set_active(self.current_page in self.CAPTURE_PAGES)
 
     def configure_dark_theme(self):
         """Configure dark theme for all elements"""
@@ -547,24 +581,14 @@ class CoughTk():
             for widget in self.prediction_status_widgets:
                 widget.config(bg='black', fg='white')
 
-        # Home page elements
-        self.home_frame.config(bg="black")
-        for widget in self.home_frame.winfo_children():
-            self.configure_widget_dark_theme(widget)
-        
-        # Home page elements
-        self.analyzer_frame.config(bg="black")
-        for widget in self.analyzer_frame.winfo_children():
-            self.configure_widget_dark_theme(widget)
-
-        self.info_frame.config(bg="black")
-        for widget in self.info_frame.winfo_children():
-            self.configure_widget_dark_theme(widget)
-            
-        # Home page elements
-        self.prediction_frame.config(bg="black")
-        for widget in self.prediction_frame.winfo_children():
-            self.configure_widget_dark_theme(widget)
+        # Page elements, with FAST_START only the home page exists on the first call
+        for name in ('home_frame', 'analyzer_frame', 'info_frame', 'prediction_frame'):
+            frame = getattr(self, name, None)
+            if frame is None:
+                continue
+            frame.config(bg="black")
+            for widget in frame.winfo_children():
+                self.configure_widget_dark_theme(widget)
 
     def configure_widget_dark_theme(self, widget):
         """Recursively configure dark theme for widgets"""
@@ -584,15 +608,27 @@ class CoughTk():
 
     def start_background_processes(self):
         """Start all background processes"""
+        self.ui.start()
         Thread(target=self.getinternetstatsprocess, daemon=True).start()
         Thread(target=self.getipprocess, daemon=True).start()
         Thread(target=self.getCoughCount, daemon=True).start()
-        Thread(target=self.getCurrentPatient, daemon=True).start()
-        Thread(target=self.button_navigation_loop, daemon=True).start()
-        Thread(target=self.record_audio_loop, daemon=True).start()
+        self.config_cache.start()
+        self.gpio.start()
+        self.start_audio_pipeline()
         Thread(target=self.sendcoughdataprocess, daemon=True).start()
             
 
+    def stop_background_processes(self):
+        """Stop the audio pipeline and let queued recordings finish before exiting"""
+        self.pipeline.stop()
+        self.audio_source.close()
+        self.config_cache.stop()
+        self.gpio.stop()
+        self.waveform_view.timer.report()
+        self.ui.stop()
+        self.uploader.close()
+        self.recording_pool.shutdown(wait=True, timeout=30)
+
     def getwlanip(self):
         # wlp3s0 wlan0
         ipv4 = os.popen(
@@ -605,100 +641,80 @@ class CoughTk():
             ipstring = self.getwlanip()
             if ipstring == "":
                 "0.0.0.0"
-            self.EdgeIP.set("📡" + ipstring)
+            self.ui.set(self.EdgeIP, "📡" + ipstring)
             time.sleep(10)
 
-    def getCurrentPatient(self):
-        """Get IP Loop"""
-        while True:
-            try:
-                with open(self.WEBPANEL_ROOT + '/data/current_patient.json') as pf:
-                    patient = json.load(pf)
-                    patient_nik = patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
-                    if not patient_nik:
-                        patient_nik = "unknown"
-                    self.current_patient.set(f"👤 {patient.get('name')}")
-            except Exception as e:
-                logging.error(f"[ERROR]: {e}")
-                self.current_patient.set(f"❌ {str(e)}")
-            time.sleep(5)
-
-
-    def button_navigation_loop(self):
-        """Handle button navigation between pages"""
-        btn1_last_state = '1'
-        btn2_last_state = '1'
-        btn3_last_state = '1'
-        btn4_last_state = '1'
-        while True:
-            try:
-                with open(self.BTN1_FILE, "r") as f:
-                    btn1_current = f.read().strip()
-                with open(self.BTN2_FILE, "r") as f:
-                    btn2_current = f.read().strip()
-                with open(self.BTN3_FILE, "r") as f:
-                    btn3_current = f.read().strip()
-                with open(self.BTN4_FILE, "r") as f:
-                    btn4_current = f.read().strip()
-                
-                # Button 1 Navigation Logic
-                if btn1_current == '0' and btn1_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(2)
-                    with open(self.BTN1_FILE, "w") as f:
-                        f.write('1')
-                        
-                # Button 2 Navigation Logic
-                if btn2_current == '0' and btn2_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(3)
-                    with open(self.BTN2_FILE, "w") as f:
-                        f.write('1')
-                
-                # Button 3 Navigation Logic
-                if btn3_current == '0' and btn3_last_state == '1':
-                    if self.current_page == 1:
-                        self.show_page(4)
-                    with open(self.BTN3_FILE, "w") as f:
-                        f.write('1')
-                
-                # Button 4 Navigation Logic
-                if btn4_current == '0' and btn4_last_state == '1':
-                    if self.current_page in [2, 3, 4]:
-                        self.show_page(1)
-                    with open(self.BTN4_FILE, "w") as f:
-                        f.write('1')
-
-                btn1_last_state = btn1_current
-                btn2_last_state = btn2_current
-                btn3_last_state = btn3_current
-                btn4_last_state = btn4_current
-            except Exception as e:
-                logging.error(f"[ERROR] Button navigation error: {e}")
-            time.sleep(0.1)
+    def on_patient_change(self, name, patient, error):
+        """Called by the config cache whenever current_patient.json was (re)loaded or failed to load"""
+        if error is not None:
+            logging.error(f"[ERROR]: {error}")
+            self.ui.set(self.current_patient, f"❌ {str(error)}")
+        else:
+            self.ui.set(self.current_patient, f"👤 {patient.get('name')}")
+
+    def on_autocough_config_change(self, name, cough_config, error):
+        """Rebuild the streaming segmenter with the new parameters on the next period"""
+        if error is None:
+            logging.info(f"[INFO] Auto cough config loaded: {dict(cough_config)}")
+            self.segmenter_reset.set()
+
+    def current_patient_nik(self):
+        return str(patient_nik(self.config_cache.get("patient")))
+
+
+    def on_button_press(self, name):
+        """Page navigation and recording control, called on the GPIO thread"""
+        page = self.current_page
+        if name == 'btn1':
+            if page == 1:
+                self.ui.call(self.show_page, 2, key='page')
+            elif page in [2, 3] and not self.RECORD_FLAG:
+                self.record_requests['start'].set()
+        elif name == 'btn2':
+            if page == 1:
+                self.ui.call(self.show_page, 3, key='page')
+            elif self.RECORD_FLAG:
+                self.record_requests['stop'].set()
+        elif name == 'btn3':
+            if page == 1:
+                self.ui.call(self.show_page, 4, key='page')
+            elif self.RECORD_FLAG:
+                self.record_requests['cancel'].set()
+        elif name == 'btn4':
+            if page in [2, 3, 4]:
+                self.ui.call(self.show_page, 1, key='page')
+
+    def take_record_request(self, kind):
+        request = self.record_requests[kind]
+        if request.is_set():
+            request.clear()
+            return True
+        return False
 
     def getinternetstatsprocess(self, host="8.8.8.8", port=53, timeout=3):
         while True:
             try:
                 socket.setdefaulttimeout(timeout)
                 socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-                self.internet_status.set("🌍On|")
+                self.internet_online = True
+                self.ui.set(self.internet_status, "🌍On|")
             except socket.error:
-                self.internet_status.set("📵Off|")
+                self.internet_online = False
+                self.ui.set(self.internet_status, "📵Off|")
 
             time.sleep(5)
 
     # TODO: Dynammic internet status
     def sendcoughdataprocess(self):
-        logging.warning(f"[INFO] Start Sending Cough {self.internet_status.get()}, {self.SEND_COUGH}, {self.internet_status.get() == '🌍On|' and self.SEND_COUGH == True}")
+        logging.warning(f"[INFO] Start Sending Cough {self.internet_online}, {self.SEND_COUGH}, {self.internet_online and self.SEND_COUGH == True}")
         while True:
-            if self.internet_status.get() == "🌍On|" and self.SEND_COUGH == True:
+            if self.internet_online and self.SEND_COUGH == True:
                 with self.send_lock:
                     if not self.is_sending:
                         self.is_sending = True
                         try:
-                            #self.send_one_data_server("last_send_automatic", "cough", "automatic")
-                            self.send_one_data_server("last_send_soliced", "solic", "soliced")
+                            #self.uploader.drain("automatic")
+                            self.uploader.drain("soliced")
                         finally:
                             self.is_sending = False
                     else:
@@ -720,197 +736,136 @@ class CoughTk():
             hours = int(elapsed_time // 3600)
             minutes = int((elapsed_time % 3600) // 60)
             seconds = int(elapsed_time % 60)
-            self.txtrecord.set(f"Recording: {hours:02d}:{minutes:02d}:{seconds:02d}")
+            self.ui.set(self.txtrecord, f"Recording: {hours:02d}:{minutes:02d}:{seconds:02d}")
             time.sleep(1)
 
     def getCoughCount(self):
         while True:
-            autocoughcount = len(next(os.walk("Recorded_Data/automatic"))[2])
-            solicoughcount = 0
-            try:
-                with open(self.WEBPANEL_ROOT + '/data/current_patient.json') as pf:
-                    patient = json.load(pf)
-                    patient_nik = patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
-                    if not patient_nik:
-                        patient_nik = "unknown"
-                
-                patient_dir = os.path.join("Recorded_Data", "soliced", str(patient_nik))
-                if os.path.exists(patient_dir):
-                    solicoughcount = len(next(os.walk(patient_dir))[2])
-            except Exception as e:
-                logging.warning(f"[WARNING] Could not read current_patient.json or count files: {e}")
-                try:
-                    solicoughcount = len(next(os.walk("Recorded_Data/soliced"))[2])
-                except:
-                    solicoughcount = 0
+            # Index lookups, the folders are only listed again if they changed behind our back
+            autocoughcount = self.recording_index.count("automatic")
+            solicoughcount = self.recording_index.count(os.path.join("soliced", self.current_patient_nik()))
 
-            self.solicoughcount.set(f"Longi: {autocoughcount} |-| Solic: {solicoughcount}")
+            self.ui.set(self.solicoughcount, f"Longi: {autocoughcount} |-| Solic: {solicoughcount}")
             time.sleep(3)
 
-    def graphupdate(self, _):
-        self.line2.set_ydata(list(self.Y_buffer))
-        return (self.line2,)
-    
-    def do_updatefigure(self, ignore_cooldown=False):
-        if ignore_cooldown:
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
-            self.last_updateFigure = time.time()
-        else:
-            if time.time() - self.last_updateFigure > 3.0:
-                self.fig.canvas.draw()
-                self.fig.canvas.flush_events()
-                self.last_updateFigure = time.time()
-    
-    # TODO : Add Cancel Record Button
-    def record_audio_loop(self):
-        while True:
-            if self.current_page == 2 or self.current_page == 3:
-                length, data = self.pcm.read()
-                if length > 0:
-                    audio_data = np.frombuffer(data, dtype=np.int16)
-                    audio_data = audio_data.reshape(-1, self.CHANNELS)
-                    mono = np.mean(audio_data, axis=1).astype(np.float32) / 32768.0
-                    
-                    if np.all(mono == 0):
-                        self.patch_plot.set_facecolor('red')
-                        self.do_updatefigure(ignore_cooldown=True)
-                        time.sleep(0.01)
-                        continue
-                        
-                    if self.RECORD_FLAG:
-                        with self.buffer_lock:
-                            self.audio_buffer.extend(mono)
-                            if self.RECORD_LENGTH > 1000:
-                                should_stop = len(self.audio_buffer) >= self.RECORD_LENGTH
-                            else:
-                                with open(self.BTN2_FILE, "r") as stt:
-                                    RecSttop = stt.read().strip()
-                                with open(self.BTN3_FILE, "r") as cancel_stt:
-                                    RecCancel = cancel_stt.read().strip()
-
-                                should_stop = RecSttop == '0'
-                                should_cancel = RecCancel == '0'
-
-                                if should_stop:
-                                    with open(self.BTN2_FILE, "w") as out:
-                                        out.write('1')
-                                if should_cancel:
-                                    with open(self.BTN3_FILE, "w") as out:
-                                        out.write('1')
-                                        
-                            if self.recording_start_time and not self.recording_time_thread:
-                                self.start_recording_time_update()
-
-                            if should_stop or should_cancel:
-                                self.RECORD_FLAG = False
-                                self.recording_start_time = None
-                                self.stop_recording_time_update()
-                                if self.current_page == 2:
-                                    self.txtrecord.set("Recording: Automatic")
-                                    self.patch_plot.set_facecolor('blue')
-                                    self.do_updatefigure(ignore_cooldown=True)
-                                elif self.current_page == 3:
-                                    self.txtrecord.set("Ready to Record")
-
-                                if  should_cancel:
-                                    logging.info(f"[DEBUG] Recording cancelled by user. Buffer length: {len(self.audio_buffer)}")
-                                elif should_stop:
-                                    data_np = np.array(self.audio_buffer, dtype=np.float32)
-                                    logging.info(f"[DEBUG] Recording stopped. Buffer length: {len(self.audio_buffer)}, RECORD_LENGTH: {self.RECORD_LENGTH}")
-                                    t = Thread(target=self.handle_record_soli, args=(data_np.copy(),))
-                                    t.start()
-
-                                self.next_time = time.time()
-                                self.audio_buffer.clear()
-                    else:
-                        for sample in mono:
-                            self.audio_accumulator.append(sample)
-                            self.downsample_accumulator += sample
-                            self.downsample_counter += 1
-                            if self.downsample_counter >= self.downsample_ratio:
-                                avg_sample = self.downsample_accumulator / self.downsample_counter
-                                self.Y_buffer.append(avg_sample)
-                                self.downsample_counter = 0
-                                self.downsample_accumulator = 0.0
-
-                        with open(self.BTN1_FILE, "r") as stt:
-                            RecStt = stt.read().strip()
-
-                        if RecStt == '0':
-                            logging.info("Button press detected, starting manual recording")
-                            with open(self.BTN1_FILE, "w") as out:
-                                out.write('1')
-                            self.audio_buffer.clear()
-                            self.RECORD_FLAG = True
-                            self.recording_start_time = time.time()
-                            self.start_recording_time_update()
-
-                            logging.info(f"[DEBUG] Recording started. Buffer cleared. RECORD_FLAG: {self.RECORD_FLAG}")
-
-                            self.txtrecord.set("Recording: 00:00:00")
-                            self.patch_plot.set_facecolor('yellow')
-                            self.do_updatefigure(ignore_cooldown=True)
-                        else:
-                            if self.current_page == 2:
-                                with self.buffer_lock:
-                                    self.audio_buffer.extend(mono)
-                                    while len(self.audio_buffer) > self.window_size:
-                                        self.audio_buffer.popleft()
-
-                                current_gaptime = time.time() - self.next_time
-                                if len(self.audio_buffer) >= self.window_size and current_gaptime >= self.STEP_DURATION:
-                                    with self.buffer_lock:
-                                        data_np = np.array(self.audio_buffer, dtype=np.float32)
-            
-                                    self.next_time += self.STEP_DURATION #= time.time()
+    def start_audio_pipeline(self):
+        """ALSA reads run on their own capture thread, conversion and processing on consumer stages"""
+        self.pipeline = CapturePipeline(self.read_period, self.convert_period)
+        self.pipeline.add_stage("visualization", self.visualize_period, maxsize=8)
+        self.pipeline.add_stage("processing", self.process_period, maxsize=128)
+        # Enough recycled buffers for every period that can sit in a stage queue or handler
+        pool_size = max(stage.queue.maxsize for stage in self.pipeline.stages) + len(self.pipeline.stages) + 2
+        self.converter = PcmConverter(self.audio_source.channels, self.PERIOD_SIZE,
+                                      channel=self.CAPTURE_CHANNEL, pool_size=pool_size)
+        self.pipeline.start()
 
-                                    self.patch_plot.set_facecolor('blue')
-                                    self.do_updatefigure()
+    def read_period(self):
+        return self.capture.read()
 
-                                    t = Thread(target=self.handle_record_auto,
-                                            args=(data_np.copy(),))
-                                    t.start()
-                                
+    def on_capture_transition(self, active):
+        """Capture was suspended or resumed, periods still queued are from before and not analysed"""
+        self.pipeline.flush()
 
-                    time.sleep(0.01)
-                else:
-                    time.sleep(0.01)
+    def convert_period(self, length, data):
+        return self.converter.convert(data)
 
-    def handle_record_auto(self, audio_np):
-        audio_np = audio_np[self.AUDIO_POINT_START:]
+    def visualize_period(self, period):
+        if self.RECORD_FLAG or period.silent:
+            return
+        self.waveform_decimator.process(period.samples)
 
-        with open('autocough_config.json') as config_file:
-            cough_config = json.load(config_file)
-        
-        # Extract parameters with defaults
-        cough_padding = cough_config.get('cough_padding', 0.2)
-        min_cough_len = cough_config.get('min_cough_len', 0.2)
-        th_l_multiplier = cough_config.get('th_l_multiplier', 0.02)
-        th_h_multiplier = cough_config.get('th_h_multiplier', 1)
-        adaptive_method = cough_config.get('adaptive_method', 'default')
-    
-        coughSegments, _ = segment_cough(audio_np, self.SAMPLE_RATE, 
-                                                cough_padding=cough_padding, 
-                                                min_cough_len=min_cough_len,
-                                                th_l_multiplier=th_l_multiplier, 
-                                                th_h_multiplier=th_h_multiplier, 
-                                                adaptive_method=adaptive_method)
+    # TODO : Add Cancel Record Button
+    def process_period(self, period):
+        if period.silent:
+            self.waveform_view.set_status('red')
+            return
+
+        mono = period.samples
+
+        if self.RECORD_FLAG:
+            with self.buffer_lock:
+                self.audio_buffer.write(mono)
+                should_cancel = False
+                if self.RECORD_LENGTH > 1000:
+                    should_stop = len(self.audio_buffer) >= self.RECORD_LENGTH
+                else:
+                    should_stop = self.take_record_request('stop')
+                    should_cancel = self.take_record_request('cancel')
 
+                if self.audio_buffer.full and not should_stop:
+                    logging.warning(f"[WARNING] Recording reached {self.MAX_RECORD_DURATION}s, stopping")
+                    should_stop = True
+                            
+                if self.recording_start_time and not self.recording_time_thread:
+                    self.start_recording_time_update()
+
+                if should_stop or should_cancel:
+                    self.RECORD_FLAG = False
+                    self.recording_start_time = None
+                    self.stop_recording_time_update()
+                    if self.current_page == 2:
+                        self.ui.set(self.txtrecord, "Recording: Automatic")
+                        self.waveform_view.set_status('blue')
+                    elif self.current_page == 3:
+                        self.ui.set(self.txtrecord, "Ready to Record")
+
+                    if  should_cancel:
+                        logging.info(f"[DEBUG] Recording cancelled by user. Buffer length: {len(self.audio_buffer)}")
+                    elif should_stop:
+                        data_np = self.audio_buffer.read_latest()
+                        logging.info(f"[DEBUG] Recording stopped. Buffer length: {len(self.audio_buffer)}, RECORD_LENGTH: {self.RECORD_LENGTH}")
+                        self.recording_pool.submit(self.handle_record_soli, data_np)
+
+                    self.next_time = time.time()
+                    self.audio_buffer.clear()
+        else:
+            if self.take_record_request('start'):
+                logging.info("Button press detected, starting manual recording")
+                self.record_requests['stop'].clear()
+                self.record_requests['cancel'].clear()
+                self.audio_buffer.clear()
+                self.segmenter_reset.set()
+                self.RECORD_FLAG = True
+                self.recording_start_time = time.time()
+                self.start_recording_time_update()
+
+                logging.info(f"[DEBUG] Recording started. Buffer cleared. RECORD_FLAG: {self.RECORD_FLAG}")
+
+                self.ui.set(self.txtrecord, "Recording: 00:00:00")
+                self.waveform_view.set_status('yellow')
+            else:
+                if self.current_page == 2:
+                    segmenter = self.segmenter
+                    if segmenter is None or self.segmenter_reset.is_set():
+                        # Cleared first, a request that comes in while building gets another rebuild
+                        self.segmenter_reset.clear()
+                        segmenter = self.segmenter = StreamingSegmenter(self.SAMPLE_RATE, stats_duration=self.WINDOW_DURATION,
+                                                                        threshold_interval=self.STEP_DURATION, max_cough_len=self.WINDOW_DURATION,
+                                                                        **self.read_autocough_config())
+                    coughSegments = [segment for _, segment in segmenter.process(mono)]
+
+                    current_gaptime = time.time() - self.next_time
+                    if current_gaptime >= self.STEP_DURATION:
+                        self.next_time += self.STEP_DURATION #= time.time()
+                        self.waveform_view.set_status('blue')
+
+                    if len(coughSegments) > 0:
+                        self.recording_pool.submit(self.save_auto_coughs, coughSegments)
+
+    def read_autocough_config(self):
+        """Current segmentation parameters from the cached autocough_config.json, no file access"""
+        return dict(self.config_cache.get('autocough', autocough_params({})))
+
+    def save_auto_coughs(self, coughSegments):
         if len(coughSegments) > 0:
             logging.info(f"[INFO] Detected Cough: {len(coughSegments)}")
 
         for idx, now_cough in enumerate(coughSegments):
             logging.info(f"[INFO] Similarity Last Cough: {self.method_similarity_ratio(now_cough, self.last_cough_np)}")
             #if self.method_similarity_ratio(now_cough, self.last_cough_np) < 0.8:
-            self.patch_plot.set_facecolor('green')
-            self.do_updatefigure(ignore_cooldown=True)
-
-            onlyfiles = next(os.walk("Recorded_Data/automatic"))[2]
-            cough_count = len(onlyfiles) + 1
-            now_cough = now_cough.astype(np.float32)
-            timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-            sf.write(f'Recorded_Data/automatic/{timestamp}_{cough_count}.wav', now_cough, self.SAMPLE_RATE, 'PCM_24')
+            self.waveform_view.set_status('green')
+
+            self.recording_index.save("automatic", now_cough.astype(np.float32), self.SAMPLE_RATE)
                 #self.last_cough_np = now_cough
 
     def handle_record_soli(self, audio_np):
@@ -921,63 +876,41 @@ class CoughTk():
                     logging.warning("[WARNING] Empty audio data for solicited recording")
                     return
 
-                patient_nik = "unknown"
-                try:
-                    with open('/home/alarm/web_panel/data/current_patient.json') as pf:
-                        patient = json.load(pf)
-                        patient_nik = patient.get('nik') or patient.get('NIK') or patient.get('id') or "unknown"
-                        if not patient_nik:
-                            patient_nik = "unknown"
-                except Exception as e:
-                    logging.warning(f"[WARNING] Could not read current_patient.json: {e}")
-
-                # ensure patient-specific folder exists
-                patient_dir = os.path.join("Recorded_Data", "soliced", str(patient_nik))
-                os.makedirs(patient_dir, exist_ok=True)
-
-                onlyfiles = []
-                try:
-                    onlyfiles = next(os.walk(patient_dir))[2]
-                except StopIteration:
-                    onlyfiles = []
-                cough_count = len(onlyfiles) + 1
-                
+                patient_nik = self.current_patient_nik()
+
+                # the index creates the patient-specific folder
                 audio_np = audio_np[self.AUDIO_POINT_START:]
-                timestamp = datetime.now().strftime("%d-%m-%Y_%H%M")
-                filename = f'{timestamp}_{cough_count}.wav'
-                filepath = os.path.join(patient_dir, filename)
-                sf.write(filepath, audio_np, self.SAMPLE_RATE, 'PCM_24')
+                filepath = self.recording_index.save(os.path.join("soliced", str(patient_nik)), audio_np, self.SAMPLE_RATE)
+                filename = os.path.basename(filepath)
                 
                 logging.info(f"[INFO] Saved solicited recording: {filename}")
                 rel_path = os.path.join(str(patient_nik), filename)
-                self.append_to_lastsend_json("last_send_soliced", rel_path)
+                self.upload_queue.enqueue("soliced", rel_path)
             except Exception as e:
                 logging.error(f"[ERROR] Failed to save solicited recording: {e}")
 
         elif self.current_page == 3:
-            self.txtrecord.set("Waiting For Prediction to complete....")
-            self.prediction_status.set("Uploading Cough Samples...")
-            self.processing_progress.pack(pady=5)
-            self.processing_progress['value'] = 0
+            self.ui.set(self.txtrecord, "Waiting For Prediction to complete....")
+            self.ui.set(self.prediction_status, "Uploading Cough Samples...")
+            self.ui.call(self.processing_progress.pack, pady=5, key='progress_visible')
+            self.ui.config(self.processing_progress, value=0)
 
             #import librosa
             #audio_np, _ = librosa.load("/run/media/arkiven4/Other/Thesis/CoughThesis/PengambilanDataPrimer/Cough_RT/03-399-0304.wav", sr=self.SAMPLE_RATE)
             audio_np = audio_np[self.AUDIO_POINT_START:]
-            buffer = io.BytesIO()
-            sf.write(buffer, audio_np, self.SAMPLE_RATE, format='WAV', subtype='PCM_24')
-            #buffer.seek(0)
-            boundary = uuid.uuid4().hex
-
-            stream = multipart_stream(buffer, boundary, self.on_progress)
+            # Encoded block by block while it is sent, the whole file never exists in memory
+            encoded = self.prediction_codec.stream(audio_np, self.SAMPLE_RATE)
+            body = multipart_stream(encoded, self.on_progress, filename=f"audio{self.prediction_codec.extension}",
+                                    content_type=self.prediction_codec.content_type)
             headers = {
-                "Content-Type": f"multipart/form-data; boundary={boundary}"
+                "Content-Type": body.content_type
             }
             
             # TODO: Cloudflaretunneling maybe more fast
             try:
                 response = requests.post(
                     f"{self.SERVER_DOMAIN}:5765/submit_predition", 
-                    data=stream,
+                    data=body.request_data(),
                     headers=headers,
                     #files={'file': ('audio.wav', buffer, 'audio/wav')},
                     timeout=90
@@ -987,7 +920,7 @@ class CoughTk():
                     try:
                         response_json = response.json()
                         logging.warning(f"[INFO] current_page == 3: {response.text}")
-                        self.prediction_status.set("Connecting to server...")
+                        self.ui.set(self.prediction_status, "Connecting to server...")
                         threading.Thread(
                             target=self._run_async_stream,
                             args=(response_json['job_id'],),
@@ -996,32 +929,28 @@ class CoughTk():
                     except json.JSONDecodeError:
                         logging.warning(f"[WARNING] Invalid JSON response: {response.text}")
                 else:
-                    self.txtrecord.set("Ready to Record")
-                    self.processing_progress.pack_forget()
-                    self.tb_progress['value'] = 0.0
-                    self.non_tb_progress['value'] = 0.0
-                    self.non_tb_percentage.set(f"0.0%")
-                    self.tb_percentage.set(f"0.0%")
-                    self.prediction_status.set(f"❌ Unknown error - Please try again")
+                    self.reset_prediction("❌ Unknown error - Please try again")
                     logging.warning(f"[WARNING] Error Send File To Server: {response.status_code} - {response.text}")
             except Exception as e:
                 logging.error(f"[ERROR] Unexpected error during upload: {e}")
-                self.txtrecord.set("Ready to Record")
-                self.processing_progress.pack_forget()
-                self.tb_progress['value'] = 0.0
-                self.non_tb_progress['value'] = 0.0
-                self.non_tb_percentage.set(f"0.0%")
-                self.tb_percentage.set(f"0.0%")
-                self.prediction_status.set("❌ Unknown error - Please try again")
+                self.reset_prediction("❌ Unknown error - Please try again")
                 return
 
+    def reset_prediction(self, status):
+        """Back to "Ready to Record" with cleared results after a failed or empty prediction"""
+        self.ui.set(self.txtrecord, "Ready to Record")
+        self.ui.call(self.processing_progress.pack_forget, key='progress_visible')
+        self.ui.config(self.tb_progress, value=0.0)
+        self.ui.config(self.non_tb_progress, value=0.0)
+        self.ui.set(self.non_tb_percentage, "0.0%")
+        self.ui.set(self.tb_percentage, "0.0%")
+        self.ui.set(self.prediction_status, status)
+
     def on_progress(self, speed, pct, eta):
         kbps = speed / 1024
         eta_str = f"{eta:.1f}s" if eta != float("inf") else "∞"
-        self.prediction_status.set(
-            f"Uploading… {kbps:.1f} KB/s | {pct:.1f}% | ETA {eta_str}"
-        )
-        self.processing_progress["value"] = pct
+        self.ui.set(self.prediction_status, f"Uploading… {kbps:.1f} KB/s | {pct:.1f}% | ETA {eta_str}")
+        self.ui.config(self.processing_progress, value=pct)
         #self.processing_progress.update_idletasks()
 
     def _start_animation(self, base_text):
@@ -1035,7 +964,7 @@ class CoughTk():
             i = 0
             while self._anim_running:
                 animated_text = f"{base_text}{dots[i]}"
-                self.prediction_status.set(animated_text)
+                self.ui.set(self.prediction_status, animated_text)
                 i = (i + 1) % len(dots)
                 await asyncio.sleep(0.25)
 
@@ -1056,7 +985,7 @@ class CoughTk():
         ws_url = f"{self.SERVERWS_DOMAIN}:5765/stream_prediction/{job_id}"
         try:
             async with websockets.connect(ws_url) as ws:
-                self.prediction_status.set("Connected. Receiving server events...")
+                self.ui.set(self.prediction_status, "Connected. Receiving server events...")
                 while True:
                     try:
                         msg = await asyncio.wait_for(ws.recv(), timeout=60)
@@ -1064,7 +993,7 @@ class CoughTk():
                         logging.warning(f"[INFO] current_page == 3: {json.dumps(data, indent=2)}")
 
                         if "msg" in data:
-                            self.processing_progress['value'] = data.get('prog')
+                            self.ui.config(self.processing_progress, value=data.get('prog'))
                             self._start_animation(data["msg"])
                             #self.prediction_status.set(f"{data['msg']}")
 
@@ -1072,27 +1001,21 @@ class CoughTk():
                             self._stop_animation()
                             result = data["result"]
                             if result['success']:
-                                self.txtrecord.set("Ready to Record")
-                                self.processing_progress.pack_forget()
+                                self.ui.set(self.txtrecord, "Ready to Record")
+                                self.ui.call(self.processing_progress.pack_forget, key='progress_visible')
 
-                                self.non_tb_progress['value'] = result['class_0_pct']
-                                self.tb_progress['value'] = result['class_1_pct'] 
+                                self.ui.config(self.non_tb_progress, value=result['class_0_pct'])
+                                self.ui.config(self.tb_progress, value=result['class_1_pct'])
 
-                                self.non_tb_percentage.set(f"{result['class_0_pct']:.1f}%")
-                                self.tb_percentage.set(f"{result['class_1_pct']:.1f}%")
+                                self.ui.set(self.non_tb_percentage, f"{result['class_0_pct']:.1f}%")
+                                self.ui.set(self.tb_percentage, f"{result['class_1_pct']:.1f}%")
 
                                 if result['class_1_pct'] > 50:
-                                    self.prediction_status.set("⚠️ High TB probability detected!")
+                                    self.ui.set(self.prediction_status, "⚠️ High TB probability detected!")
                                 else:
-                                    self.prediction_status.set("✅ Low TB probability - likely healthy cough")
+                                    self.ui.set(self.prediction_status, "✅ Low TB probability - likely healthy cough")
                             else:
-                                self.txtrecord.set("Ready to Record")
-                                self.processing_progress.pack_forget()
-                                self.tb_progress['value'] = 0.0
-                                self.non_tb_progress['value'] = 0.0
-                                self.non_tb_percentage.set(f"0.0%")
-                                self.tb_percentage.set(f"0.0%")
-                                self.prediction_status.set(f"No Valid Cough Detected.......")
+                                self.reset_prediction("No Valid Cough Detected.......")
                             break
                             
                     except asyncio.TimeoutError:
@@ -1102,141 +1025,44 @@ class CoughTk():
         except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed, websockets.exceptions.WebSocketException) as e:
             logging.error(f"[ERROR] WebSocket connection failed: {e}")
             # Reset UI state on connection failure
-            self.txtrecord.set("Ready to Record")
-            self.processing_progress.pack_forget()
-            self.tb_progress['value'] = 0.0
-            self.non_tb_progress['value'] = 0.0
-            self.non_tb_percentage.set("0.0%")
-            self.tb_percentage.set("0.0%")
-            self.prediction_status.set("❌ Connection timeout - Please try again")
+            self.reset_prediction("❌ Connection timeout - Please try again")
             
         except Exception as e:
             logging.error(f"[ERROR] Unexpected WebSocket error: {e}")
             # Reset UI state on unexpected error
-            self.txtrecord.set("Ready to Record")
-            self.processing_progress.pack_forget()
-            self.tb_progress['value'] = 0.0
-            self.non_tb_progress['value'] = 0.0
-            self.non_tb_percentage.set("0.0%")
-            self.tb_percentage.set("0.0%")
-            self.prediction_status.set("❌ Connection error - Please try again")
+            self.reset_prediction("❌ Connection error - Please try again")
 
     def method_similarity_ratio(self, a, b):
         if a.shape != b.shape:
             return 0.0
         return np.mean(a == b)
 
-    def read_lastsend_json(self):
-        with open('Recorded_Data/last_send.json') as data_file:    
-            last_send_json = json.load(data_file)
-
-        return last_send_json
-
-    def modify_lastsend_json(self, last_send_json):
-        with open('Recorded_Data/last_send.json', 'w') as outfile:
-            json.dump(last_send_json, outfile)
-
-    def append_to_lastsend_json(self, key, filename):
-        last_send_json = self.read_lastsend_json()
-        if key not in last_send_json or not isinstance(last_send_json[key], list):
-            last_send_json[key] = []
-        if filename not in last_send_json[key]:
-            last_send_json[key].append(filename)
-        self.modify_lastsend_json(last_send_json)
-
-    def remove_from_lastsend_json(self, key, filename):
-        last_send_json = self.read_lastsend_json()
-        if key in last_send_json and filename in last_send_json[key]:
-            last_send_json[key].remove(filename)
-        self.modify_lastsend_json(last_send_json)
-
-    def send_one_data_server(self, current_key_send, file_prefix, folder_send):
-        last_send_json = self.read_lastsend_json()
-        files_to_send = last_send_json.get(current_key_send, [])
-        files_sorted = sorted(files_to_send, key=lambda x: int(re.search(r'_(\d+)\.wav$', x).group(1)) if re.search(r'_(\d+)\.wav$', x) else 0)
-
-        for nowfile_base in files_sorted:
-            nowfile = f'Recorded_Data/{folder_send}/{nowfile_base}'
-            if os.path.exists(nowfile):
-                logging.warning(f"[SENDING]: {nowfile}")
-
-                patient_nik = "unknown"
-                if '/' in nowfile_base:
-                    patient_nik = nowfile_base.split('/')[0]
-                elif folder_send == "soliced":
-                    path_parts = nowfile.split('/')
-                    if len(path_parts) >= 3:
-                        patient_nik = path_parts[-2]
-
-                try:
-                    with open(nowfile, 'rb') as f:
-                        response = requests.post(
-                            f"{self.SERVER_DOMAIN}/api/device/sendData_TBPrimer/{self.DEVICE_ID}", 
-                            files={'file_batuk': f}, 
-                            data={'nama': 'pasien', 'gender': 'unknown', 'umur': 0, 'cough_type': file_prefix, 'nik': patient_nik},
-                            timeout=30
-                        )
-                    logging.warning(f"[SENDING_STATUS]: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        try:
-                            response_json = response.json()
-                            if response_json.get('status') == 'success':
-                                self.remove_from_lastsend_json(current_key_send, nowfile_base)
-                                logging.warning(f"[SUCCESS] File sent successfully: {nowfile_base}")
-                            else:
-                                logging.warning(f"[WARNING] Server returned error: {response_json}")
-                        except json.JSONDecodeError:
-                            logging.warning(f"[WARNING] Invalid JSON response: {response.text}")
-                    else:
-                        logging.warning(f"[WARNING] Error Send File To Server: {response.status_code} - {response.text}")
-                        
-                except requests.exceptions.Timeout:
-                    logging.warning(f"[ERROR] Request timeout for file: {nowfile}")
-                except requests.exceptions.ConnectionError:
-                    logging.warning(f"[ERROR] Connection error for file: {nowfile}")
-                except requests.exceptions.RequestException as e:
-                    logging.warning(f"[ERROR] Request failed for file {nowfile}: {e}")
-                except Exception as e:
-                    logging.warning(f"[ERROR] Unexpected error sending file {nowfile}: {e}")
-
-                time.sleep(2)
-
-def multipart_stream(buffer, boundary, progress_callback):
-    buffer.seek(0)
-    total_bytes = len(buffer.getvalue())
-    sent = 0
-    start = time.time()
-
-    header = (
-        f"--{boundary}\r\n"
-        f'Content-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
-        f"Content-Type: audio/wav\r\n\r\n"
-    ).encode()
-
-    yield header
-    sent += len(header)
-
-    while True:
-        chunk = buffer.read(65536)
-        if not chunk:
-            break
-
-        sent += len(chunk)
-
-        elapsed = time.time() - start
+    def upload_fields(self, queue, name):
+        """Form fields sent with a queued recording, name is "<nik>/<file>" for solicited ones"""
+        patient_nik = name.split('/')[0] if '/' in name else "unknown"
+        cough_type = "solic" if queue == "soliced" else "cough"
+        return {'nama': 'pasien', 'gender': 'unknown', 'umur': 0, 'cough_type': cough_type, 'nik': patient_nik}
+
+def multipart_stream(encoded, progress_callback, filename="audio.wav", content_type="audio/wav"):
+    """MultipartBody sending an EncodedStream, progress_callback(speed, pct, eta) after every chunk
+
+    pct is the share of the body sent when its length is known up front (WAV), otherwise the
+    share of the audio encoded so far, which runs one block ahead of what was sent."""
+    start = None
+
+    def progress(sent):
+        nonlocal start
+        now = time.time()
+        if start is None:
+            start = now
+        elapsed = now - start
+        done = sent / body.length if body.length else encoded.progress
         speed = sent / elapsed if elapsed > 0 else 0
-        remaining = total_bytes - sent
-        eta_sec = remaining / speed if speed > 0 else math.inf
-
-        pct = (sent / total_bytes) * 100
-        progress_callback(speed, pct, eta_sec)
-
-        yield chunk
+        eta_sec = elapsed * (1 - done) / done if done > 0 and elapsed > 0 else math.inf
+        progress_callback(speed, done * 100, eta_sec)
 
-    closing = f"\r\n--{boundary}--\r\n".encode()
-    sent += len(closing)
-    yield closing
+    body = MultipartBody([], [("file", filename, encoded, content_type)], progress=progress)
+    return body
 
 
 if __name__ == "__main__":
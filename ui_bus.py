@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Main-thread dispatch of widget updates posted by worker threads"""
+
+import itertools, logging, threading
+import tkinter as tk
+from collections import OrderedDict
+
+
+class UiBus():
+    """Queue of pending UI updates, applied on the Tk thread once per frame
+
+    Worker threads never touch Tk objects, they post updates instead:
+
+        ui.set(self.txtrecord, "Ready to Record")        # tk Variable
+        ui.config(self.processing_progress, value=40)    # widget options
+        ui.call(self.show_page, 2)                       # anything else
+
+    Updates are keyed (a variable, one widget option, or the key given to call()), a newer
+    update replaces a pending one with the same key, so every key is applied at most once per
+    frame with its latest value. Variables and options already showing the value are skipped.
+    Unkeyed calls are all run, in the order they were posted. The queue is drained from an
+    after() callback every interval ms."""
+
+    def __init__(self, root, interval=50):
+        self.root = root
+        self.interval = interval
+        self._pending = OrderedDict()
+        self._applied = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._after_id = None
+        self.posted = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.skipped = 0
+
+    def _post(self, key, update):
+        with self._lock:
+            self.posted += 1
+            if key in self._pending:
+                self.coalesced += 1
+                self._pending.move_to_end(key)
+            self._pending[key] = update
+
+    def set(self, variable, value):
+        self._post(('var', str(variable)), ('var', variable, value))
+
+    def config(self, widget, **options):
+        for option, value in options.items():
+            self._post(('config', str(widget), option), ('config', widget, option, value))
+
+    def call(self, fn, *args, key=None, **kwargs):
+        if key is None:
+            key = ('call', next(self._sequence))
+        self._post(key, ('call', fn, args, kwargs))
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except tk.TclError:
+                pass # window already destroyed
+            self._after_id = None
+        logging.info(f"[INFO] UI bus: {self.posted} posted, {self.coalesced} coalesced, "
+                     f"{self.applied} applied, {self.skipped} unchanged")
+
+    def drain(self):
+        """Apply everything pending, must run on the Tk thread"""
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        for key, update in pending.items():
+            try:
+                if update[0] == 'var':
+                    _, variable, value = update
+                    if variable.get() == value:
+                        self.skipped += 1
+                        continue
+                    variable.set(value)
+                elif update[0] == 'config':
+                    _, widget, option, value = update
+                    if self._applied.get(key) == value:
+                        self.skipped += 1
+                        continue
+                    widget.configure(**{option: value})
+                    self._applied[key] = value
+                else:
+                    _, fn, args, kwargs = update
+                    fn(*args, **kwargs)
+                self.applied += 1
+            except Exception as e:
+                logging.error(f"[ERROR] UI update {key}: {e}")
+
+    def _tick(self):
+        self.drain()
+        self._after_id = self.root.after(self.interval, self._tick)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Durable queue of recordings waiting to be sent to the server"""
+
+import os, re, json, time, logging, sqlite3, threading
+from collections import OrderedDict
+
+NUMBER_PATTERN = re.compile(r'_(\d+)\.\w+$')
+
+
+class UploadQueue():
+    """Recordings still to be uploaded, per queue (recording folder, e.g. "soliced")
+
+    Items are file paths relative to their folder (e.g. "<nik>/<timestamp>_<n>.wav"). Every
+    enqueue() and ack() is one small SQLite transaction: an insert or a delete by primary key,
+    committed before the call returns. The database runs in WAL mode with synchronous=FULL, so a
+    committed change survives a crash or power loss and a torn write never loses the queue.
+
+    All pending items are also kept in memory (one ordered dict per queue), so pending() and
+    len() never touch the database. The database is only read in __init__.
+
+    Items of the old Recorded_Data/last_send.json lists are imported on first start and the
+    file renamed to last_send.json.migrated.
+
+    *path (str): SQLite database file
+    *legacy_json (str): last_send.json to import, None to skip"""
+
+    LEGACY_KEYS = {'last_send_soliced': 'soliced', 'last_send_automatic': 'automatic'}
+
+    def __init__(self, path='Recorded_Data/upload_queue.db', legacy_json=None):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pending ("
+                         "queue TEXT NOT NULL, name TEXT NOT NULL, added REAL NOT NULL, "
+                         "PRIMARY KEY (queue, name)) WITHOUT ROWID")
+        self.items = {}
+        for queue, name in self._db.execute("SELECT queue, name FROM pending ORDER BY added"):
+            self.items.setdefault(queue, OrderedDict())[name] = None
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json)
+        logging.info(f"[INFO] Upload queue: " + (", ".join(f"{queue} {len(items)}" for queue, items in self.items.items()) or "empty"))
+
+    def enqueue(self, queue, name):
+        """Add name to queue, returns False if it was already pending"""
+        with self._lock:
+            items = self.items.setdefault(queue, OrderedDict())
+            if name in items:
+                return False
+            self._db.execute("INSERT OR IGNORE INTO pending (queue, name, added) VALUES (?, ?, ?)", (queue, name, time.time()))
+            items[name] = None
+            return True
+
+    def ack(self, queue, name):
+        """Remove name from queue once it was delivered, returns False if it was not pending"""
+        with self._lock:
+            items = self.items.get(queue)
+            if not items or name not in items:
+                return False
+            self._db.execute("DELETE FROM pending WHERE queue = ? AND name = ?", (queue, name))
+            del items[name]
+            return True
+
+    def pending(self, queue):
+        """Snapshot of the names in queue, ordered by file number like the recordings were numbered"""
+        with self._lock:
+            names = list(self.items.get(queue, ()))
+        return sorted(names, key=lambda name: int(m.group(1)) if (m := NUMBER_PATTERN.search(name)) else 0)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(items) for items in self.items.values())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _import_legacy(self, legacy_json):
+        try:
+            with open(legacy_json) as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logging.warning(f"[WARNING] {legacy_json} unreadable, not imported: {e}")
+            return
+        imported = 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            for key, names in legacy.items():
+                if key in self.LEGACY_KEYS and isinstance(names, list):
+                    queue = self.LEGACY_KEYS[key]
+                    items = self.items.setdefault(queue, OrderedDict())
+                    for name in names:
+                        if name not in items:
+                            self._db.execute("INSERT OR IGNORE INTO pending (queue, name, added) VALUES (?, ?, ?)",
+                                             (queue, name, time.time()))
+                            items[name] = None
+                            imported += 1
+            self._db.execute("COMMIT")
+        os.replace(legacy_json, legacy_json + '.migrated')
+        logging.info(f"[INFO] Imported {imported} pending uploads from {legacy_json}")
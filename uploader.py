@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Concurrent upload of queued recordings over a pooled HTTP session"""
+
+import os, json, time, uuid, random, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from startup import lazy_import
+from audio_codec import content_type
+
+requests = lazy_import('requests')
+
+
+class TokenBucket():
+    """Rate limit: up to `burst` acquisitions at once, refilled at `rate` per second"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _SizedBody():
+    """Iterable with a len(), so requests sends it with a Content-Length instead of chunked"""
+
+    def __init__(self, body, length):
+        self.body = body
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.body)
+
+
+class MultipartBody():
+    """Streamed multipart/form-data request body
+
+    *fields: (name, value) pairs, value str or bytes
+    *files: (name, filename, source, content type), source is the path of a file read in
+     chunk_size pieces while sending, or an iterable of bytes (e.g. an audio_codec.EncodedStream)
+     with a `length` attribute that is None if the size is only known at the end
+    *progress (callable): progress(bytes sent so far) after every chunk
+
+    No file is ever loaded into memory as a whole. Pass request_data() as data= together with
+    headers={'Content-Type': body.content_type}: when every part has a known size the body goes
+    out with a Content-Length header, otherwise with chunked transfer encoding."""
+
+    def __init__(self, fields, files, boundary=None, chunk_size=65536, progress=None):
+        boundary = boundary or uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.parts = []
+        for name, value in fields:
+            value = value.encode() if isinstance(value, str) else value
+            self.parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode(), value, None))
+        for name, filename, source, content_type in files:
+            head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f'Content-Type: {content_type}\r\n\r\n').encode()
+            self.parts.append((head, None, source))
+        self.tail = f'--{boundary}--\r\n'.encode()
+        sizes = [len(value) if source is None else (os.path.getsize(source) if isinstance(source, str) else source.length)
+                 for _, value, source in self.parts]
+        self.length = None if None in sizes else len(self.tail) + sum(len(head) + 2 for head, _, _ in self.parts) + sum(sizes)
+        self.sent = 0
+
+    def request_data(self):
+        return _SizedBody(self, self.length) if self.length is not None else iter(self)
+
+    def _chunks(self):
+        for head, value, source in self.parts:
+            yield head
+            if source is None:
+                yield value
+            elif isinstance(source, str):
+                with open(source, 'rb') as f:
+                    while True:
+                        chunk = f.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+            else:
+                for data in source:
+                    for i in range(0, len(data), self.chunk_size):
+                        yield data[i:i + self.chunk_size]
+            yield b'\r\n'
+        yield self.tail
+
+    def __iter__(self):
+        self.sent = 0
+        for chunk in self._chunks():
+            self.sent += len(chunk)
+            if self.progress:
+                self.progress(self.sent)
+            yield chunk
+
+
+class BatchUnsupported(Exception):
+    """The batch endpoint does not exist on the server"""
+
+
+class Uploader():
+    """Sends the files of an UploadQueue to the server, several at a time
+
+    One requests.Session with a connection pool of `workers` keep-alive connections is shared by
+    `workers` upload threads. It is created by the first upload, so constructing an Uploader at
+    startup does not import requests. Instead of a fixed pause after every file, uploads are started by a
+    token bucket (`rate` per second, bursts of `burst`). A failed file is retried after an
+    exponential backoff with full jitter (random between 0 and backoff * 2^failures, at most
+    max_backoff seconds), other files are not held up by it.
+
+    A file counts as delivered, and is acked in the queue, when the server answers 200 with
+    {"status": "success"}. A queued file that no longer exists is dropped from the queue and
+    counted as skipped, not as failed. Every upload is logged with its size and rate, every
+    drain() pass with the totals.
+
+    With a batch_url, up to batch_size files (batch_bytes in total) go up in one streamed
+    multipart POST: a "manifest" field with one item per file (its form fields, file name,
+    recording time and the name of the part holding it) followed by the files. The server
+    answers {"status": ..., "results": [{"id": <item id>, "status": "success" | "error"}, ...]},
+    and every item is acked or backed off on its own. If the batch endpoint answers 404, 405
+    or 501, the uploader falls back to one POST per file to url for good.
+
+    *url (str): endpoint receiving one multipart POST per file
+    *fields (callable): fields(queue, name) -> dict of form fields sent with the file
+    *file_field (str): form field name of the file
+    *batch_url (str): endpoint receiving batches, None for one POST per file"""
+
+    def __init__(self, url, upload_queue, root='Recorded_Data', fields=None, file_field='file_batuk', workers=4,
+                 rate=4.0, burst=4, timeout=30, backoff=2.0, max_backoff=300.0, batch_url=None, batch_size=32,
+                 batch_bytes=8000000):
+        self.url = url
+        self.batch_url = batch_url
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.queue = upload_queue
+        self.root = root
+        self.fields = fields or (lambda queue, name: {})
+        self.file_field = file_field
+        self.workers = workers
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst)
+
+        self._session = None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+
+        self._lock = threading.Lock()
+        self._retry = {}  # (queue, name) -> (failures, monotonic time of the next attempt)
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.busy_time = 0.0
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, pool_block=True)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+            return self._session
+
+    def due(self, queue):
+        """Pending names of queue that are not waiting out a backoff"""
+        now = time.monotonic()
+        with self._lock:
+            return [name for name in self.queue.pending(queue)
+                    if self._retry.get((queue, name), (0, 0.0))[1] <= now]
+
+    def drain(self, queue):
+        """Upload everything due in queue, returns (sent, failed) of this pass"""
+        names = self.due(queue)
+        if not names:
+            return 0, 0
+        start = time.perf_counter()
+        if self.batch_url:
+            results = [r for batch in self._pool.map(lambda batch: self._upload_batch(queue, batch), self._batches(queue, names))
+                       for r in batch]
+        else:
+            results = list(self._pool.map(lambda name: self._upload(queue, name), names))
+        elapsed = time.perf_counter() - start
+        sent = sum(1 for ok, _ in results if ok)
+        skipped = sum(1 for ok, _ in results if ok is None)
+        failed = len(results) - sent - skipped
+        size = sum(size for ok, size in results if ok)
+        logging.info(f"[INFO] Upload pass {queue}: {sent} sent, {failed} failed, {skipped} skipped (file gone), "
+                     f"{size / 1e3:.0f} kB in {elapsed:.1f} s ({sent / elapsed:.2f} files/s, {size / 1e3 / elapsed:.0f} kB/s), "
+                     f"{len(self.queue.pending(queue))} still queued")
+        return sent, failed
+
+    def _skip(self, queue, name, path):
+        """Drop a queued file that no longer exists, returns (None, 0): neither delivered nor failed"""
+        logging.warning(f"[WARNING] Queued file is gone, dropped from upload queue: {path}")
+        self.queue.ack(queue, name)
+        with self._lock:
+            self.skipped += 1
+        return None, 0
+
+    def _upload(self, queue, name):
+        """One file, returns (delivered, bytes), delivered is None if the file was gone"""
+        path = os.path.join(self.root, queue, name)
+        if not os.path.exists(path):
+            return self._skip(queue, name, path)
+
+        self.bucket.acquire()
+        start = time.perf_counter()
+        error, size = None, 0
+        try:
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                response = self.session.post(self.url, files={self.file_field: f}, data=self.fields(queue, name), timeout=self.timeout)
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code} - {response.text[:200]}"
+            elif response.json().get('status') != 'success':
+                error = f"server returned {response.text[:200]}"
+        except json.JSONDecodeError:
+            error = f"invalid JSON response: {response.text[:200]}"
+        except requests.exceptions.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            error = f"unexpected {type(e).__name__}: {e}"
+        return self._finish(queue, name, size, time.perf_counter() - start, error)
+
+    def _batches(self, queue, names):
+        """Split names into batches of at most batch_size files and batch_bytes"""
+        batch, size = [], 0
+        for name in names:
+            try:
+                file_size = os.path.getsize(os.path.join(self.root, queue, name))
+            except OSError:
+                file_size = 0
+            if batch and (len(batch) >= self.batch_size or size + file_size > self.batch_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(name)
+            size += file_size
+        if batch:
+            yield batch
+
+    def _upload_batch(self, queue, names):
+        """Files of one batch request, returns (delivered, bytes) per name, delivered is None if the file was gone"""
+        if not self.batch_url:
+            return [self._upload(queue, name) for name in names]
+        items, files, present = [], [], []
+        for i, name in enumerate(names):
+            path = os.path.join(self.root, queue, name)
+            try:
+                recorded = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')
+            except OSError:
+                self._skip(queue, name, path)
+                continue
+            field = f"file_{i}"
+            items.append(dict(self.fields(queue, name), id=i, field=field, filename=os.path.basename(name), recorded_at=recorded))
+            files.append((field, os.path.basename(name), path, content_type(path)))
+            present.append((i, name, path))
+        if not present:
+            return [(None, 0)] * len(names)
+
+        self.bucket.acquire()
+        start = time.perf_counter()
+        error, statuses = None, {}
+        try:
+            manifest = json.dumps({'queue': queue, 'items': items})
+            body = MultipartBody([('manifest', manifest)], files)
+            response = self.session.post(self.batch_url, data=body.request_data(), timeout=self.timeout,
+                                         headers={'Content-Type': body.content_type})
+            if response.status_code in (404, 405, 501):
+                raise BatchUnsupported(f"HTTP {response.status_code}")
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code} - {response.text[:200]}"
+            else:
+                reply = response.json()
+                statuses = {r.get('id'): r.get('status') for r in reply.get('results') or []}
+                if not statuses and reply.get('status') != 'success':
+                    error = f"server returned {response.text[:200]}"
+        except BatchUnsupported as e:
+            with self._lock:
+                if self.batch_url:
+                    logging.warning(f"[WARNING] Batch upload endpoint not available ({e}), falling back to one request per file")
+                self.batch_url = None
+            present_names = {name for _, name, _ in present}
+            return [self._upload(queue, name) if name in present_names else (None, 0) for name in names]
+        except json.JSONDecodeError:
+            error = f"invalid JSON response: {response.text[:200]}"
+        except requests.exceptions.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            error = f"unexpected {type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+
+        results = {}
+        for i, name, path in present:
+            item_error = error
+            if item_error is None and statuses and statuses.get(i) != 'success':
+                item_error = f"item {statuses.get(i) or 'missing from the reply'}"
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            results[name] = self._finish(queue, name, size, elapsed, item_error, batch=len(present))
+        return [results.get(name, (None, 0)) for name in names]
+
+    def _finish(self, queue, name, size, elapsed, error, batch=None):
+        """Ack a delivered file or schedule its retry, returns (delivered, bytes)"""
+        with self._lock:
+            self.busy_time += elapsed
+            if error is None:
+                self._retry.pop((queue, name), None)
+                self.sent += 1
+                self.bytes_sent += size
+            else:
+                failures = self._retry.get((queue, name), (0, 0.0))[0] + 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** failures))
+                self._retry[(queue, name)] = (failures, time.monotonic() + delay)
+                self.failed += 1
+
+        if error is None:
+            self.queue.ack(queue, name)
+            if batch:
+                logging.info(f"[INFO] Uploaded {name}: {size / 1e3:.0f} kB in a batch of {batch}, {elapsed:.2f} s for the batch")
+            else:
+                logging.info(f"[INFO] Uploaded {name}: {size / 1e3:.0f} kB in {elapsed:.2f} s ({size / 1e3 / max(elapsed, 1e-6):.0f} kB/s)")
+            return True, size
+        logging.warning(f"[WARNING] Upload of {name} failed ({error}), retry {failures} in {delay:.1f} s")
+        return False, 0
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._session is not None:
+            self._session.close()
@@ -1,31 +1,8 @@
 import numpy as np
-#import librosa
-import random, math
-#from scipy.ndimage import zoom
+import math
 
-SR_MODEL = 16000
-window_samples = int(0.5 * SR_MODEL)      # 0.5s window
-hop_samples    = int(0.05 * SR_MODEL)     # 50ms hop
-
-def segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.2, adaptive_method='percentile', th_l_multiplier = 0.1, th_h_multiplier = 2):
-    """Preprocess the data by segmenting each file into individual coughs using a hysteresis comparator on the signal power
-    
-    Inputs:
-    *x (np.array): cough signal
-    *fs (float): sampling frequency in Hz
-    *cough_padding (float): number of seconds added to the beginning and end of each detected cough to make sure coughs are not cut short
-    *min_cough_length (float): length of the minimum possible segment that can be considered a cough
-    *th_l_multiplier (float): multiplier of the RMS energy used as a lower threshold of the hysteresis comparator
-    *th_h_multiplier (float): multiplier of the RMS energy used as a high threshold of the hysteresis comparator
-    
-    Outputs:
-    *coughSegments (np.array of np.arrays): a list of cough signal arrays corresponding to each cough
-    cough_mask (np.array): an array of booleans that are True at the indices where a cough is in progress"""
-                
-    cough_mask = np.array([False]*len(x))
-
-    #Define hysteresis thresholds
-    
+def cough_thresholds(x, adaptive_method='percentile', th_l_multiplier=0.1, th_h_multiplier=2):
+    """(seg_th_l, seg_th_h) of the hysteresis comparator, adapted to the signal power of x (see segment_cough)"""
     if adaptive_method == 'percentile':
         signal_power = x**2
         seg_th_l = np.percentile(signal_power, 75) 
@@ -45,100 +22,507 @@ def segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.2, adaptive_method='
         rms = np.sqrt(np.mean(np.square(x)))
         seg_th_l = th_l_multiplier * rms
         seg_th_h =  th_h_multiplier * rms
+    return seg_th_l, seg_th_h
+
+def segment_cough(x, fs, cough_padding=0.2, min_cough_len=0.2, adaptive_method='percentile', th_l_multiplier = 0.1, th_h_multiplier = 2):
+    """Preprocess the data by segmenting each file into individual coughs using a hysteresis comparator on the signal power
+    
+    Inputs:
+    *x (np.array): cough signal
+    *fs (float): sampling frequency in Hz
+    *cough_padding (float): number of seconds added to the beginning and end of each detected cough to make sure coughs are not cut short
+    *min_cough_length (float): length of the minimum possible segment that can be considered a cough
+    *th_l_multiplier (float): multiplier of the RMS energy used as a lower threshold of the hysteresis comparator
+    *th_h_multiplier (float): multiplier of the RMS energy used as a high threshold of the hysteresis comparator
+    
+    Outputs:
+    *coughSegments (np.array of np.arrays): a list of cough signal arrays corresponding to each cough
+    cough_mask (np.array): an array of booleans that are True at the indices where a cough is in progress"""
+                
+    cough_mask = np.zeros(len(x), dtype=bool)
+
+    #Define hysteresis thresholds
+    seg_th_l, seg_th_h = cough_thresholds(x, adaptive_method, th_l_multiplier, th_h_multiplier)
 
     #Segment coughs
     coughSegments = []
     padding = round(fs*cough_padding)
     min_cough_samples = round(fs*min_cough_len)
-    cough_start = 0
-    cough_end = 0
-    cough_in_progress = False
     tolerance = round(0.01*fs)
-    below_th_counter = 0
-    
-    for i, sample in enumerate(x**2):
-        if cough_in_progress:
-            if sample<seg_th_l:
-                below_th_counter += 1
-                if below_th_counter > tolerance:
-                    cough_end = i+padding if (i+padding < len(x)) else len(x)-1
-                    cough_in_progress = False
-                    if (cough_end+1-cough_start-2*padding>min_cough_samples):
-                        coughSegments.append(x[cough_start:cough_end+1])
-                        cough_mask[cough_start:cough_end+1] = True
-            elif i == (len(x)-1):
-                cough_end=i
-                cough_in_progress = False
-                if (cough_end+1-cough_start-2*padding>min_cough_samples):
-                    coughSegments.append(x[cough_start:cough_end+1])
-            else:
-                below_th_counter = 0
-        else:
-            if sample>seg_th_h:
-                cough_start = i-padding if (i-padding >=0) else 0
-                cough_in_progress = True
+    n = len(x)
+    if n == 0:
+        return coughSegments, cough_mask
+
+    # The comparator is evaluated on threshold crossings instead of per sample:
+    # onsets come from the samples above seg_th_h, offsets from the first run of
+    # more than `tolerance` samples below seg_th_l after the onset.
+    signal_power = x**2
+    cmp_dtype = np.result_type(signal_power.dtype, np.asarray(seg_th_l).dtype, np.asarray(seg_th_h).dtype)
+    cmp_power = signal_power.astype(cmp_dtype, copy=False)
+    below_l = cmp_power < seg_th_l
+    onsets = np.flatnonzero(cmp_power > seg_th_h)
+    not_below = np.flatnonzero(~below_l)
+
+    # Sample index at which each long enough run below seg_th_l exceeds the tolerance
+    edges = np.diff(below_l.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    offsets = run_starts[(run_ends - run_starts) > tolerance] + tolerance
+
+    # The below-threshold counter is never reset when a new cough starts, so after
+    # the first offset it stays above the tolerance until a sample >= seg_th_l.
+    counter_exceeded = False
+    pos = 0
+    while True:
+        k = np.searchsorted(onsets, pos)
+        if k == len(onsets):
+            break
+        onset = onsets[k]
+        cough_start = onset-padding if (onset-padding >= 0) else 0
+        scan = onset + 1
+        if scan >= n:
+            break
+
+        k = np.searchsorted(not_below, scan)
+        reset = not_below[k] if k < len(not_below) else n
+        offset = scan if counter_exceeded else scan + tolerance
+        if offset >= reset:
+            if reset >= n-1:
+                # Never ends, or the last sample closes the cough without marking it
+                if reset == n-1 and (n-1+1-cough_start-2*padding > min_cough_samples):
+                    coughSegments.append(x[cough_start:n])
+                break
+            k = np.searchsorted(offsets, reset, side='right')
+            if k == len(offsets):
+                if not below_l[n-1] and (n-1+1-cough_start-2*padding > min_cough_samples):
+                    coughSegments.append(x[cough_start:n])
+                break
+            offset = offsets[k]
+
+        cough_end = offset+padding if (offset+padding < n) else n-1
+        counter_exceeded = True
+        if (cough_end+1-cough_start-2*padding>min_cough_samples):
+            coughSegments.append(x[cough_start:cough_end+1])
+            cough_mask[cough_start:cough_end+1] = True
+        pos = offset + 1
     
     return coughSegments, cough_mask
 
-# def pre_process_audio_mel(audio, sr=16000):
-#     S = librosa.feature.melspectrogram(
-#         y=audio, sr=sr, n_fft=1024, hop_length=512,
-#         fmin=50, fmax=2000, n_mels=64, power=2.0
-#     )
-#     S_db = librosa.power_to_db(S, ref=np.max)
-#     S_db = (S_db - S_db.min()) / (S_db.max() - S_db.min() + 1e-8)
-    
-#     resized = zoom(S_db, (64/S_db.shape[0], 64/S_db.shape[1]), order=1)
-#     return resized.astype(np.float32)  # [64,64]
+def pcm_to_mono(data, channels):
+    """Interleaved S16_LE period (bytes from alsaaudio.PCM.read) to mono float32 in [-1, 1)"""
+    audio_data = np.frombuffer(data, dtype=np.int16)
+    audio_data = audio_data.reshape(-1, channels)
+    return np.mean(audio_data, axis=1).astype(np.float32) / 32768.0
 
-# def process_audio_with_original(audio_orig, sr_orig, session=None, min_cough_samples=0.0, padding=0.0):
-#     min_cough_samples = int(min_cough_samples * SR_MODEL)   # 200ms min duration
-#     padding = int(padding * SR_MODEL)
-    
-#     # Resample for model
-#     audio_model = librosa.resample(audio_orig, orig_sr=sr_orig, target_sr=SR_MODEL)
-
-#     # Sliding windows in model space
-#     starts = np.arange(0, len(audio_model) - window_samples, hop_samples, dtype=int)
-#     windows = [audio_model[s:s+window_samples] for s in starts]
-
-#     processed = [pre_process_audio_mel(w) for w in windows]
-#     batch_input = np.stack(processed, axis=0)
-
-#     # Model inference
-#     raw_predictions = session.run(None, {"input": batch_input})[0]
-#     cough_probs = raw_predictions[:, 1] if raw_predictions.shape[1] > 1 else raw_predictions[:, 0]
-#     cough_mask_windows = cough_probs > 0.5
-
-#     # Map window-level mask to sample-level (model rate)
-#     cough_mask_samples = np.zeros(len(audio_model), dtype=bool)
-#     sel = np.nonzero(cough_mask_windows)[0]
-#     if len(sel) > 0:
-#         win_idx = np.arange(window_samples)
-#         idx = starts[sel, None] + win_idx[None, :]
-#         idx = idx.ravel()
-#         idx = idx[idx < len(audio_model)]
-#         cough_mask_samples[idx] = True
-
-#     # Run-length encode in model space
-#     mask = cough_mask_samples.astype(int)
-#     diff = np.diff(mask, prepend=0, append=0)
-#     seg_starts = np.flatnonzero(diff == 1)
-#     seg_ends   = np.flatnonzero(diff == -1)
-
-#     cough_mask_final = np.zeros_like(cough_mask_samples, dtype=bool)
-#     segments_orig = []
-#     scale = sr_orig / SR_MODEL
-
-#     for s, e in zip(seg_starts, seg_ends):
-#         if (e - s) >= min_cough_samples:
-#             s_pad = max(0, s - padding)
-#             e_pad = min(len(audio_model), e + padding)
-#             cough_mask_final[s_pad:e_pad] = True
-
-#             # Map back to original indices
-#             s_orig = int(s_pad * scale)
-#             e_orig = int(e_pad * scale)
-#             segments_orig.append(audio_orig[s_orig:e_orig])
-
-#     return segments_orig, cough_mask_final
+class Period():
+    """One converted capture period: mono samples plus the level statistics of the same samples"""
+
+    __slots__ = ('samples', 'silent', 'peak', 'rms')
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.silent = True
+        self.peak = 0.0
+        self.rms = 0.0
+
+class PcmConverter():
+    """Allocation-free S16_LE to mono float32 conversion
+
+    The int16 period is only viewed (np.frombuffer), the channels are summed straight into a
+    preallocated float32 buffer with out= ufuncs and scaled in place, so no float64 temporaries are
+    created. With channel set only that channel is used (e.g. a device that duplicates one microphone
+    on both channels). The same call fills in silence, peak and RMS: min/max and a dot product on
+    the freshly written buffer, which replaces the separate np.all(mono == 0) pass.
+
+    convert() hands out the buffers of a pool of pool_size Periods in turn, so a Period is reused
+    pool_size periods later. Consumers must copy what they keep (RingBuffer.write and the segmenter
+    already do) and pool_size must exceed the number of periods that can be queued at once."""
+
+    def __init__(self, channels, period_size, channel=None, pool_size=2):
+        if channel is not None and not 0 <= channel < channels:
+            raise ValueError(f"Channel {channel} out of range for {channels} channels")
+        self.channels = channels
+        self.channel = channel
+        self.period_size = period_size
+        self.scale = np.float32(1.0 / (32768.0 * (1 if channel is not None else channels)))
+        self._pool = [Period(np.zeros(period_size, dtype=np.float32)) for _ in range(pool_size)]
+        self._buffers = [period.samples for period in self._pool]
+        self._next = 0
+
+    def convert(self, data):
+        pcm = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        n = len(pcm)
+        if n > self.period_size:
+            raise ValueError(f"Period of {n} frames, converter sized for {self.period_size}")
+        slot = self._next
+        self._next = (slot + 1) % len(self._pool)
+        period = self._pool[slot]
+        out = self._buffers[slot][:n]
+
+        if self.channel is not None:
+            np.multiply(pcm[:, self.channel], self.scale, out=out, dtype=np.float32)
+        else:
+            np.add(pcm[:, 0], pcm[:, 1] if self.channels > 1 else 0, out=out, dtype=np.float32)
+            for c in range(2, self.channels):
+                np.add(out, pcm[:, c], out=out, dtype=np.float32)
+            np.multiply(out, self.scale, out=out)
+
+        period.samples = out
+        if n:
+            low, high = out.min(), out.max()
+            period.peak = float(max(-low, high))
+            period.silent = period.peak == 0.0
+            period.rms = float(np.sqrt(np.dot(out, out) / n))
+        else:
+            period.peak, period.silent, period.rms = 0.0, True, 0.0
+        return period
+
+class RingBuffer():
+    """Fixed-capacity NumPy ring buffer for audio samples
+
+    write() copies a whole block in at most two slice assignments, and the latest samples are read
+    back either as two zero-copy views (segments) or as one contiguous copy (read_latest), optionally
+    into a preallocated output array. The storage comes from np.zeros, so capacity that has never
+    been written to is not backed by physical memory yet."""
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self._data = np.zeros(self.capacity, dtype=dtype)
+        self.clear()
+
+    def clear(self):
+        self._pos = 0
+        self.total_written = 0
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    @property
+    def full(self):
+        return self.total_written >= self.capacity
+
+    def write(self, x):
+        x = np.asarray(x)
+        n = len(x)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            self._data[:] = x[-self.capacity:]
+            self._pos = 0
+        else:
+            first = min(n, self.capacity - self._pos)
+            self._data[self._pos:self._pos+first] = x[:first]
+            self._data[:n-first] = x[first:]
+            self._pos = (self._pos + n) % self.capacity
+        self.total_written += n
+
+    def segments(self, n=None):
+        """Latest n samples (all stored samples by default) as (older, newer) views into the buffer"""
+        n = len(self) if n is None else min(n, len(self))
+        start = (self._pos - n) % self.capacity
+        if start + n <= self.capacity:
+            return self._data[start:start+n], self._data[:0]
+        return self._data[start:], self._data[:self._pos]
+
+    def read_latest(self, n=None, out=None):
+        """Contiguous copy of the latest n samples, written into out when given"""
+        older, newer = self.segments(n)
+        size = len(older) + len(newer)
+        out = np.empty(size, dtype=self._data.dtype) if out is None else out[:size]
+        out[:len(older)] = older
+        out[len(older):] = newer
+        return out
+
+class WaveformDecimator():
+    """Block decimator that turns captured periods into points for the waveform display
+
+    Whole blocks of `ratio` samples are reduced at once with a reshape, either to their mean or,
+    with mode='envelope', to a (min, max) pair. Samples that do not fill a block are carried over
+    to the next call, and the points go into a fixed-size display RingBuffer."""
+
+    def __init__(self, ratio, length, mode='mean'):
+        if mode not in ('mean', 'envelope'):
+            raise ValueError(f"Unknown decimation mode: {mode}")
+        self.ratio = int(ratio)
+        self.mode = mode
+        self.display = RingBuffer(length)
+        self.display.write(np.zeros(length, dtype=np.float32))
+        self._leftover = np.zeros(self.ratio, dtype=np.float32)
+        self._n_leftover = 0
+
+    def _reduce(self, blocks):
+        if self.mode == 'mean':
+            return blocks.mean(axis=1)
+        points = np.empty((len(blocks), 2), dtype=np.float32)
+        blocks.min(axis=1, out=points[:, 0])
+        blocks.max(axis=1, out=points[:, 1])
+        return points.ravel()
+
+    def process(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if self._n_leftover:
+            take = min(self.ratio - self._n_leftover, len(x))
+            self._leftover[self._n_leftover:self._n_leftover+take] = x[:take]
+            self._n_leftover += take
+            x = x[take:]
+            if self._n_leftover < self.ratio:
+                return
+            self.display.write(self._reduce(self._leftover[None, :]))
+            self._n_leftover = 0
+
+        n_blocks = len(x) // self.ratio
+        if n_blocks:
+            self.display.write(self._reduce(x[:n_blocks*self.ratio].reshape(n_blocks, self.ratio)))
+        rest = len(x) - n_blocks*self.ratio
+        self._leftover[:rest] = x[len(x)-rest:]
+        self._n_leftover = rest
+
+    def values(self, out=None):
+        """Display points, oldest first"""
+        return self.display.read_latest(out=out)
+
+class PolyphaseResampler():
+    """Stateful rational-ratio resampler (e.g. 44.1 kHz capture to the model's 16 kHz), float32 out
+
+    The anti-aliasing FIR is designed once the way scipy.signal.resample_poly does it (Kaiser
+    window, beta 5, 10 zero crossings per side) and split into `up` polyphase branches, so each
+    output sample is one dot product with the branch its phase selects. Every `up` outputs
+    consume exactly `down` inputs, so the branches are laid out as the columns of one matrix
+    and a chunk is resampled with a single matmul over input frames `down` samples apart. The input tail that
+    later outputs still need is kept between calls: feeding a signal period by period gives the
+    same samples as resampling it in one go, without edge effects at chunk boundaries.
+
+    Outputs are aligned like resample_poly (zero phase, zeros before the first sample), which
+    means each output waits for up to half the filter length of future input. flush() feeds
+    zeros to produce the remaining ceil(n_in * up / down) total outputs.
+
+    *orig_sr, target_sr (int): rates, reduced to up/down (160/441 for 44100 -> 16000)"""
+
+    def __init__(self, orig_sr=44100, target_sr=16000, window=('kaiser', 5.0)):
+        from scipy.signal import firwin
+        g = math.gcd(int(orig_sr), int(target_sr))
+        self.up, self.down = int(target_sr) // g, int(orig_sr) // g
+        max_rate = max(self.up, self.down)
+        self.half_len = 10 * max_rate
+        h = firwin(2 * self.half_len + 1, 1.0 / max_rate, window=window) * self.up
+        self.taps = -(-len(h) // self.up)
+        bank = np.zeros((self.up, self.taps))
+        for phase in range(self.up):
+            branch = h[phase::self.up]
+            bank[phase, :len(branch)] = branch
+        # Reversed so a branch lines up with an ascending slice of input
+        bank = bank[:, ::-1]
+
+        # Output c * up + p of cycle c reads taps inputs from c * down + offsets[p] on
+        phases = np.arange(self.up) * self.down + self.half_len
+        offsets = phases // self.up - (self.taps - 1)
+        self.offset = int(offsets[0])
+        self.frame = int(offsets[-1] - offsets[0]) + self.taps
+        self.matrix = np.zeros((self.frame, self.up), dtype=np.float32)
+        for p in range(self.up):
+            o = offsets[p] - self.offset
+            self.matrix[o:o + self.taps, p] = bank[phases[p] % self.up]
+        self.reset()
+
+    def reset(self):
+        self._buffer = np.zeros(self.taps - 1, dtype=np.float32)  # input from sample self._base on
+        self._base = -(self.taps - 1)
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, x):
+        """Resample the next chunk, returns the outputs that are complete now"""
+        x = np.asarray(x, dtype=np.float32)
+        self._buffer = np.concatenate([self._buffer, x])
+        self.samples_in += len(x)
+
+        # Output n needs input up to (n * down + half_len) // up
+        last = (self.samples_in * self.up - 1 - self.half_len) // self.down
+        if last < self.samples_out:
+            return np.zeros(0, dtype=np.float32)
+
+        # Whole cycles covering the outputs, the buffer is zero padded for the last one and the
+        # outputs that are not complete yet are cut off
+        first_cycle, last_cycle = self.samples_out // self.up, last // self.up
+        start = first_cycle * self.down + self.offset - self._base
+        needed = start + (last_cycle - first_cycle) * self.down + self.frame
+        buffer = self._buffer
+        if needed > len(buffer):
+            buffer = np.concatenate([buffer, np.zeros(needed - len(buffer), dtype=np.float32)])
+        frames = np.lib.stride_tricks.sliding_window_view(buffer[start:needed], self.frame)[::self.down]
+        skip = self.samples_out - first_cycle * self.up
+        out = (frames @ self.matrix).ravel()[skip:skip + last + 1 - self.samples_out]
+        self.samples_out = last + 1
+
+        # Keep what the cycle of the next output needs
+        oldest = (self.samples_out // self.up) * self.down + self.offset
+        drop = max(0, oldest - self._base)
+        self._buffer = self._buffer[drop:]
+        self._base += drop
+        return out
+
+    def flush(self):
+        """Outputs still pending at the end of the signal, then reset for a new one"""
+        total = -(-self.samples_in * self.up // self.down)
+        pending = total - self.samples_out
+        out = np.zeros(0, dtype=np.float32)
+        if pending > 0:
+            zeros = -(-(self.half_len + self.down * pending) // self.up) + 1
+            out = self.process(np.zeros(zeros, dtype=np.float32))[:pending]
+        self.reset()
+        return out
+
+    def resample(self, x):
+        """Whole signal at once (equal to scipy.signal.resample_poly with zero padding)"""
+        self.reset()
+        return np.concatenate([self.process(x), self.flush()])
+
+class StreamingSegmenter():
+    """Incremental version of segment_cough for audio that arrives in PCM periods
+
+    Every sample goes through the hysteresis comparator exactly once. The comparator state
+    (cough in progress, below-threshold counter) is kept between calls, so coughs are neither
+    split nor duplicated at period boundaries. Finished coughs are returned by process() as soon
+    as their end padding has been scanned.
+
+    The thresholds are exactly those segment_cough computes (cough_thresholds), over the last
+    stats_duration seconds of audio. They are recomputed every threshold_interval seconds, by
+    default as often as the windowed path recomputed them for its 4 s windows every 3.7 s, so the
+    percentiles cost the same as before. Periods are collected and scanned scan_duration seconds
+    at a time, which delays a finished cough by at most that much.
+
+    Inputs:
+    *fs (float): sampling frequency in Hz
+    *cough_padding, min_cough_len, adaptive_method, th_l_multiplier, th_h_multiplier: same as segment_cough
+    *stats_duration (float): seconds of past audio the adaptive thresholds are computed over
+    *threshold_interval (float): seconds between threshold updates
+    *scan_duration (float): seconds of audio scanned at once
+    *max_cough_len (float): a cough still in progress after this many seconds is closed, like segment_cough does at the end of its window"""
+
+    def __init__(self, fs, cough_padding=0.2, min_cough_len=0.2, adaptive_method='percentile', th_l_multiplier=0.1, th_h_multiplier=2,
+                 stats_duration=4.0, threshold_interval=3.7, scan_duration=0.1, max_cough_len=4.0):
+        if adaptive_method not in ('percentile', 'statistics', 'combination', 'default'):
+            raise ValueError(f"Unknown adaptive_method: {adaptive_method}")
+        self.fs = fs
+        self.adaptive_method = adaptive_method
+        self.th_l_multiplier = th_l_multiplier
+        self.th_h_multiplier = th_h_multiplier
+        self.padding = round(fs*cough_padding)
+        self.min_cough_samples = round(fs*min_cough_len)
+        self.tolerance = round(0.01*fs)
+        self.stats_samples = int(stats_duration*fs)
+        self.threshold_samples = max(int(threshold_interval*fs), 1)
+        self.scan_samples = max(int(scan_duration*fs), 1)
+        self.max_cough_samples = max(int(max_cough_len*fs), 1)
+
+        # Audio history: the threshold window, or the longest cough including its padding and the
+        # block not scanned yet, plus a second of slack
+        self._history = RingBuffer(max(self.stats_samples, self.max_cough_samples + 2*self.padding) + self.scan_samples + int(fs))
+        self.reset()
+
+    def reset(self):
+        """Forget all audio, thresholds and comparator state, e.g. after a gap in the stream"""
+        self.samples_seen = 0
+        self.samples_scanned = 0
+        self._history.clear()
+        self._thresholds = None
+        self._thresholds_at = 0
+
+        self.cough_in_progress = False
+        self.cough_start = 0
+        self.below_th_counter = 0
+        self._pending = []
+
+    @property
+    def ready(self):
+        """True once a full stats_duration of audio has been seen and thresholds are meaningful"""
+        return self.samples_seen >= self.stats_samples
+
+    def thresholds(self):
+        """(seg_th_l, seg_th_h) of the last stats_duration seconds, as segment_cough computes them"""
+        return cough_thresholds(self._history.read_latest(self.stats_samples), self.adaptive_method,
+                                self.th_l_multiplier, self.th_h_multiplier)
+
+    def _close_cough(self, cough_end):
+        cough_start = self.cough_start
+        self.cough_in_progress = False
+        if (cough_end+1-cough_start-2*self.padding>self.min_cough_samples):
+            self._pending.append((cough_start, cough_end))
+
+    def process(self, x):
+        """Feed one period of mono audio and return the coughs that finished, as a list of (start_sample, np.array)"""
+        x = np.asarray(x, dtype=np.float32)
+        n = len(x)
+        if n == 0:
+            return []
+        self._history.write(x)
+        self.samples_seen += n
+
+        if not self.ready:
+            self.samples_scanned = self.samples_seen
+        elif self.samples_seen - self.samples_scanned >= self.scan_samples:
+            if self._thresholds is None or self.samples_seen - self._thresholds_at >= self.threshold_samples:
+                self._thresholds = self.thresholds()
+                self._thresholds_at = self.samples_seen
+            power = self._history.read_latest(self.samples_seen - self.samples_scanned)**2
+            self._scan(power, self.samples_scanned, *self._thresholds)
+            self.samples_scanned = self.samples_seen
+
+            if self.cough_in_progress and self.samples_scanned - self.cough_start > self.max_cough_samples:
+                self._close_cough(self.samples_scanned - 1)
+
+        finished = []
+        remaining = []
+        for cough_start, cough_end in self._pending:
+            if cough_end < self.samples_seen:
+                segment = self._history.read_latest(self.samples_seen - cough_start)
+                finished.append((cough_start, segment[:len(segment) - (self.samples_seen - 1 - cough_end)]))
+            else:
+                remaining.append((cough_start, cough_end))
+        self._pending = remaining
+        return finished
+
+    def _scan(self, power, base, seg_th_l, seg_th_h):
+        # Same comparator as segment_cough, on block-local indices with the counter carried over
+        n = len(power)
+        onsets = np.flatnonzero(power > seg_th_h)
+        if not self.cough_in_progress and len(onsets) == 0:
+            # Quiet period, nothing can start or end
+            return
+        not_below = np.flatnonzero(~(power < seg_th_l))
+        tolerance = self.tolerance
+
+        pos = 0
+        while pos < n:
+            if not self.cough_in_progress:
+                k = np.searchsorted(onsets, pos)
+                if k == len(onsets):
+                    return
+                onset = base + onsets[k]
+                self.cough_start = onset-self.padding if (onset-self.padding >= 0) else 0
+                self.cough_in_progress = True
+                pos = onsets[k] + 1
+                continue
+
+            k = np.searchsorted(not_below, pos)
+            reset = not_below[k] if k < len(not_below) else n
+            offset = pos + max(tolerance - self.below_th_counter, 0)
+            if offset < reset:
+                self.below_th_counter += offset - pos + 1
+            elif reset == n:
+                self.below_th_counter += n - pos
+                return
+            else:
+                # First run below seg_th_l after the reset that is longer than the tolerance,
+                # runs lie between consecutive samples that are not below it
+                bounds = np.append(not_below[k:], n)
+                long_runs = np.flatnonzero(np.diff(bounds) > tolerance + 1)
+                if len(long_runs) == 0:
+                    # Carry the trailing below-threshold run over to the next block
+                    self.below_th_counter = n - 1 - not_below[-1]
+                    return
+                offset = bounds[long_runs[0]] + 1 + tolerance
+                self.below_th_counter = tolerance + 1
+
+            self._close_cough(base + offset + self.padding)
+            pos = offset + 1
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Waveform and status display of the analyzer page"""
+
+import time, logging
+import tkinter as tk
+from collections import deque
+
+import numpy as np
+
+
+class FrameTimer():
+    """Time spent per rendered frame, summarised in the log every report_interval seconds"""
+
+    def __init__(self, name, window=512, report_interval=60.0):
+        self.name = name
+        self.report_interval = report_interval
+        self.times = deque(maxlen=window)
+        self.frames = 0
+        self.skipped = 0
+        self._last_report = time.monotonic()
+
+    def record(self, seconds):
+        self.times.append(seconds)
+        self.frames += 1
+        if self.report_interval and time.monotonic() - self._last_report >= self.report_interval:
+            self.report()
+
+    def stats(self):
+        if not self.times:
+            return {'frames': self.frames, 'skipped': self.skipped}
+        ms = np.asarray(self.times) * 1e3
+        return {'frames': self.frames, 'skipped': self.skipped, 'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95)),
+                'max_ms': float(ms.max())}
+
+    def report(self):
+        self._last_report = time.monotonic()
+        s = self.stats()
+        if 'mean_ms' in s:
+            logging.info(f"[INFO] {self.name} frames: {s['frames']} drawn, {s['skipped']} skipped, "
+                         f"mean {s['mean_ms']:.2f} ms, p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, max {s['max_ms']:.2f} ms")
+
+
+class WaveformView():
+    """Status bar and waveform line drawn on native Tk canvases
+
+    The status bar is one rectangle that is only recoloured, and the waveform one polyline whose
+    coordinates are replaced in place, so a frame costs a coords() call instead of rasterising a
+    figure. set_status() may be called from any thread: it only stores the colour, which the
+    frame callback on the Tk thread applies. A frame is drawn every interval ms while started,
+    and skipped when neither the colour nor the waveform points changed.
+
+    Frame times include the canvas redraw (update_idletasks), for comparison with
+    MatplotlibWaveformView."""
+
+    def __init__(self, master, values, length, ylim=0.2, width=480, status_height=96, wave_height=240,
+                 color='cyan', status='blue', report_interval=60.0):
+        self.master = master
+        self.values = values
+        self.length = length
+        self.ylim = ylim
+        self.timer = FrameTimer("Waveform canvas", report_interval=report_interval)
+
+        self.status_canvas = tk.Canvas(master, width=width, height=status_height, bg='black', highlightthickness=0)
+        self.status_rect = self.status_canvas.create_rectangle(0, 0, width, status_height, fill=status, outline='black')
+        self.status_canvas.pack(side=tk.BOTTOM)
+
+        self.wave_canvas = tk.Canvas(master, width=width, height=wave_height, bg='black', highlightthickness=0)
+        for i in range(1, 8):
+            x = width * i / 8
+            self.wave_canvas.create_line(x, 0, x, wave_height, fill='#333333')
+        for i in range(1, 4):
+            y = wave_height * i / 4
+            self.wave_canvas.create_line(0, y, width, y, fill='#333333')
+        self.wave_canvas.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
+
+        # Interleaved x, y coordinates, x fixed, y rewritten every frame
+        self._coords = np.empty(2 * length, dtype=np.float64)
+        self._coords[0::2] = np.linspace(0, width - 1, length)
+        self._points = np.zeros(length, dtype=np.float32)
+        self._half = wave_height / 2
+        self._scale = -self._half / ylim
+        self._update_y(self._points)
+        self.wave_line = self.wave_canvas.create_line(*self._coords.tolist(), fill=color, width=1)
+
+        self.status = status
+        self._drawn_status = status
+        self._after_id = None
+        self.interval = 200
+
+    def set_status(self, color):
+        self.status = color
+
+    def _update_y(self, points):
+        y = self._coords[1::2]
+        np.multiply(points, self._scale, out=y)
+        np.add(y, self._half, out=y)
+        np.clip(y, 0, 2 * self._half, out=y)
+
+    def draw(self):
+        """Render one frame, returns False if nothing changed"""
+        start = time.perf_counter()
+        status = self.status
+        points = self.values()
+        waveform_changed = not np.array_equal(points, self._points)
+        if status == self._drawn_status and not waveform_changed:
+            self.timer.skipped += 1
+            return False
+        if status != self._drawn_status:
+            self.status_canvas.itemconfigure(self.status_rect, fill=status)
+            self._drawn_status = status
+        if waveform_changed:
+            self._points[:] = points
+            self._update_y(self._points)
+            self.wave_canvas.coords(self.wave_line, self._coords.tolist())
+        self.master.update_idletasks()
+        self.timer.record(time.perf_counter() - start)
+        return True
+
+    def start(self, interval=200):
+        self.interval = interval
+        if self._after_id is None:
+            self._after_id = self.master.after(self.interval, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.master.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        try:
+            self.draw()
+        except Exception as e:
+            logging.error(f"[ERROR] Waveform frame: {e}")
+        self._after_id = self.master.after(self.interval, self._tick)
+
+
+class MatplotlibWaveformView():
+    """The original two-figure matplotlib display with the WaveformView interface
+
+    Kept for comparing frame times on the device (WAVEFORM_RENDERER = "matplotlib"). Every frame
+    redraws the whole waveform figure, a status change redraws the status figure too."""
+
+    def __init__(self, master, values, length, ylim=0.2, color='cyan', status='blue', report_interval=60.0):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        import matplotlib.patches as patches
+        from matplotlib.figure import Figure
+        from matplotlib import style
+
+        self.master = master
+        self.values = values
+        self.timer = FrameTimer("Waveform matplotlib", report_interval=report_interval)
+
+        self.fig = Figure(figsize=(5, 1), dpi=96, facecolor='black')
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_facecolor('black')
+        self.ax.set_ylim(-1, 1)
+        self.ax.set_xlim(-1, 1)
+        self.patch_plot = self.ax.add_patch(patches.Rectangle((-1.0, 0.0), 2.0, 1.0, linewidth=1, edgecolor='black', facecolor=status))
+        style.use('ggplot')
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.draw()
+        self.canvas.get_tk_widget().pack(side=tk.BOTTOM)
+
+        self.fig2 = Figure(figsize=(5, 2.5), dpi=96, facecolor='black')
+        self.ax2 = self.fig2.add_subplot(111)
+        self.ax2.set_facecolor('black')
+        self.ax2.get_xaxis().set_visible(False)
+        self.ax2.get_yaxis().set_visible(False)
+        self.ax2.grid(True, which='both', ls='-', color='#333333')
+        self.ax2.set_ylim(-ylim, ylim)
+        self.ax2.set_xlim(0, length - 1)
+        self.line2, = self.ax2.plot(np.arange(length), self.values(), color=color, linewidth=1)
+        self.canvas2 = FigureCanvasTkAgg(self.fig2, master=master)
+        self.canvas2.draw()
+        self.canvas2.get_tk_widget().pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
+
+        self.status = status
+        self._drawn_status = status
+        self._after_id = None
+        self.interval = 200
+
+    def set_status(self, color):
+        self.status = color
+
+    def draw(self):
+        start = time.perf_counter()
+        status = self.status
+        if status != self._drawn_status:
+            self.patch_plot.set_facecolor(status)
+            self.canvas.draw()
+            self._drawn_status = status
+        self.line2.set_ydata(self.values())
+        self.canvas2.draw()
+        self.master.update_idletasks()
+        self.timer.record(time.perf_counter() - start)
+        return True
+
+    def start(self, interval=200):
+        self.interval = interval
+        if self._after_id is None:
+            self._after_id = self.master.after(self.interval, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.master.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        try:
+            self.draw()
+        except Exception as e:
+            logging.error(f"[ERROR] Waveform frame: {e}")
+        self._after_id = self.master.after(self.interval, self._tick)
+
+
+def create_waveform_view(renderer, master, values, length, **kwargs):
+    """WaveformView for "canvas" (default), MatplotlibWaveformView for "matplotlib" """
+    if renderer == 'matplotlib':
+        return MatplotlibWaveformView(master, values, length, **kwargs)
+    if renderer in (None, 'canvas'):
+        return WaveformView(master, values, length, **kwargs)
+    raise ValueError(f"Unknown waveform renderer: {renderer}")
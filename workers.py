@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bounded worker pool for analysis and save jobs"""
+
+import time, logging, threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread
+
+
+class AnalysisExecutor():
+    """Fixed set of worker threads with a bounded job queue
+
+    Replaces a new Thread per job: at most `workers` jobs run at once and at most `maxsize` wait.
+    maxsize=None never drops anything, for jobs that must not be lost (saving a recording).
+    When a bounded queue is full the backpressure policy decides what gives way:
+    *'drop_oldest': the oldest waiting job is discarded
+    *'coalesce': like drop_oldest, and a job submitted with the same key as a waiting one replaces it
+     (e.g. only the newest analysis window is worth running)
+
+    CPU-bound parts of a job can be sent to a process pool with run_cpu() so they do not hold the
+    GIL of the GUI process; without use_processes run_cpu() calls the function directly."""
+
+    POLICIES = ('drop_oldest', 'coalesce')
+
+    def __init__(self, name, workers=1, maxsize=8, policy='drop_oldest', use_processes=False):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self._pending = OrderedDict()
+        self._lock = threading.Condition()
+        self._seq = 0
+        self._running = True
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.active = 0
+        self.max_depth = 0
+        self.busy_time = 0.0
+
+        # spawn: forking a process that runs Tk and several threads is not safe
+        self._process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) if use_processes else None
+        self._threads = [Thread(target=self._worker, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        """Queue fn(*args, **kwargs), returns False if the executor is shut down"""
+        with self._lock:
+            if not self._running:
+                return False
+            self.submitted += 1
+            if self.policy == 'coalesce' and key is not None and key in self._pending:
+                del self._pending[key]
+                self.coalesced += 1
+            if self.maxsize is not None and len(self._pending) >= self.maxsize:
+                _, (dropped_fn, _, _) = self._pending.popitem(last=False)
+                self.dropped += 1
+                logging.warning(f"[WARNING] {self.name} queue full, dropped {getattr(dropped_fn, '__name__', dropped_fn)}")
+            if key is None or self.policy != 'coalesce':
+                self._seq += 1
+                key = ('job', self._seq)
+            self._pending[key] = (fn, args, kwargs)
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._lock.notify()
+        return True
+
+    def run_cpu(self, fn, *args, **kwargs):
+        """Run fn in the process pool when enabled, fn and its arguments must be picklable"""
+        if self._process_pool is None:
+            return fn(*args, **kwargs)
+        return self._process_pool.submit(fn, *args, **kwargs).result()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._pending or not self._running)
+                if not self._pending:
+                    return
+                _, (fn, args, kwargs) = self._pending.popitem(last=False)
+                self.active += 1
+
+            start = time.perf_counter()
+            ok = False
+            try:
+                fn(*args, **kwargs)
+                ok = True
+            except Exception as e:
+                logging.error(f"[ERROR] {self.name} job {getattr(fn, '__name__', fn)} failed: {e}")
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.busy_time += time.perf_counter() - start
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': len(self._pending),
+                'max_depth': self.max_depth,
+                'active': self.active,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'busy_time': round(self.busy_time, 3),
+            }
+
+    def shutdown(self, wait=True, cancel_pending=False, timeout=None):
+        """Stop accepting jobs, finish (or cancel) the queued ones and stop the workers"""
+        with self._lock:
+            self._running = False
+            if cancel_pending:
+                self.dropped += len(self._pending)
+                self._pending.clear()
+            self._lock.notify_all()
+        if wait:
+            deadline = None if timeout is None else time.time() + timeout
+            for t in self._threads:
+                t.join(None if deadline is None else max(0.0, deadline - time.time()))
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=cancel_pending)
+        logging.info(f"[INFO] {self.name} executor stopped: {self.stats()}")